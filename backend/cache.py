@@ -0,0 +1,89 @@
+import threading
+from datetime import timedelta
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class TenantCache:
+    """
+    Process-local cache of derived aggregates, keyed per tenant.
+    Engines store their state here and decide themselves when an entry is stale
+    (watermarks, versions or explicit invalidation after writes).
+    """
+
+    def __init__(self):
+        self._entries: Dict[Tuple[str, Hashable], Any] = {}
+        self._lock = threading.RLock()
+
+    def get(self, account_id: str, key: Hashable = None) -> Optional[Any]:
+        return self._entries.get((account_id, key))
+
+    def set(self, account_id: str, key: Hashable, value: Any) -> Any:
+        with self._lock:
+            self._entries[(account_id, key)] = value
+        return value
+
+    def get_or_build(self, account_id: str, key: Hashable, builder: Callable[[], Any]) -> Any:
+        entry = self._entries.get((account_id, key))
+        if entry is not None:
+            return entry
+        with self._lock:
+            entry = self._entries.get((account_id, key))
+            if entry is None:
+                entry = builder()
+                self._entries[(account_id, key)] = entry
+            return entry
+
+    def invalidate(self, account_id: str, key: Hashable = None):
+        """Drops one entry, or every entry of the tenant when key is None."""
+        with self._lock:
+            if key is not None:
+                self._entries.pop((account_id, key), None)
+                return
+            for k in [k for k in self._entries if k[0] == account_id]:
+                del self._entries[k]
+
+    def lock(self):
+        return self._lock
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Rows may commit with a timestamp slightly behind the newest one already folded in
+# (long-running transactions, backdated writes), so refreshes re-read this window.
+WATERMARK_OVERLAP = timedelta(minutes=10)
+
+
+class Watermark:
+    """
+    Newest row timestamp folded into an incremental aggregate, plus the (id, timestamp)
+    pairs folded in during the trailing overlap window. Refreshes re-read
+    `timestamp >= since()`, so late commits inside the window are still picked up
+    and rows already counted are skipped.
+    """
+
+    def __init__(self, ts=None, seen=(), overlap: timedelta = WATERMARK_OVERLAP):
+        self.ts = ts
+        self.overlap = overlap
+        self.seen = set(seen)
+
+    def since(self):
+        """Lower bound for the next refresh query; forgets rows that fell out of the window."""
+        if self.ts is None:
+            return None
+        cutoff = self.ts - self.overlap
+        self.seen = {k for k in self.seen if k[1] >= cutoff}
+        return cutoff
+
+    def accepts(self, ts, row_id) -> bool:
+        if ts is None:
+            return False
+        return (row_id, ts) not in self.seen and (self.ts is None or ts >= self.ts - self.overlap)
+
+    def advance(self, ts, row_id):
+        if ts is None:
+            return
+        self.seen.add((row_id, ts))
+        if self.ts is None or ts > self.ts:
+            self.ts = ts
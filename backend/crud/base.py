@@ -12,6 +12,28 @@ def generate_unique_id(length=16, numeric_only=False, prefix=''):
     random_str = ''.join(secrets.choice(chars) for _ in range(gen_len))
     return f"{prefix}{random_str}"
 
+# Catalog version: bumped whenever product names or science tags change through the API,
+# so cached matchers/rule indexes can tell catalog edits apart from stock movements.
+CATALOG_VERSION_KEY = "catalog_version"
+
+def get_catalog_version(db: Session, account_id: str) -> int:
+    value = db.query(core.Setting.value).filter(
+        core.Setting.account_id == account_id,
+        core.Setting.key == CATALOG_VERSION_KEY
+    ).scalar()
+    return int(value) if value else 0
+
+def bump_catalog_version(db: Session, account_id: str):
+    # Caller commits
+    setting = db.query(core.Setting).filter(
+        core.Setting.account_id == account_id,
+        core.Setting.key == CATALOG_VERSION_KEY
+    ).first()
+    if setting:
+        setting.value = str(int(setting.value or 0) + 1)
+    else:
+        db.add(core.Setting(account_id=account_id, key=CATALOG_VERSION_KEY, value="1"))
+
 # Product CRUD
 def get_product(db: Session, product_id: str, account_id: str):
     return db.query(core.Product).filter(core.Product.id == product_id, core.Product.account_id == account_id).first()
@@ -27,6 +49,7 @@ def create_product(db: Session, product: schemas.ProductCreate):
     if not db_product.id:
         db_product.id = generate_unique_id(16)
     db.add(db_product)
+    bump_catalog_version(db, db_product.account_id)
     db.commit()
     db.refresh(db_product)
     return db_product
@@ -38,6 +61,8 @@ def update_product(db: Session, product_id: str, account_id: str, product_update
         update_data = product_update.model_dump(exclude_unset=True)
         for key, value in update_data.items():
             setattr(db_product, key, value)
+        if "name" in update_data or "science_tags" in update_data:
+            bump_catalog_version(db, account_id)
         db.commit()
         db.refresh(db_product)
     return db_product
@@ -46,6 +71,7 @@ def delete_product(db: Session, product_id: str, account_id: str):
     db_product = get_product(db, product_id, account_id)
     if db_product:
         db.delete(db_product)
+        bump_catalog_version(db, account_id)
         db.commit()
     return db_product
 
@@ -1,10 +1,28 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, and_, or_, insert
 from typing import List, Optional
-from datetime import datetime
+from datetime import datetime, timedelta
 from backend.models import core, schemas
 from backend.crud.base import generate_unique_id
-from sqlalchemy import func
+from backend.engines import geo as geo_engine
+from backend.engines import catchment as catchment_engine
+from backend.engines import velocity as velocity_engine
+from backend.engines import shelf as shelf_sense
+from backend.engines import voice as voice_engine
+from backend.engines import cycle_count
+from backend.engines import voice_log
+from backend.engines import demand_cube
+from backend.engines import sales_dates
+from backend.engines import forecast as forecast_engine
+from backend.engines import backtest
+from backend.engines import roster
+from backend.engines import shifts as shifts_engine
+from backend.engines import markdown
+from backend.engines import expiry
+from backend.engines import receiving
+from backend.engines import scorecards
+from backend.engines import replenishment
+from backend.engines import stockswap
 
 # --- Settings ---
 def get_settings(db: Session, account_id: str):
@@ -16,6 +34,7 @@ def update_setting(db: Session, setting: schemas.SettingCreate):
         core.Setting.key == setting.key
     ).first()
     
+    previous = db_setting.value if db_setting else None
     if db_setting:
         db_setting.value = setting.value
     else:
@@ -27,36 +46,28 @@ def update_setting(db: Session, setting: schemas.SettingCreate):
         db.add(db_setting)
     db.commit()
     db.refresh(db_setting)
+
+    if setting.key == sales_dates.TIMEZONE_SETTING_KEY and setting.value != previous:
+        # Business days move with the timezone: re-derive them and drop day-bucketed aggregates
+        sales_dates.recompute(db, setting.account_id)
+        velocity_engine.invalidate(setting.account_id)
+        demand_cube.invalidate(setting.account_id)
+        forecast_engine.invalidate(setting.account_id)
     return db_setting
 
 # --- Analytics ---
 def analyze_demand(db: Session, account_id: str, weather: str, event: str):
-    # 1. Find dates with matching context
-    matching_dates = db.query(core.DailyContext.date).filter(
-        core.DailyContext.account_id == account_id,
-        core.DailyContext.weather_tag == weather,
-        core.DailyContext.event_tag == event
-    ).all()
-    
-    date_list = [d[0] for d in matching_dates]
-    
-    if not date_list:
-        return []
-        
-    # 2. Sum sales for those dates
-    # JOIN Transaction -> TransactionItem
-    # Filter where Transaction.timestamp.date() IN date_list
-    # Note: timestamp is DateTime, we cast to Date
-    
-    results = db.query(
-        core.TransactionItem.product_name,
-        func.sum(core.TransactionItem.quantity).label("total_qty")
-    ).join(core.Transaction).filter(
-        core.Transaction.account_id == account_id,
-        func.date(core.Transaction.timestamp).in_(date_list)
-    ).group_by(core.TransactionItem.product_name).order_by(func.sum(core.TransactionItem.quantity).desc()).limit(5).all()
-    
-    return [{"product_name": r[0], "total_qty": r[1]} for r in results]
+    # Lookup in the tenant's precomputed (weather, event) -> product demand cube
+    return demand_cube.predict(db, account_id, weather, event)
+
+def get_demand_forecast(db: Session, account_id: str, days: int = 7, product_id: Optional[str] = None,
+                        skip: int = 0, limit: int = 100):
+    return forecast_engine.forecast(db, account_id, days, product_id, skip, limit)
+
+def run_forecast_backtest(db: Session, account_id: str, horizon: int = 7, folds: int = 4,
+                          models: Optional[List[str]] = None):
+    # Raises ValueError for unknown model names
+    return backtest.run(db, account_id, horizon, folds, models=models)
 
 # --- VendorTrust CRUD ---
 def get_suppliers(db: Session, account_id: str):
@@ -84,14 +95,40 @@ def create_purchase_order(db: Session, po: schemas.PurchaseOrderCreate):
         id=generate_unique_id(),
         account_id=po.account_id,
         supplier_id=po.supplier_id,
-        order_date=po.order_date,
+        order_date=po.order_date or sales_dates.today(db, po.account_id), # lead times are measured from it
         expected_date=po.expected_date,
         notes=po.notes
     )
     db.add(db_po)
     db.commit()
     db.refresh(db_po)
-    return db_po
+    result = schemas.PurchaseOrder.model_validate(db_po)
+    result.risk_warning = scorecards.risk_warning(db, po.account_id, po.supplier_id)
+    return result
+
+def get_supplier_scorecards(db: Session, account_id: str):
+    return scorecards.get_scorecards(db, account_id)
+
+# --- Replenishment ---
+def get_replenishment_plan(db: Session, account_id: str, supplier_id: Optional[str] = None):
+    suggestions = replenishment.plan(db, account_id)
+    if supplier_id is not None:
+        suggestions = [s for s in suggestions if s["supplier_id"] == supplier_id]
+    return suggestions
+
+def run_replenishment(db: Session, account_id: str):
+    return replenishment.run(db, account_id)
+
+def get_draft_purchase_orders(db: Session, account_id: str):
+    return replenishment.get_drafts(db, account_id)
+
+def place_purchase_order(db: Session, account_id: str, po_id: str):
+    # Raises ValueError unless the PO is a draft
+    return replenishment.place(db, account_id, po_id)
+
+def receive_purchase_order(db: Session, account_id: str, po_id: str, receipt: schemas.GoodsReceipt):
+    # Raises receiving.ReceiptError (a ValueError); None when the PO doesn't exist
+    return receiving.receive(db, account_id, po_id, receipt.lines, receipt.received_date, receipt.quality_rating)
 
 # --- ShiftSmart CRUD ---
 def get_staff(db: Session, account_id: str):
@@ -113,20 +150,102 @@ def create_staff(db: Session, staff: schemas.StaffCreate):
 def get_shifts(db: Session, staff_id: str):
     return db.query(core.Shift).filter(core.Shift.staff_id == staff_id).all()
 
-def create_shift(db: Session, shift: schemas.ShiftBase):
-    db_shift = core.Shift(
-        id=generate_unique_id(),
-        staff_id=shift.staff_id,
-        date=shift.date,
-        slot=shift.slot
-    )
-    db.add(db_shift)
-    db.commit()
-    db.refresh(db_shift)
-    return db_shift
+def create_shift(db: Session, account_id: str, shift: schemas.ShiftBase):
+    return create_shifts(db, account_id, [shift])[0]
+
+def list_shifts(db: Session, account_id: str, start: datetime.date, end: datetime.date):
+    rows = db.query(core.Shift, core.Staff.name, core.Staff.role, core.Staff.hourly_rate).join(
+        core.Staff, core.Staff.id == core.Shift.staff_id
+    ).filter(
+        core.Staff.account_id == account_id,
+        core.Shift.date.between(start, end)
+    ).order_by(core.Shift.date, core.Shift.slot, core.Staff.name).all()
+    return _shift_views(rows)
+
+def _shift_views(rows):
+    return [schemas.ShiftView(
+        id=s.id, staff_id=s.staff_id, date=s.date, slot=s.slot, start_time=s.start_time, end_time=s.end_time,
+        created_at=s.created_at, staff_name=name, role=role, hourly_rate=rate
+    ) for s, name, role, rate in rows]
+
+def get_on_duty(db: Session, account_id: str, at: datetime):
+    return _shift_views(shifts_engine.on_duty(db, account_id, at))
+
+def _check_staff(db: Session, account_id: str, shifts: List[schemas.ShiftBase]):
+    # Locks the staff rows until commit, so concurrent bookings for them queue up behind the overlap check
+    ids = {s.staff_id for s in shifts}
+    known = shifts_engine.lock_staff(db, account_id, ids)
+    unknown = ids - known
+    if unknown:
+        raise ValueError(f"Unknown staff: {', '.join(sorted(unknown))}")
+
+def _insert_shifts(db: Session, account_id: str, shifts: List[schemas.ShiftBase]) -> List[dict]:
+    # Overlap-checked, then one multi-row INSERT; rows are returned as written so the response needs no reload
+    rows = shifts_engine.resolve(db, account_id, shifts)
+    shifts_engine.check(db, rows)
+    if rows:
+        db.execute(insert(core.Shift), rows)
+    return rows
+
+def create_shifts(db: Session, account_id: str, shifts: List[schemas.ShiftBase]):
+    # All or nothing; raises ValueError for staff outside the account or bad times,
+    # shifts_engine.ShiftConflict (a ValueError) for double bookings
+    with shifts_engine.booking():
+        try:
+            _check_staff(db, account_id, shifts)
+            rows = _insert_shifts(db, account_id, shifts)
+        except ValueError:
+            db.rollback()
+            raise
+        db.commit()
+    return rows
+
+def replace_week(db: Session, account_id: str, start: datetime.date, shifts: List[schemas.ShiftBase]):
+    end = start + timedelta(days=6)
+    outside = [s for s in shifts if not start <= s.date <= end]
+    if outside:
+        raise ValueError("All shifts must fall within the week being replaced")
+    with shifts_engine.booking():
+        try:
+            _check_staff(db, account_id, shifts)
+            account_staff = db.query(core.Staff.id).filter(core.Staff.account_id == account_id)
+            db.query(core.Shift).filter(
+                core.Shift.date.between(start, end),
+                core.Shift.staff_id.in_(account_staff.scalar_subquery())
+            ).delete(synchronize_session=False)
+            rows = _insert_shifts(db, account_id, shifts)
+        except ValueError:
+            db.rollback()
+            raise
+        db.commit()
+    return rows
+
+def build_roster(db: Session, account_id: str, request: schemas.RosterRequest):
+    if not request.apply:
+        return roster.build_roster(db, account_id, request.start_date, request.days, request.max_hours)
+    # Applying books through the same guarded path as create_shifts: the plan is solved
+    # against the shifts as they stand once the tenant's staff rows are locked
+    with shifts_engine.booking():
+        try:
+            staff_ids = [r[0] for r in db.query(core.Staff.id).filter(core.Staff.account_id == account_id).all()]
+            shifts_engine.lock_staff(db, account_id, staff_ids)
+            plan = roster.build_roster(db, account_id, request.start_date, request.days, request.max_hours)
+            _insert_shifts(db, account_id, [schemas.ShiftBase(**s) for s in roster.proposed_shifts(plan)])
+        except ValueError:
+            db.rollback()
+            raise
+        db.commit()
+    return dict(plan, applied=True)
 
 # --- FreshFlow CRUD ---
 def create_batch(db: Session, batch: schemas.ProductBatchCreate):
+    product = db.query(core.Product).filter(
+        core.Product.id == batch.product_id,
+        core.Product.account_id == batch.account_id
+    ).first()
+    if product is None:
+        raise ValueError(f"Unknown product {batch.product_id}")
+
     db_batch = core.ProductBatch(
         id=generate_unique_id(),
         account_id=batch.account_id,
@@ -139,17 +258,41 @@ def create_batch(db: Session, batch: schemas.ProductBatchCreate):
     db.add(db_batch)
     
     # Update Product Stock
-    product = db.query(core.Product).filter(core.Product.id == batch.product_id).first()
-    if product:
-        product.stock_quantity += batch.quantity
+    product.stock_quantity += batch.quantity
         
     db.commit()
+    expiry.sweep(db, batch.account_id, batch_ids=[db_batch.id])
     db.refresh(db_batch)
     return db_batch
 
 def get_batches(db: Session, account_id: str):
     return db.query(core.ProductBatch).filter(core.ProductBatch.account_id == account_id).all()
 
+def get_markdowns(db: Session, account_id: str, lookahead: Optional[int] = None):
+    return markdown.get_markdowns(db, account_id, lookahead)
+
+def get_expiry_calendar(db: Session, account_id: str, tier: Optional[str] = None, skip: int = 0, limit: int = 100):
+    if tier is not None and tier not in expiry.RANK:
+        raise ValueError(f"Unknown tier '{tier}'. Use one of: {', '.join(expiry.RANK)}")
+    return expiry.get_calendar(db, account_id, tier, skip, limit)
+
+def get_expiry_alerts(db: Session, account_id: str, pending_only: bool = True, skip: int = 0, limit: int = 100):
+    rows = expiry.get_alerts(db, account_id, pending_only, skip, limit)
+    return [schemas.ExpiryAlert(
+        id=a.id,
+        batch_id=a.batch_id,
+        product_id=a.product_id,
+        product_name=name or "Unknown",
+        tier=a.tier,
+        expiry_date=a.expiry_date,
+        quantity=a.quantity,
+        created_at=a.created_at,
+        acknowledged_at=a.acknowledged_at
+    ) for a, name in rows]
+
+def acknowledge_expiry_alerts(db: Session, account_id: str, alert_ids: List[str]):
+    return {"acknowledged": expiry.acknowledge(db, account_id, alert_ids)}
+
 # --- Misc CRUD ---
 def set_daily_context(db: Session, ctx: schemas.DailyContextCreate):
     db_ctx = db.query(core.DailyContext).filter(
@@ -172,6 +315,7 @@ def set_daily_context(db: Session, ctx: schemas.DailyContextCreate):
         db.add(db_ctx)
     db.commit()
     db.refresh(db_ctx)
+    demand_cube.context_changed(db, ctx.account_id, db_ctx.date, db_ctx.weather_tag, db_ctx.event_tag)
     return db_ctx
 
 def get_daily_context(db: Session, account_id: str, date: datetime.date):
@@ -185,6 +329,12 @@ def get_b2b_deals(db: Session, account_id: str):
     return db.query(core.B2BDeal).filter(core.B2BDeal.account_id == account_id).all()
 
 def create_b2b_deal(db: Session, deal: schemas.B2BDealCreate):
+    kind = deal.kind or stockswap.OFFER
+    if kind not in stockswap.KINDS:
+        raise ValueError(f"kind must be one of: {', '.join(stockswap.KINDS)}")
+    lat, lng = deal.latitude, deal.longitude
+    if lat is None or lng is None:
+        lat, lng = stockswap.store_location(db, deal.account_id)
     db_deal = core.B2BDeal(
         id=generate_unique_id(),
         account_id=deal.account_id,
@@ -192,13 +342,31 @@ def create_b2b_deal(db: Session, deal: schemas.B2BDealCreate):
         product_name=deal.product_name,
         quantity=deal.quantity,
         price_per_unit=deal.price_per_unit,
-        acc_phone=deal.acc_phone
+        acc_phone=deal.acc_phone,
+        kind=kind,
+        category=deal.category,
+        latitude=lat,
+        longitude=lng,
+        status=stockswap.OPEN,
+        updated_at=datetime.utcnow()
     )
     db.add(db_deal)
     db.commit()
     db.refresh(db_deal)
     return db_deal
 
+def close_b2b_deal(db: Session, account_id: str, deal_id: str):
+    return stockswap.close(db, account_id, deal_id)
+
+def search_marketplace(db: Session, account_id: str, query: str, kind: str = stockswap.OFFER, category: Optional[str] = None,
+                       lat: Optional[float] = None, lng: Optional[float] = None,
+                       radius_km: Optional[float] = stockswap.DEFAULT_RADIUS_KM, limit: int = 20):
+    # Raises ValueError for an unknown kind
+    return stockswap.search(db, account_id, query, kind, category, lat, lng, radius_km, limit)
+
+def match_low_stock_offers(db: Session, account_id: str, radius_km: Optional[float] = stockswap.DEFAULT_RADIUS_KM):
+    return stockswap.match_low_stock(db, account_id, radius_km)
+
 # --- CrowdStock ---
 def get_crowd_campaigns(db: Session, account_id: str):
     return db.query(core.CrowdCampaign).filter(core.CrowdCampaign.account_id == account_id).all()
@@ -227,19 +395,73 @@ def vote_crowd_campaign(db: Session, campaign_id: str):
     return camp
 
 # --- VoiceAudit ---
-def get_voice_logs(db: Session, account_id: str):
-    return db.query(core.VoiceLog).filter(core.VoiceLog.account_id == account_id).order_by(core.VoiceLog.created_at.desc()).all()
+def get_voice_logs(db: Session, account_id: str, limit: int = 100,
+                   before: Optional[datetime] = None, before_id: Optional[str] = None):
+    """Newest first, keyset-paged on (created_at, id): pass the last row's values to get the next page."""
+    voice_log.buffer.flush() # read-your-writes for buffered logs
+    query = db.query(core.VoiceLog).filter(core.VoiceLog.account_id == account_id)
+    if before is not None:
+        if before_id is not None:
+            query = query.filter(or_(
+                core.VoiceLog.created_at < before,
+                and_(core.VoiceLog.created_at == before, core.VoiceLog.id < before_id)
+            ))
+        else:
+            query = query.filter(core.VoiceLog.created_at < before)
+    return query.order_by(core.VoiceLog.created_at.desc(), core.VoiceLog.id.desc()).limit(limit).all()
 
 def create_voice_log(db: Session, log: schemas.VoiceLogCreate):
-    db_log = core.VoiceLog(
-        id=generate_unique_id(),
-        account_id=log.account_id,
-        transcript=log.transcript,
+    # Buffered: written with the next batch insert, not in this request's transaction
+    return voice_log.log(
+        db.get_bind(),
+        log.account_id,
+        log.transcript,
         action_extracted=log.action_extracted,
         confidence_score=log.confidence_score
     )
-    db.refresh(db_log)
-    return db_log
+
+def process_voice_commands(db: Session, account_id: str, batch: schemas.VoiceCommandBatch):
+    results = voice_engine.process_commands(db, account_id, batch.transcripts, batch.apply)
+    return [schemas.VoiceCommandResult(transcript=r['original_text'], **r) for r in results]
+
+# Cycle-count sessions raise ValueError (cycle_count.SessionError) when the session is not OPEN
+def _cycle_count_view(db: Session, account_id: str, session: core.CycleCountSession):
+    if session.status == cycle_count.OPEN:
+        lines = cycle_count.preview(db, account_id, session.id)
+    else:
+        lines = cycle_count.get_variances(db, session.id)
+    return schemas.CycleCountSession(
+        id=session.id,
+        status=session.status,
+        created_by=session.created_by,
+        created_at=session.created_at,
+        applied_at=session.applied_at,
+        entries=cycle_count.get_entries(db, session.id),
+        lines=lines
+    )
+
+def create_cycle_count(db: Session, account_id: str, created_by: Optional[str] = None):
+    session = cycle_count.create_session(db, account_id, created_by)
+    return _cycle_count_view(db, account_id, session)
+
+def get_cycle_count(db: Session, account_id: str, session_id: str):
+    session = cycle_count.get_session(db, account_id, session_id)
+    return _cycle_count_view(db, account_id, session) if session else None
+
+def add_cycle_count_commands(db: Session, account_id: str, session_id: str, commands: schemas.CycleCountCommands):
+    if cycle_count.add_commands(db, account_id, session_id, commands.transcripts) is None:
+        return None
+    return get_cycle_count(db, account_id, session_id)
+
+def undo_cycle_count_entry(db: Session, account_id: str, session_id: str, entry_id: Optional[str] = None):
+    if cycle_count.undo(db, account_id, session_id, entry_id) is None:
+        return None
+    return get_cycle_count(db, account_id, session_id)
+
+def apply_cycle_count(db: Session, account_id: str, session_id: str):
+    if cycle_count.apply(db, account_id, session_id) is None:
+        return None
+    return get_cycle_count(db, account_id, session_id)
 
 # --- ChurnGuard ---
 def get_churn_risks(db: Session, account_id: str):
@@ -280,20 +502,6 @@ def get_churn_risks(db: Session, account_id: str):
     return sorted(results, key=lambda x: x.days_since, reverse=True)
 
 # --- GeoViz ---
-CITY_COORDS = {
-    "New York": (40.7128, -74.0060),
-    "Los Angeles": (34.0522, -118.2437),
-    "Chicago": (41.8781, -87.6298),
-    "Houston": (29.7604, -95.3698),
-    "Phoenix": (33.4484, -112.0740),
-    "Philadelphia": (39.9526, -75.1652),
-    "San Antonio": (29.4241, -98.4936),
-    "San Diego": (32.7157, -117.1611),
-    "Dallas": (32.7767, -96.7970),
-    "San Jose": (37.3382, -121.8863),
-    "Unknown": (39.8283, -98.5795) # Center of US approx
-}
-
 def get_geo_data(db: Session, account_id: str):
     # Aggregate sales by City from Customers joining Transactions? 
     # Or just Customer count by City? Let's do Sales Volume by City.
@@ -308,7 +516,7 @@ def get_geo_data(db: Session, account_id: str):
     results = []
     for city, volume in cities:
         city_norm = city.strip() if city else "Unknown"
-        lat, lng = CITY_COORDS.get(city_norm, (39.8283 + (len(city_norm)*0.1), -98.5795)) # Pseudo-random fallback
+        lat, lng = geo_engine.resolve_coords(city_norm)
         
         results.append(schemas.GeoPoint(
             city=city_norm,
@@ -318,53 +526,99 @@ def get_geo_data(db: Session, account_id: str):
         ))
     return results
 
+def get_geo_grid(db: Session, account_id: str, zoom: int, min_lat: float, min_lng: float, max_lat: float, max_lng: float):
+    eff_zoom, cells = geo_engine.grid_cells(db, account_id, zoom, min_lat, min_lng, max_lat, max_lng)
+    return schemas.GeoGrid(
+        zoom=eff_zoom,
+        cell_size=geo_engine.cell_size(eff_zoom),
+        cells=[schemas.GeoCell(**c) for c in cells]
+    )
+
+def get_catchment_zones(db: Session, account_id: str, k: int):
+    zones = catchment_engine.get_catchments(db, account_id, k)
+    return [schemas.CatchmentZone(**z) for z in zones]
+
 # --- ShelfSense ---
-def get_shelf_insights(db: Session, account_id: str):
-    insights = []
-    
-    # 1. Expiry Risk (Batches expiring in next 30 days)
-    today = datetime.now().date()
-    expiry_threshold = today + __import__("datetime").timedelta(days=30)
+def get_expiry_insights(db: Session, account_id: str, skip: int = 0, limit: int = 100, horizon_days: int = expiry.HORIZON_DAYS):
+    # Batches expiring in the next `horizon_days`, soonest first.
+    # Read from the precomputed expiry calendar (covers up to expiry.HORIZON_DAYS).
+    today = expiry.ensure_swept(db, account_id)
+    expiry_threshold = today + timedelta(days=horizon_days)
     
-    risky_batches = db.query(core.ProductBatch).filter(
-        core.ProductBatch.account_id == account_id,
-        core.ProductBatch.expiry_date <= expiry_threshold,
-        core.ProductBatch.expiry_date >= today,
-        core.ProductBatch.quantity > 0
-    ).all()
+    rows = db.query(
+        core.ExpiryBucket.product_id,
+        core.ProductBatch.batch_code,
+        core.ExpiryBucket.expiry_date,
+        core.Product.name
+    ).join(core.ProductBatch, core.ProductBatch.id == core.ExpiryBucket.batch_id).outerjoin(
+        core.Product, core.Product.id == core.ExpiryBucket.product_id
+    ).filter(
+        core.ExpiryBucket.account_id == account_id,
+        core.ExpiryBucket.tier != expiry.EXPIRED,
+        core.ExpiryBucket.expiry_date <= expiry_threshold
+    ).order_by(core.ExpiryBucket.expiry_date, core.ExpiryBucket.batch_id).offset(skip).limit(limit).all()
     
-    for b in risky_batches:
-        prod = db.query(core.Product).filter(core.Product.id == b.product_id).first()
-        days_left = (b.expiry_date - today).days
+    insights = []
+    for product_id, batch_code, expiry_date, product_name in rows:
+        days_left = (expiry_date - today).days
         insights.append(schemas.ShelfInsight(
-            product_id=b.product_id,
-            product_name=prod.name if prod else "Unknown",
+            product_id=product_id,
+            product_name=product_name or "Unknown",
             insight_type="EXPIRY_RISK",
-            details=f"Batch {b.batch_code} expires in {days_left} days",
+            details=f"Batch {batch_code} expires in {days_left} days",
             metric=float(days_left),
             severity="High" if days_left < 7 else "Medium"
         ))
+    return insights
+
+def get_shelf_insights(db: Session, account_id: str, skip: int = 0, limit: int = 100):
+    # 1. Expiry Risk (paged, ordered by days left)
+    insights = get_expiry_insights(db, account_id, skip, limit)
         
-    # 2. Stagnant Stock (Products with stock > 0 but no sales in 30 days)
-    # Simplified check: Just find high stock items for now to demonstrate UI
-    
-    stagnant_prods = db.query(core.Product).filter(
-        core.Product.account_id == account_id,
-        core.Product.stock_quantity > 50
-    ).limit(5).all()
+    # 2. Stagnant Stock (days of cover at the 30-day sales velocity above threshold)
+    # Only attached to the first page so paging through expiry risks doesn't repeat them.
+    if skip > 0:
+        return insights
     
-    for p in stagnant_prods:
+    for p in velocity_engine.get_stagnant_products(db, account_id, limit=limit):
+        cover = p["days_of_cover"]
+        if cover is None:
+            details = f"{p['stock_quantity']} in stock, no sales in 30 days ({p['units_90d']} in 90 days)"
+            severity = "High" if p["units_90d"] == 0 else "Medium"
+        else:
+            details = f"{cover:.0f} days of cover at {p['daily_velocity']:.1f} units/day"
+            severity = "Medium" if cover > 2 * velocity_engine.DEFAULT_COVER_THRESHOLD else "Low"
         insights.append(schemas.ShelfInsight(
-            product_id=p.id,
-            product_name=p.name,
+            product_id=p["product_id"],
+            product_name=p["product_name"],
             insight_type="STAGNANT_STOCK",
-            details="High stock level with low recent velocity",
-            metric=float(p.stock_quantity),
-            severity="Low"
+            details=details,
+            metric=float(p["stock_quantity"]),
+            severity=severity
         ))
         
     return insights
 
+def get_stagnant_stock(db: Session, account_id: str, threshold_days: float, limit: int):
+    products = velocity_engine.get_stagnant_products(db, account_id, threshold_days, limit)
+    return [schemas.ProductVelocity(**p) for p in products]
+
+def analyze_shelf_grids(db: Session, account_id: str, grids: List[schemas.PlanogramGrid]):
+    catalog = shelf_sense.get_catalog(db, account_id)
+    results = shelf_sense.score_grids([g.cells for g in grids], catalog)
+    return [
+        schemas.ShelfAnalysis(
+            label=g.label,
+            score=r["score"],
+            logs=r["logs"],
+            conflicts=[
+                schemas.ShelfConflict(cell_a=list(a), cell_b=list(b), product_a=pa, product_b=pb)
+                for a, b, pa, pb in r["conflicts"]
+            ]
+        )
+        for g, r in zip(grids, results)
+    ]
+
 # --- Online Ordering ---
 def get_online_orders(db: Session, account_id: str):
     # Simulating external orders since we don't have a customer app in this demo
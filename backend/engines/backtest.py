@@ -0,0 +1,127 @@
+import os
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from backend.models import core
+from backend.engines import forecast, sales_dates
+
+# IsoBar forecast backtesting.
+# Replays a tenant's history with rolling-origin splits: for each origin the models are
+# fitted on the days before it and scored on the next `horizon` days, across all
+# products at once. Every (model, origin) pair is an independent task, run in a process
+# pool when the matrix is big enough to pay for it. Errors are returned as sums, so
+# WAPE and MAPE are exact over all folds, alongside the wall time each model needed.
+
+MIN_TRAIN_DAYS = 28
+MOVING_AVERAGE_DAYS = 28
+POOL_MIN_CELLS = 200_000 # train cells x tasks below this are evaluated inline
+MAX_WORKERS = os.cpu_count() or 1
+
+def _naive(Y: np.ndarray, first: date, horizon: int, contexts) -> np.ndarray:
+    return np.repeat(Y[-1:], horizon, axis=0)
+
+def _seasonal_naive(Y: np.ndarray, first: date, horizon: int, contexts) -> np.ndarray:
+    last_week = Y[-forecast.SEASON:]
+    return np.stack([last_week[h % len(last_week)] for h in range(horizon)])
+
+def _moving_average(Y: np.ndarray, first: date, horizon: int, contexts) -> np.ndarray:
+    return np.repeat(Y[-MOVING_AVERAGE_DAYS:].mean(axis=0, keepdims=True), horizon, axis=0)
+
+def _smoothing(Y: np.ndarray, first: date, horizon: int, contexts) -> np.ndarray:
+    state = forecast.ForecastState(list(range(Y.shape[1])), first)
+    forecast.fit_matrix(state, Y, first, contexts)
+    qty, _ = forecast.predict_matrix(state, first + timedelta(days=len(Y)), horizon, contexts)
+    return qty
+
+def _smoothing_no_context(Y: np.ndarray, first: date, horizon: int, contexts) -> np.ndarray:
+    return _smoothing(Y, first, horizon, {})
+
+MODELS = {
+    "naive": _naive,
+    "seasonal_naive": _seasonal_naive,
+    "moving_average": _moving_average,
+    "smoothing": _smoothing_no_context,
+    "smoothing_context": _smoothing, # the model IsoBar serves
+}
+
+def _evaluate(model: str, train: np.ndarray, test: np.ndarray, first: date, contexts) -> Tuple[str, float, float, float, int, float]:
+    started = time.perf_counter()
+    predicted = MODELS[model](train, first, len(test), contexts)
+    seconds = time.perf_counter() - started
+
+    abs_err = np.abs(test - predicted)
+    sold = test > 0
+    return (
+        model,
+        float(abs_err.sum()),
+        float(test.sum()),
+        float((abs_err[sold] / test[sold]).sum()),
+        int(sold.sum()),
+        seconds,
+    )
+
+def _splits(days: int, horizon: int, folds: int, step: int) -> List[int]:
+    """Origins (index of the first test day), newest first, each with MIN_TRAIN_DAYS of history."""
+    origins = [days - horizon - k * step for k in range(folds)]
+    return [o for o in origins if o >= MIN_TRAIN_DAYS]
+
+def run(db: Session, account_id: str, horizon: int = 7, folds: int = 4, step: Optional[int] = None,
+        models: Optional[List[str]] = None, workers: Optional[int] = None) -> List[dict]:
+    """Per-model WAPE/MAPE over all origins and products, best WAPE first."""
+    models = models or list(MODELS)
+    unknown = [m for m in models if m not in MODELS]
+    if unknown:
+        raise ValueError(f"Unknown models: {', '.join(unknown)}")
+
+    today = sales_dates.today(db, account_id)
+    last = today - timedelta(days=1)
+    sales_dates.backfill(db, account_id)
+    first = db.query(func.min(core.Transaction.sales_date)).filter(
+        core.Transaction.account_id == account_id,
+        core.Transaction.sales_date >= today - timedelta(days=forecast.HISTORY_DAYS)
+    ).scalar()
+    product_ids = [r[0] for r in db.query(core.Product.id).filter(core.Product.account_id == account_id).all()]
+    if first is None or not product_ids:
+        return []
+
+    Y = forecast.sales_matrix(db, account_id, {pid: i for i, pid in enumerate(product_ids)}, first, last)
+    contexts = forecast.load_contexts(db, account_id)
+    origins = _splits(len(Y), horizon, folds, step or horizon)
+    if not origins:
+        return []
+
+    tasks = [(m, Y[:o], Y[o:o + horizon], first, contexts) for m in models for o in origins]
+    workers = workers or MAX_WORKERS
+    cells = sum(t[1].size for t in tasks)
+    if workers == 1 or cells < POOL_MIN_CELLS:
+        outcomes = [_evaluate(*t) for t in tasks]
+    else:
+        # Backtests are occasional batch jobs, so the pool lives only for the run
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            outcomes = list(pool.map(_evaluate, *zip(*tasks)))
+
+    totals: Dict[str, list] = {m: [0.0, 0.0, 0.0, 0, 0.0] for m in models}
+    for model, abs_err, actual, ape, sold, seconds in outcomes:
+        t = totals[model]
+        t[0] += abs_err
+        t[1] += actual
+        t[2] += ape
+        t[3] += sold
+        t[4] += seconds
+
+    report = [{
+        "model": m,
+        "wape": t[0] / t[1] if t[1] else None,
+        "mape": t[2] / t[3] if t[3] else None,
+        "seconds": t[4],
+        "seconds_per_fold": t[4] / len(origins),
+        "folds": len(origins),
+        "products": len(product_ids),
+        "horizon": horizon,
+    } for m, t in totals.items()]
+    report.sort(key=lambda r: (r["wape"] is None, r["wape"] or 0))
+    return report
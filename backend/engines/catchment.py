@@ -0,0 +1,129 @@
+import numpy as np
+from typing import List
+from sqlalchemy.orm import Session
+from backend.cache import TenantCache
+from backend.engines import geo
+
+# GeoViz catchment analysis.
+# Spend-weighted k-means over customer locations, fully vectorized with NumPy.
+# Coordinates are projected to a local equirectangular plane (km) so euclidean
+# distances are meaningful, and seeding is k-means++ from a fixed RNG seed so the
+# same customer set always yields the same zones.
+
+EARTH_RADIUS_KM = 6371.0
+DEFAULT_SEED = 42
+MAX_ITER = 100
+TOLERANCE_KM = 1e-3
+# A cached result is reused until customers or revenue drift by more than this.
+MATERIAL_CHANGE = 0.05
+
+_cache = TenantCache()
+
+def _project(lat: np.ndarray, lng: np.ndarray, ref_lat: float) -> np.ndarray:
+    k = np.pi / 180.0 * EARTH_RADIUS_KM
+    return np.column_stack((lng * k * np.cos(np.radians(ref_lat)), lat * k))
+
+def _sq_distances(X: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """(n, k) squared distances without materialising an (n, k, 2) difference tensor."""
+    d2 = (X ** 2).sum(axis=1)[:, None] - 2.0 * X @ centroids.T + (centroids ** 2).sum(axis=1)[None, :]
+    return np.maximum(d2, 0.0)
+
+def _seed_centroids(X: np.ndarray, w: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+    """Weighted k-means++ seeding."""
+    centroids = np.empty((k, 2))
+    centroids[0] = X[rng.choice(len(X), p=w / w.sum())]
+    d2 = ((X - centroids[0]) ** 2).sum(axis=1)
+    for i in range(1, k):
+        p = w * d2
+        total = p.sum()
+        idx = rng.choice(len(X), p=p / total) if total > 0 else rng.integers(len(X))
+        centroids[i] = X[idx]
+        d2 = np.minimum(d2, ((X - centroids[i]) ** 2).sum(axis=1))
+    return centroids
+
+def weighted_kmeans(X: np.ndarray, w: np.ndarray, k: int, seed: int = DEFAULT_SEED):
+    """Returns (centroids, labels). X is (n, 2), w is (n,) with positive weights."""
+    rng = np.random.default_rng(seed)
+    centroids = _seed_centroids(X, w, k, rng)
+    labels = np.zeros(len(X), dtype=np.int64)
+
+    for _ in range(MAX_ITER):
+        d2 = _sq_distances(X, centroids)
+        labels = d2.argmin(axis=1)
+
+        mass = np.bincount(labels, weights=w, minlength=k)
+        sums = np.column_stack((
+            np.bincount(labels, weights=w * X[:, 0], minlength=k),
+            np.bincount(labels, weights=w * X[:, 1], minlength=k),
+        ))
+        new_centroids = centroids.copy()
+        filled = mass > 0
+        new_centroids[filled] = sums[filled] / mass[filled, None]
+
+        # Re-seed empty clusters at the points worst served by their centroid
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            worst = np.argsort(d2[np.arange(len(X)), labels])[::-1][:len(empty)]
+            new_centroids[empty[:len(worst)]] = X[worst]
+
+        shift = np.sqrt(((new_centroids - centroids) ** 2).sum(axis=1)).max()
+        centroids = new_centroids
+        if shift < TOLERANCE_KM:
+            break
+
+    d2 = _sq_distances(X, centroids)
+    return centroids, d2.argmin(axis=1)
+
+def _compute(index: geo.GeoIndex, k: int, seed: int) -> List[dict]:
+    if not index.customers:
+        return []
+
+    data = np.array(list(index.customers.values()), dtype=float) # lat, lng, sales
+    lat, lng, sales = data[:, 0], data[:, 1], data[:, 2]
+    weights = np.clip(sales, 1e-6, None)
+    k = min(k, len(data))
+
+    ref_lat = float(np.average(lat, weights=weights))
+    X = _project(lat, lng, ref_lat)
+    centroids, labels = weighted_kmeans(X, weights, k, seed)
+
+    dist = np.sqrt(((X - centroids[labels]) ** 2).sum(axis=1))
+    revenue = np.bincount(labels, weights=sales, minlength=k)
+    counts = np.bincount(labels, minlength=k)
+    total_revenue = sales.sum()
+
+    scale = np.pi / 180.0 * EARTH_RADIUS_KM
+    zones = []
+    for i in range(k):
+        if counts[i] == 0:
+            continue
+        members = dist[labels == i]
+        zones.append({
+            "lat": float(centroids[i, 1] / scale),
+            "lng": float(centroids[i, 0] / (scale * np.cos(np.radians(ref_lat)))),
+            "radius_km": float(np.percentile(members, 90)),
+            "customers": int(counts[i]),
+            "revenue": float(revenue[i]),
+            "revenue_share": float(revenue[i] / total_revenue) if total_revenue > 0 else 0.0,
+        })
+    zones.sort(key=lambda z: z["revenue"], reverse=True)
+    return zones
+
+def _changed_materially(entry: dict, customers: int, revenue: float) -> bool:
+    def drift(old, new):
+        return abs(new - old) > MATERIAL_CHANGE * max(abs(old), 1.0)
+    return drift(entry["customers"], customers) or drift(entry["revenue"], revenue)
+
+def get_catchments(db: Session, account_id: str, k: int, seed: int = DEFAULT_SEED) -> List[dict]:
+    index = geo.get_index(db, account_id)
+    customers = len(index.customers)
+    revenue = index.total_sales
+
+    entry = _cache.get(account_id, (k, seed))
+    if entry is None or _changed_materially(entry, customers, revenue):
+        entry = _cache.set(account_id, (k, seed), {
+            "customers": customers,
+            "revenue": revenue,
+            "zones": _compute(index, k, seed),
+        })
+    return entry["zones"]
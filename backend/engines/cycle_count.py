@@ -0,0 +1,208 @@
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import case, func, insert, update
+from sqlalchemy.orm import Session
+from backend.models import core
+from backend.crud.base import generate_unique_id
+from backend.engines import voice as voice_engine
+
+# VoiceAudit cycle counts.
+# A stock take speaks hundreds of counts; instead of one UPDATE + commit per utterance
+# they are parsed into a staging table (cycle_count_entries) where they can be reviewed
+# and undone. Applying the session folds each product's active entries over its current
+# stock, writes every new level with a single set-based UPDATE, records per-product
+# variance and the VoiceLog trail, and commits once.
+
+OPEN = "OPEN"
+APPLIED = "APPLIED"
+
+_session_lock = threading.Lock() # SQLite ignores FOR UPDATE; serializes staging and applying in this process
+
+class SessionError(ValueError):
+    pass
+
+def get_session(db: Session, account_id: str, session_id: str, lock: bool = False) -> Optional[core.CycleCountSession]:
+    query = db.query(core.CycleCountSession).filter(
+        core.CycleCountSession.id == session_id,
+        core.CycleCountSession.account_id == account_id
+    )
+    if lock:
+        # Re-read the status under the row lock rather than trusting the identity map
+        query = query.with_for_update().populate_existing()
+    return query.first()
+
+def _open_session(db: Session, account_id: str, session_id: str, lock: bool = False) -> Optional[core.CycleCountSession]:
+    session = get_session(db, account_id, session_id, lock)
+    if session is not None and session.status != OPEN:
+        raise SessionError(f"Session is {session.status}")
+    return session
+
+def create_session(db: Session, account_id: str, created_by: Optional[str] = None) -> core.CycleCountSession:
+    session = core.CycleCountSession(id=generate_unique_id(), account_id=account_id, status=OPEN, created_by=created_by)
+    db.add(session)
+    db.commit()
+    db.refresh(session)
+    return session
+
+def get_entries(db: Session, session_id: str) -> List[core.CycleCountEntry]:
+    return db.query(core.CycleCountEntry).filter(
+        core.CycleCountEntry.session_id == session_id
+    ).order_by(core.CycleCountEntry.seq).all()
+
+def add_commands(db: Session, account_id: str, session_id: str, transcripts: List[str]) -> Optional[List[dict]]:
+    """Parses and stages transcripts; nothing touches stock until the session is applied."""
+    if _open_session(db, account_id, session_id) is None:
+        return None
+    results = voice_engine.parse_commands(db, account_id, transcripts)
+    with _session_lock:
+        try:
+            # The session row lock serializes seq allocation across processes; the unique
+            # (session_id, seq) index rejects anything that slips past it
+            if _open_session(db, account_id, session_id, lock=True) is None:
+                return None
+            last_seq = db.query(func.max(core.CycleCountEntry.seq)).filter(
+                core.CycleCountEntry.session_id == session_id
+            ).scalar() or 0
+
+            rows = [{
+                "id": generate_unique_id(),
+                "session_id": session_id,
+                "account_id": account_id,
+                "seq": last_seq + i,
+                "transcript": r['original_text'],
+                "action": r['action'],
+                "qty": r['qty'],
+                "product_id": r['product_id'],
+                "product_name": r['product_name'],
+                "confidence_score": r['confidence'],
+                "status_msg": r['status_msg'],
+                "status": "ACTIVE" if r['status_msg'] == "Success" else "REJECTED",
+            } for i, r in enumerate(results, start=1)]
+            if rows:
+                db.execute(insert(core.CycleCountEntry), rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+    return rows
+
+def undo(db: Session, account_id: str, session_id: str, entry_id: Optional[str] = None) -> Optional[core.CycleCountEntry]:
+    """Marks one entry UNDONE: the given one, or the most recent active entry."""
+    if _open_session(db, account_id, session_id) is None:
+        return None
+    query = db.query(core.CycleCountEntry).filter(
+        core.CycleCountEntry.session_id == session_id,
+        core.CycleCountEntry.status == "ACTIVE"
+    )
+    if entry_id:
+        entry = query.filter(core.CycleCountEntry.id == entry_id).first()
+    else:
+        entry = query.order_by(core.CycleCountEntry.seq.desc()).first()
+    if entry is None:
+        raise SessionError("Nothing to undo")
+    entry.status = "UNDONE"
+    db.commit()
+    db.refresh(entry)
+    return entry
+
+def _active_commands(db: Session, session_id: str) -> Dict[str, List[Tuple[str, int]]]:
+    rows = db.query(core.CycleCountEntry.product_id, core.CycleCountEntry.action, core.CycleCountEntry.qty).filter(
+        core.CycleCountEntry.session_id == session_id,
+        core.CycleCountEntry.status == "ACTIVE"
+    ).order_by(core.CycleCountEntry.seq).all()
+    by_product: Dict[str, List[Tuple[str, int]]] = {}
+    for product_id, action, qty in rows:
+        by_product.setdefault(product_id, []).append((action, qty))
+    return by_product
+
+def _reconcile(db: Session, account_id: str, session_id: str, lock: bool = False) -> List[dict]:
+    by_product = _active_commands(db, session_id)
+    if not by_product:
+        return []
+    query = db.query(core.Product.id, core.Product.name, core.Product.stock_quantity).filter(
+        core.Product.account_id == account_id,
+        core.Product.id.in_(list(by_product))
+    )
+    if lock:
+        query = query.with_for_update()
+
+    lines = []
+    for product_id, name, stock in query.all():
+        expected = stock or 0
+        counted = voice_engine.reconcile(expected, by_product[product_id])
+        lines.append({
+            "product_id": product_id,
+            "product_name": name,
+            "expected_qty": expected,
+            "counted_qty": counted,
+            "variance": counted - expected,
+        })
+    lines.sort(key=lambda l: (-abs(l["variance"]), l["product_name"] or ""))
+    return lines
+
+def preview(db: Session, account_id: str, session_id: str) -> List[dict]:
+    """What applying the session now would do, against current stock."""
+    return _reconcile(db, account_id, session_id)
+
+def get_variances(db: Session, session_id: str) -> List[dict]:
+    rows = db.query(core.CycleCountVariance, core.Product.name).outerjoin(
+        core.Product, core.Product.id == core.CycleCountVariance.product_id
+    ).filter(core.CycleCountVariance.session_id == session_id).all()
+    lines = [{
+        "product_id": v.product_id,
+        "product_name": name,
+        "expected_qty": v.expected_qty,
+        "counted_qty": v.counted_qty,
+        "variance": v.variance,
+    } for v, name in rows]
+    lines.sort(key=lambda l: (-abs(l["variance"]), l["product_name"] or ""))
+    return lines
+
+def apply(db: Session, account_id: str, session_id: str) -> Optional[List[dict]]:
+    """Reconciles the whole session in one transaction. Returns the variance lines."""
+    with _session_lock:
+        session = _open_session(db, account_id, session_id, lock=True)
+        if session is None:
+            return None
+        try:
+            lines = _reconcile(db, account_id, session_id, lock=True)
+            if lines:
+                levels = {l["product_id"]: l["counted_qty"] for l in lines}
+                db.execute(
+                    update(core.Product)
+                    .where(core.Product.account_id == account_id, core.Product.id.in_(list(levels)))
+                    .values(stock_quantity=case(levels, value=core.Product.id))
+                    .execution_options(synchronize_session=False)
+                )
+                db.execute(insert(core.CycleCountVariance), [{
+                    "session_id": session_id,
+                    "product_id": l["product_id"],
+                    "account_id": account_id,
+                    "expected_qty": l["expected_qty"],
+                    "counted_qty": l["counted_qty"],
+                    "variance": l["variance"],
+                } for l in lines])
+
+            entries = db.query(
+                core.CycleCountEntry.transcript, core.CycleCountEntry.action, core.CycleCountEntry.confidence_score
+            ).filter(
+                core.CycleCountEntry.session_id == session_id,
+                core.CycleCountEntry.status != "UNDONE"
+            ).order_by(core.CycleCountEntry.seq).all()
+            if entries:
+                db.execute(insert(core.VoiceLog), [{
+                    "id": generate_unique_id(),
+                    "account_id": account_id,
+                    "transcript": transcript,
+                    "action_extracted": action,
+                    "confidence_score": confidence,
+                } for transcript, action, confidence in entries])
+
+            session.status = APPLIED
+            session.applied_at = datetime.now()
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return lines
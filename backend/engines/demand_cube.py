@@ -0,0 +1,174 @@
+from collections import Counter, defaultdict
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from backend.models import core
+from backend.cache import WATERMARK_OVERLAP, TenantCache, Watermark
+from backend.engines import sales_dates
+
+# IsoBar demand cube.
+# (weather_tag, event_tag) -> product -> units sold on days with that context, plus the
+# number of such days, so a prediction is a dict lookup instead of a scan of the
+# tenant's sales history. The cube is built with one grouped pass over the indexed
+# transactions.sales_date, then kept current: new sales are folded in past the
+# watermark, and when a day's context changes only that day's sales are moved.
+
+TOP_N = 5
+
+_cache = TenantCache()
+
+Context = Tuple[Optional[str], Optional[str]]
+
+
+class DemandCube:
+    def __init__(self):
+        self.contexts: Dict[date, Context] = {}
+        self.days: Counter = Counter() # context -> days observed
+        self.units: Dict[Context, Counter] = defaultdict(Counter) # context -> product -> units
+        self.watermark = Watermark()
+        self.fingerprint = None # (count, max date, max updated_at) of DailyContext rows folded in
+
+    def _fold_day(self, ctx: Context, day_units: Dict[str, int], sign: int):
+        cell = self.units[ctx]
+        for product, units in day_units.items():
+            cell[product] += sign * (units or 0)
+            if cell[product] <= 0:
+                del cell[product]
+
+    def set_context(self, day: date, ctx: Optional[Context], day_units: Dict[str, int]):
+        """Moves one day (and its sales) to a new context cell; ctx=None removes it."""
+        old = self.contexts.pop(day, None)
+        if old is not None:
+            self.days[old] -= 1
+            self._fold_day(old, day_units, -1)
+        if ctx is not None:
+            self.contexts[day] = ctx
+            self.days[ctx] += 1
+            self._fold_day(ctx, day_units, 1)
+
+    def add_sale(self, day: date, product: str, units: int):
+        ctx = self.contexts.get(day)
+        if ctx is not None:
+            self.units[ctx][product] += units or 0
+
+
+def _context_fingerprint(db: Session, account_id: str):
+    # updated_at catches re-tagging an existing day, which leaves count and max(date) alone
+    return tuple(db.query(func.count(), func.max(core.DailyContext.date), func.max(core.DailyContext.updated_at)).filter(
+        core.DailyContext.account_id == account_id
+    ).one())
+
+def _load_contexts(db: Session, account_id: str) -> Dict[date, Context]:
+    rows = db.query(core.DailyContext.date, core.DailyContext.weather_tag, core.DailyContext.event_tag).filter(
+        core.DailyContext.account_id == account_id
+    ).all()
+    return {d: (w, e) for d, w, e in rows}
+
+def _day_units(db: Session, account_id: str, day: date, upto=None) -> Dict[str, int]:
+    """Units per product sold on one business day (an (account_id, sales_date) index lookup)."""
+    query = db.query(core.TransactionItem.product_name, func.sum(core.TransactionItem.quantity)).join(core.Transaction).filter(
+        core.Transaction.account_id == account_id,
+        core.Transaction.sales_date == day
+    )
+    if upto is not None:
+        query = query.filter(core.Transaction.timestamp <= upto)
+    return dict(query.group_by(core.TransactionItem.product_name).all())
+
+def _build(db: Session, account_id: str) -> DemandCube:
+    cube = DemandCube()
+    sales_dates.backfill(db, account_id)
+    cube.fingerprint = _context_fingerprint(db, account_id)
+    contexts = _load_contexts(db, account_id)
+    latest = db.query(func.max(core.Transaction.timestamp)).filter(
+        core.Transaction.account_id == account_id
+    ).scalar()
+
+    by_day: Dict[date, Dict[str, int]] = defaultdict(dict)
+    if latest is not None and contexts:
+        day = core.Transaction.sales_date
+        rows = db.query(day, core.TransactionItem.product_name, func.sum(core.TransactionItem.quantity)).join(core.Transaction).filter(
+            core.Transaction.account_id == account_id,
+            day.between(min(contexts), max(contexts)),
+            core.Transaction.timestamp <= latest
+        ).group_by(day, core.TransactionItem.product_name).all()
+        for d, product, units in rows:
+            if d in contexts:
+                by_day[d][product] = units
+
+    for d, ctx in contexts.items():
+        cube.set_context(d, ctx, by_day.get(d, {}))
+
+    if latest is not None:
+        cube.watermark = Watermark(latest, (tuple(r) for r in db.query(core.Transaction.id, core.Transaction.timestamp).filter(
+            core.Transaction.account_id == account_id,
+            core.Transaction.timestamp.between(latest - WATERMARK_OVERLAP, latest)
+        ).all()))
+    return cube
+
+def _refresh_sales(db: Session, account_id: str, cube: DemandCube):
+    query = db.query(
+        core.Transaction.id,
+        core.Transaction.timestamp,
+        core.Transaction.sales_date,
+        core.TransactionItem.product_name,
+        core.TransactionItem.quantity
+    ).join(core.Transaction).filter(core.Transaction.account_id == account_id)
+    since = cube.watermark.since()
+    if since is not None:
+        query = query.filter(core.Transaction.timestamp >= since)
+    rows = [r for r in query.all() if cube.watermark.accepts(r[1], r[0])]
+    tz = sales_dates.get_timezone(db, account_id) if rows else None
+    for _, ts, day, product, qty in rows:
+        cube.add_sale(day or sales_dates.local_date(ts, tz), product, qty)
+    for txn_id, ts, _, _, _ in rows:
+        cube.watermark.advance(ts, txn_id)
+
+def _refresh_contexts(db: Session, account_id: str, cube: DemandCube):
+    """Catches context rows written outside context_changed (e.g. the legacy app)."""
+    fingerprint = _context_fingerprint(db, account_id)
+    if fingerprint == cube.fingerprint:
+        return
+    current = _load_contexts(db, account_id)
+    for day in set(cube.contexts) | set(current):
+        if cube.contexts.get(day) != current.get(day):
+            cube.set_context(day, current.get(day), _day_units(db, account_id, day, cube.watermark.ts))
+    cube.fingerprint = fingerprint
+
+def get_cube(db: Session, account_id: str) -> DemandCube:
+    with _cache.lock():
+        cube = _cache.get(account_id)
+        if cube is None:
+            return _cache.set(account_id, None, _build(db, account_id))
+        _refresh_sales(db, account_id, cube)
+        _refresh_contexts(db, account_id, cube)
+        return cube
+
+def context_changed(db: Session, account_id: str, day: date, weather: Optional[str], event: Optional[str]):
+    """Call after a DailyContext row is written; moves only that day's sales."""
+    with _cache.lock():
+        cube = _cache.get(account_id)
+        if cube is None:
+            return
+        _refresh_sales(db, account_id, cube)
+        if cube.contexts.get(day) != (weather, event):
+            cube.set_context(day, (weather, event), _day_units(db, account_id, day, cube.watermark.ts))
+        cube.fingerprint = _context_fingerprint(db, account_id)
+
+def invalidate(account_id: str):
+    _cache.invalidate(account_id)
+
+def predict(db: Session, account_id: str, weather: str, event: str, limit: int = TOP_N) -> List[dict]:
+    """Top products for a context by total units, with average units/day and the number of days behind it."""
+    cube = get_cube(db, account_id)
+    ctx = (weather, event)
+    days = cube.days.get(ctx, 0)
+    if not days:
+        return []
+    units = cube.units.get(ctx, Counter())
+    return [{
+        "product_name": product,
+        "total_qty": int(total),
+        "avg_daily_qty": total / days,
+        "days_observed": days,
+    } for product, total in units.most_common(limit)]
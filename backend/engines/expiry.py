@@ -0,0 +1,204 @@
+import logging
+import threading
+from datetime import date, datetime, timedelta
+from typing import Callable, List, Optional
+from sqlalchemy import bindparam, delete, func, insert, update
+from sqlalchemy.orm import Session
+from backend.models import core
+from backend.crud.base import generate_unique_id
+from backend.engines import job_runs, sales_dates
+
+# FreshFlow expiry calendar.
+# Batches with stock expiring within HORIZON_DAYS (or expired in the last
+# EXPIRED_KEEP_DAYS) are pre-bucketed into urgency tiers in expiry_buckets, so FreshFlow
+# and ShelfSense read a small table instead of range-scanning product_batches on every
+# visit. A background sweeper re-buckets each tenant once per business day (one range
+# scan on ix_product_batches_account_expiry_qty); batch writes bucket their own rows.
+# A batch raises one ExpiryAlert each time it crosses into a more urgent tier.
+
+# Most urgent first; a batch belongs to the first tier whose limit covers its days left
+TIERS = (("TODAY", 0), ("2D", 2), ("7D", 7), ("30D", 30))
+EXPIRED = "EXPIRED"
+HORIZON_DAYS = TIERS[-1][1]
+EXPIRED_KEEP_DAYS = 7
+SWEEP_INTERVAL_S = 60
+JOB = "expiry_sweep"
+
+RANK = {name: i for i, name in enumerate([EXPIRED] + [t for t, _ in TIERS])}
+
+logger = logging.getLogger("uvicorn")
+
+_sweep_lock = threading.Lock() # the sweeper thread and request-time sweeps must not bucket the same rows twice
+_stop = threading.Event()
+_worker: Optional[threading.Thread] = None
+
+def tier_for(days_left: int) -> Optional[str]:
+    if days_left < 0:
+        return EXPIRED if days_left >= -EXPIRED_KEEP_DAYS else None
+    for name, limit in TIERS:
+        if days_left <= limit:
+            return name
+    return None
+
+def sweep(db: Session, account_id: str, today: Optional[date] = None, batch_ids: Optional[List[str]] = None) -> dict:
+    """
+    Re-buckets a tenant's batches (or only `batch_ids`) for `today` and records alerts
+    for batches that moved into a more urgent tier. Commits once.
+    """
+    today = today or sales_dates.today(db, account_id)
+    with _sweep_lock:
+        return _sweep(db, account_id, today, batch_ids)
+
+def _sweep(db: Session, account_id: str, today: date, batch_ids: Optional[List[str]]) -> dict:
+    query = db.query(
+        core.ProductBatch.id, core.ProductBatch.product_id, core.ProductBatch.expiry_date,
+        core.ProductBatch.quantity, core.ProductBatch.cost_price
+    ).filter(
+        core.ProductBatch.account_id == account_id,
+        core.ProductBatch.expiry_date >= today - timedelta(days=EXPIRED_KEEP_DAYS),
+        core.ProductBatch.expiry_date <= today + timedelta(days=HORIZON_DAYS),
+        core.ProductBatch.quantity > 0
+    )
+    existing_query = db.query(core.ExpiryBucket.batch_id, core.ExpiryBucket.tier).filter(
+        core.ExpiryBucket.account_id == account_id
+    )
+    if batch_ids is not None:
+        query = query.filter(core.ProductBatch.id.in_(batch_ids))
+        existing_query = existing_query.filter(core.ExpiryBucket.batch_id.in_(batch_ids))
+    existing = dict(existing_query.all())
+
+    now = datetime.utcnow()
+    inserts, updates, alerts, seen = [], [], [], set()
+    for batch_id, product_id, expiry_date, quantity, cost_price in query.all():
+        tier = tier_for((expiry_date - today).days)
+        seen.add(batch_id)
+        row = {"tier": tier, "expiry_date": expiry_date, "quantity": quantity,
+               "value": quantity * (cost_price or 0.0), "swept_on": today}
+        previous = existing.get(batch_id)
+        if previous is None:
+            inserts.append(dict(row, batch_id=batch_id, account_id=account_id, product_id=product_id))
+        else:
+            updates.append(dict(row, b_id=batch_id))
+        if previous is None or RANK[tier] < RANK.get(previous, len(RANK)):
+            alerts.append({"id": generate_unique_id(), "account_id": account_id, "batch_id": batch_id,
+                           "product_id": product_id, "tier": tier, "expiry_date": expiry_date,
+                           "quantity": quantity, "created_at": now})
+    gone = [batch_id for batch_id in existing if batch_id not in seen]
+
+    if inserts:
+        db.execute(insert(core.ExpiryBucket), inserts)
+    if updates:
+        stmt = update(core.ExpiryBucket).where(core.ExpiryBucket.batch_id == bindparam("b_id")).execution_options(
+            synchronize_session=False
+        )
+        db.connection().execute(stmt, updates)
+    if gone:
+        db.execute(delete(core.ExpiryBucket).where(core.ExpiryBucket.batch_id.in_(gone)))
+    if alerts:
+        db.execute(insert(core.ExpiryAlert), alerts)
+    if batch_ids is None:
+        job_runs.mark_run(db, account_id, JOB, today)
+    db.commit()
+    return {"bucketed": len(seen), "removed": len(gone), "alerts": len(alerts)}
+
+def ensure_swept(db: Session, account_id: str) -> date:
+    """Sweeps the tenant if its business day rolled over since the last sweep."""
+    today = sales_dates.today(db, account_id)
+    if job_runs.last_run(db, account_id, JOB) != today:
+        sweep(db, account_id, today)
+    return today
+
+def sweep_due(db: Session) -> int:
+    """Sweeps every tenant whose business day rolled over; returns how many were swept."""
+    swept = 0
+    for account_id, in db.query(core.Account.id).all():
+        today = sales_dates.today(db, account_id)
+        if job_runs.last_run(db, account_id, JOB) != today:
+            sweep(db, account_id, today)
+            swept += 1
+    return swept
+
+def get_calendar(db: Session, account_id: str, tier: Optional[str] = None, skip: int = 0, limit: int = 100) -> dict:
+    """Per-tier totals plus one page of bucketed batches, soonest expiry first."""
+    today = ensure_swept(db, account_id)
+    totals = {t: (n, qty or 0, value or 0.0) for t, n, qty, value in db.query(
+        core.ExpiryBucket.tier,
+        func.count(core.ExpiryBucket.batch_id),
+        func.sum(core.ExpiryBucket.quantity),
+        func.sum(core.ExpiryBucket.value)
+    ).filter(core.ExpiryBucket.account_id == account_id).group_by(core.ExpiryBucket.tier).all()}
+
+    query = db.query(core.ExpiryBucket, core.ProductBatch.batch_code, core.Product.name).join(
+        core.ProductBatch, core.ProductBatch.id == core.ExpiryBucket.batch_id
+    ).outerjoin(core.Product, core.Product.id == core.ExpiryBucket.product_id).filter(
+        core.ExpiryBucket.account_id == account_id
+    )
+    if tier is not None:
+        query = query.filter(core.ExpiryBucket.tier == tier)
+    rows = query.order_by(core.ExpiryBucket.expiry_date, core.ExpiryBucket.batch_id).offset(skip).limit(limit).all()
+
+    return {
+        "as_of": today,
+        "tiers": [dict(zip(("tier", "batches", "quantity", "value"), (t,) + totals.get(t, (0, 0, 0.0)))) for t in RANK],
+        "items": [{
+            "batch_id": b.batch_id,
+            "batch_code": batch_code,
+            "product_id": b.product_id,
+            "product_name": name or "Unknown",
+            "tier": b.tier,
+            "expiry_date": b.expiry_date,
+            "days_left": (b.expiry_date - today).days,
+            "quantity": b.quantity,
+            "value": b.value,
+        } for b, batch_code, name in rows],
+    }
+
+def get_alerts(db: Session, account_id: str, pending_only: bool = True, skip: int = 0, limit: int = 100) -> list:
+    """(ExpiryAlert, product name) rows, newest first."""
+    ensure_swept(db, account_id)
+    query = db.query(core.ExpiryAlert, core.Product.name).outerjoin(
+        core.Product, core.Product.id == core.ExpiryAlert.product_id
+    ).filter(core.ExpiryAlert.account_id == account_id)
+    if pending_only:
+        query = query.filter(core.ExpiryAlert.acknowledged_at.is_(None))
+    return query.order_by(core.ExpiryAlert.created_at.desc(), core.ExpiryAlert.id).offset(skip).limit(limit).all()
+
+def acknowledge(db: Session, account_id: str, alert_ids: List[str]) -> int:
+    count = db.query(core.ExpiryAlert).filter(
+        core.ExpiryAlert.account_id == account_id,
+        core.ExpiryAlert.id.in_(alert_ids),
+        core.ExpiryAlert.acknowledged_at.is_(None)
+    ).update({core.ExpiryAlert.acknowledged_at: datetime.utcnow()}, synchronize_session=False)
+    db.commit()
+    return count
+
+def _run(session_factory: Callable[[], Session], interval: float):
+    while True:
+        db = session_factory()
+        try:
+            swept = sweep_due(db)
+            if swept:
+                logger.info(f"Expiry sweeper re-bucketed {swept} tenants")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Expiry sweep failed: {e}")
+        finally:
+            db.close()
+        if _stop.wait(interval):
+            return
+
+def start(session_factory: Callable[[], Session], interval: float = SWEEP_INTERVAL_S):
+    """Starts the background sweeper (idempotent). It checks for day rollovers every `interval` seconds."""
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        return
+    _stop.clear()
+    _worker = threading.Thread(target=_run, args=(session_factory, interval), name="expiry-sweeper", daemon=True)
+    _worker.start()
+
+def shutdown():
+    global _worker
+    _stop.set()
+    if _worker is not None:
+        _worker.join(timeout=5)
+        _worker = None
@@ -0,0 +1,253 @@
+import numpy as np
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from backend.models import core
+from backend.cache import TenantCache
+from backend.engines import sales_dates
+
+# IsoBar demand forecasting.
+# A dense day x product matrix of units sold (from transactions.sales_date) is fitted
+# with additive weekly-seasonal exponential smoothing for every product at once: the
+# recursion runs over days, with each step a vector operation across products and
+# candidate smoothing rates, and each product keeps the rate with the lowest one-step
+# error. Weather/event effects are multipliers per product and context, shrunk towards
+# 1 by MULTIPLIER_PRIOR units so rare contexts can't swing a forecast.
+# Fitted state is cached per tenant and only the days completed since the last fit
+# are folded in; a new product or an edited past context triggers a full refit.
+
+HISTORY_DAYS = 365
+SEASON = 7
+ALPHAS = np.array([0.05, 0.1, 0.2, 0.3, 0.5])
+GAMMA = 0.1
+WARMUP_DAYS = 14 # errors before this are excluded from fit selection and intervals
+MULTIPLIER_PRIOR = 5.0
+Z_95 = 1.96
+
+_cache = TenantCache()
+
+Context = Tuple[Optional[str], Optional[str]]
+
+
+class ForecastState:
+    def __init__(self, product_ids: List[str], start: date):
+        n = len(product_ids)
+        self.product_ids = product_ids
+        self.column = {pid: i for i, pid in enumerate(product_ids)}
+        self.start = start # first day of history
+        self.last_day = start - timedelta(days=1) # last day folded in
+        self.steps = 0
+        self.alpha = np.full(n, ALPHAS[0])
+        self.level = np.zeros(n)
+        self.seasonal = np.zeros((SEASON, n))
+        self.sse = np.zeros(n)
+        self.errors = 0 # error terms accumulated per product
+        self.actual: Dict[Context, np.ndarray] = {} # context -> units on those days
+        self.fitted: Dict[Context, np.ndarray] = {} # context -> one-step forecasts on those days
+        self.context_key = None
+
+    def multipliers(self, ctx: Context) -> np.ndarray:
+        if ctx not in self.actual:
+            return np.ones(len(self.product_ids))
+        actual, fitted = self.actual[ctx], self.fitted[ctx]
+        return (np.maximum(actual, 0) + MULTIPLIER_PRIOR) / (np.maximum(fitted, 0) + MULTIPLIER_PRIOR)
+
+    def sigma(self) -> np.ndarray:
+        return np.sqrt(self.sse / self.errors) if self.errors else np.zeros(len(self.product_ids))
+
+
+def sales_matrix(db: Session, account_id: str, columns: Dict[str, int], first: date, last: date) -> np.ndarray:
+    """(days, products) units sold per business day, first..last inclusive."""
+    days = (last - first).days + 1
+    matrix = np.zeros((max(days, 0), len(columns)))
+    if days <= 0:
+        return matrix
+    rows = db.query(
+        core.Transaction.sales_date,
+        core.TransactionItem.product_id,
+        func.sum(core.TransactionItem.quantity)
+    ).join(core.Transaction).filter(
+        core.Transaction.account_id == account_id,
+        core.Transaction.sales_date.between(first, last)
+    ).group_by(core.Transaction.sales_date, core.TransactionItem.product_id).all()
+    for day, product_id, units in rows:
+        col = columns.get(product_id)
+        if col is not None and day is not None:
+            matrix[(day - first).days, col] = units or 0
+    return matrix
+
+def load_contexts(db: Session, account_id: str) -> Dict[date, Context]:
+    rows = db.query(core.DailyContext.date, core.DailyContext.weather_tag, core.DailyContext.event_tag).filter(
+        core.DailyContext.account_id == account_id
+    ).all()
+    return {d: (w, e) for d, w, e in rows}
+
+def _context_key(contexts: Dict[date, Context], upto: date):
+    return hash(tuple(sorted((d, c) for d, c in contexts.items() if d <= upto)))
+
+def _fold(state: ForecastState, Y: np.ndarray, first: date, contexts: Dict[date, Context],
+          level: np.ndarray, seasonal: np.ndarray, alpha: np.ndarray, sse: np.ndarray,
+          actual: Dict[Context, np.ndarray], fitted: Dict[Context, np.ndarray]):
+    """
+    Runs the smoothing recursion over the rows of Y (consecutive days from `first`).
+    level/alpha/sse are (..., products) and seasonal is (SEASON, ..., products), so the
+    same code fits the whole alpha grid or advances the chosen per-product state.
+    """
+    for t in range(len(Y)):
+        day = first + timedelta(days=t)
+        dow = day.weekday()
+        y = Y[t]
+        f = level + seasonal[dow]
+        e = y - f
+        if state.steps >= WARMUP_DAYS:
+            sse += e * e
+            ctx = contexts.get(day)
+            if ctx is not None:
+                if ctx not in actual:
+                    actual[ctx] = np.zeros_like(f)
+                    fitted[ctx] = np.zeros_like(f)
+                actual[ctx] += y
+                fitted[ctx] += np.maximum(f, 0)
+        level += alpha * e
+        seasonal[dow] += GAMMA * e
+        state.steps += 1
+    return state.steps
+
+def fit_matrix(state: ForecastState, Y: np.ndarray, first: date, contexts: Dict[date, Context]) -> ForecastState:
+    """Fits `state` on Y, a (days, products) matrix starting at `first`. No database access."""
+    n_alpha, n = len(ALPHAS), Y.shape[1]
+    if len(Y) == 0:
+        return state
+
+    # Initial level: mean of the first weeks; seasonal: mean deviation per weekday
+    init = Y[:min(len(Y), 4 * SEASON)]
+    level0 = init.mean(axis=0)
+    seasonal0 = np.zeros((SEASON, n))
+    for k in range(SEASON):
+        rows = [i for i in range(len(init)) if (first + timedelta(days=i)).weekday() == k]
+        if rows:
+            seasonal0[k] = init[rows].mean(axis=0) - level0
+
+    level = np.tile(level0, (n_alpha, 1))
+    seasonal = np.tile(seasonal0[:, None, :], (1, n_alpha, 1))
+    alpha = ALPHAS[:, None]
+    sse = np.zeros((n_alpha, n))
+    actual, fitted = {}, {}
+    _fold(state, Y, first, contexts, level, seasonal, alpha, sse, actual, fitted)
+
+    best = sse.argmin(axis=0)
+    cols = np.arange(n)
+    state.alpha = ALPHAS[best]
+    state.level = level[best, cols]
+    state.seasonal = seasonal[:, best, cols]
+    state.sse = sse[best, cols]
+    state.errors = max(state.steps - WARMUP_DAYS, 0)
+    state.actual = {c: a[best, cols] for c, a in actual.items()}
+    state.fitted = {c: f[best, cols] for c, f in fitted.items()}
+    state.last_day = first + timedelta(days=len(Y) - 1)
+    return state
+
+def predict_matrix(state: ForecastState, start: date, days: int, contexts: Dict[date, Context]) -> Tuple[np.ndarray, np.ndarray]:
+    """(qty, spread): (days, products) point forecasts from `start` and their 95% half-widths."""
+    horizon = [start + timedelta(days=h) for h in range(days)]
+    h = np.arange(1, days + 1)[:, None]
+    base = np.stack([state.level + state.seasonal[d.weekday()] for d in horizon])
+    mult = np.stack([state.multipliers(contexts[d]) if d in contexts else np.ones(len(state.product_ids)) for d in horizon])
+    qty = np.maximum(base * mult, 0)
+    spread = Z_95 * state.sigma()[None, :] * np.sqrt(1 + (h - 1) * state.alpha[None, :] ** 2) * mult
+    return qty, spread
+
+def _fit(db: Session, account_id: str, product_ids: List[str], today: date, contexts: Dict[date, Context]) -> ForecastState:
+    last = today - timedelta(days=1)
+    first_sale = db.query(func.min(core.Transaction.sales_date)).filter(
+        core.Transaction.account_id == account_id,
+        core.Transaction.sales_date >= today - timedelta(days=HISTORY_DAYS)
+    ).scalar()
+    state = ForecastState(product_ids, first_sale or today)
+    state.context_key = _context_key(contexts, last)
+    if first_sale is not None and product_ids:
+        fit_matrix(state, sales_matrix(db, account_id, state.column, first_sale, last), first_sale, contexts)
+    state.last_day = last
+    return state
+
+def _advance(db: Session, account_id: str, state: ForecastState, today: date, contexts: Dict[date, Context]):
+    """Folds the days completed since the last fit into the chosen per-product state."""
+    first, last = state.last_day + timedelta(days=1), today - timedelta(days=1)
+    if last < first:
+        return
+    Y = sales_matrix(db, account_id, state.column, first, last)
+    steps_before = state.steps
+    _fold(state, Y, first, contexts, state.level, state.seasonal, state.alpha, state.sse, state.actual, state.fitted)
+    state.errors += max(state.steps - max(steps_before, WARMUP_DAYS), 0)
+    state.last_day = last
+    state.context_key = _context_key(contexts, last)
+
+def get_state(db: Session, account_id: str, today: Optional[date] = None) -> Tuple[ForecastState, Dict[date, Context]]:
+    today = today or sales_dates.today(db, account_id)
+    product_ids = [r[0] for r in db.query(core.Product.id).filter(
+        core.Product.account_id == account_id
+    ).order_by(core.Product.id).all()]
+    contexts = load_contexts(db, account_id)
+
+    with _cache.lock():
+        state = _cache.get(account_id)
+        stale = (
+            state is None
+            or state.product_ids != product_ids
+            or state.context_key != _context_key(contexts, state.last_day)
+        )
+        if stale:
+            sales_dates.backfill(db, account_id)
+            state = _cache.set(account_id, None, _fit(db, account_id, product_ids, today, contexts))
+        else:
+            _advance(db, account_id, state, today, contexts)
+        return state, contexts
+
+def invalidate(account_id: str):
+    _cache.invalidate(account_id)
+
+def forecast(db: Session, account_id: str, days: int = 7, product_id: Optional[str] = None,
+             skip: int = 0, limit: Optional[int] = None) -> List[dict]:
+    """
+    Next `days` business days per product, with 95% intervals. Planned DailyContext rows
+    for future dates apply their weather/event multipliers. Sorted by forecast volume.
+    """
+    today = sales_dates.today(db, account_id)
+    state, contexts = get_state(db, account_id, today)
+    if not state.product_ids:
+        return []
+
+    horizon = [today + timedelta(days=h) for h in range(days)]
+    qty, spread = predict_matrix(state, today, days, contexts)
+    lower, upper = np.maximum(qty - spread, 0), qty + spread
+
+    if product_id is not None:
+        if product_id not in state.column:
+            return []
+        order = [state.column[product_id]]
+    else:
+        order = np.argsort(-qty.sum(axis=0), kind="stable")
+        order = order[skip:skip + limit] if limit else order[skip:]
+
+    names = dict(db.query(core.Product.id, core.Product.name).filter(
+        core.Product.account_id == account_id,
+        core.Product.id.in_([state.product_ids[i] for i in order])
+    ).all())
+    results = []
+    for i in order:
+        pid = state.product_ids[i]
+        results.append({
+            "product_id": pid,
+            "product_name": names.get(pid),
+            "alpha": float(state.alpha[i]),
+            "points": [{
+                "date": d,
+                "qty": float(qty[t, i]),
+                "lower": float(lower[t, i]),
+                "upper": float(upper[t, i]),
+                "weather_tag": contexts[d][0] if d in contexts else None,
+                "event_tag": contexts[d][1] if d in contexts else None,
+            } for t, d in enumerate(horizon)],
+        })
+    return results
@@ -0,0 +1,185 @@
+import math
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from backend.models import core
+from backend.cache import WATERMARK_OVERLAP, TenantCache, Watermark
+
+# GeoViz spatial aggregation.
+# Customers are binned into square lat/lng cells whose size halves per zoom level
+# (zoom 0 = one 360 degree cell). Each tenant keeps a per-customer sales base that is
+# folded forward from new transactions, and each zoom level's cell aggregate is
+# derived from it once and then updated with the same deltas.
+
+CITY_COORDS = {
+    "New York": (40.7128, -74.0060),
+    "Los Angeles": (34.0522, -118.2437),
+    "Chicago": (41.8781, -87.6298),
+    "Houston": (29.7604, -95.3698),
+    "Phoenix": (33.4484, -112.0740),
+    "Philadelphia": (39.9526, -75.1652),
+    "San Antonio": (29.4241, -98.4936),
+    "San Diego": (32.7157, -117.1611),
+    "Dallas": (32.7767, -96.7970),
+    "San Jose": (37.3382, -121.8863),
+    "Unknown": (39.8283, -98.5795) # Center of US approx
+}
+
+MAX_ZOOM = 18
+MAX_VIEWPORT_CELLS = 4096
+
+_cache = TenantCache()
+
+def resolve_coords(city: Optional[str], lat: Optional[float] = None, lng: Optional[float] = None) -> Tuple[float, float]:
+    if lat is not None and lng is not None:
+        return lat, lng
+    city_norm = city.strip() if city else "Unknown"
+    return CITY_COORDS.get(city_norm, (39.8283 + (len(city_norm)*0.1), -98.5795)) # Pseudo-random fallback
+
+def cell_size(zoom: int) -> float:
+    return 360.0 / (2 ** zoom)
+
+def cell_of(lat: float, lng: float, zoom: int) -> Tuple[int, int]:
+    size = cell_size(zoom)
+    return int(math.floor((lat + 90.0) / size)), int(math.floor((lng + 180.0) / size))
+
+
+class GeoIndex:
+    """Per-tenant customer sales base plus lazily derived zoom-level cell grids."""
+
+    def __init__(self):
+        self.customers: Dict[str, list] = {} # customer_id -> [lat, lng, sales]
+        self.grids: Dict[int, Dict[Tuple[int, int], list]] = {} # zoom -> cell -> [sales, customers]
+        self.total_sales = 0.0
+        self.watermark = Watermark()
+
+    def add_sales(self, customer_id: str, lat: float, lng: float, amount: float):
+        entry = self.customers.get(customer_id)
+        is_new = entry is None
+        if is_new:
+            entry = self.customers[customer_id] = [lat, lng, 0.0]
+        entry[2] += amount
+        self.total_sales += amount
+
+        for zoom, grid in self.grids.items():
+            cell = grid.setdefault(cell_of(entry[0], entry[1], zoom), [0.0, 0])
+            cell[0] += amount
+            if is_new:
+                cell[1] += 1
+
+    def grid(self, zoom: int) -> Dict[Tuple[int, int], list]:
+        grid = self.grids.get(zoom)
+        if grid is None:
+            grid = {}
+            for lat, lng, sales in self.customers.values():
+                cell = grid.setdefault(cell_of(lat, lng, zoom), [0.0, 0])
+                cell[0] += sales
+                cell[1] += 1
+            self.grids[zoom] = grid
+        return grid
+
+
+def _build(db: Session, account_id: str) -> GeoIndex:
+    index = GeoIndex()
+    latest = db.query(func.max(core.Transaction.timestamp)).filter(
+        core.Transaction.account_id == account_id
+    ).scalar()
+    if latest is None:
+        return index
+
+    rows = db.query(
+        core.Transaction.customer_id,
+        core.Customer.latitude,
+        core.Customer.longitude,
+        core.Customer.city,
+        func.sum(core.Transaction.total_amount),
+    ).join(core.Customer, core.Customer.id == core.Transaction.customer_id).filter(
+        core.Transaction.account_id == account_id,
+        core.Transaction.timestamp <= latest
+    ).group_by(
+        core.Transaction.customer_id, core.Customer.latitude, core.Customer.longitude, core.Customer.city
+    ).all()
+
+    for customer_id, lat, lng, city, sales in rows:
+        c_lat, c_lng = resolve_coords(city, lat, lng)
+        index.add_sales(customer_id, c_lat, c_lng, sales or 0.0)
+
+    index.watermark = Watermark(latest, (tuple(r) for r in db.query(core.Transaction.id, core.Transaction.timestamp).filter(
+        core.Transaction.account_id == account_id,
+        core.Transaction.timestamp.between(latest - WATERMARK_OVERLAP, latest)
+    ).all()))
+    return index
+
+def _refresh(db: Session, account_id: str, index: GeoIndex):
+    """Folds transactions newer than the watermark into the index (timestamp index range scan)."""
+    query = db.query(
+        core.Transaction.id,
+        core.Transaction.timestamp,
+        core.Transaction.total_amount,
+        core.Transaction.customer_id,
+        core.Customer.latitude,
+        core.Customer.longitude,
+        core.Customer.city,
+    ).join(core.Customer, core.Customer.id == core.Transaction.customer_id).filter(
+        core.Transaction.account_id == account_id
+    )
+    since = index.watermark.since()
+    if since is not None:
+        query = query.filter(core.Transaction.timestamp >= since)
+
+    rows = [r for r in query.order_by(core.Transaction.timestamp).all() if index.watermark.accepts(r[1], r[0])]
+    for txn_id, ts, amount, customer_id, lat, lng, city in rows:
+        c_lat, c_lng = resolve_coords(city, lat, lng)
+        index.add_sales(customer_id, c_lat, c_lng, amount or 0.0)
+        index.watermark.advance(ts, txn_id)
+
+def get_index(db: Session, account_id: str) -> GeoIndex:
+    with _cache.lock():
+        index = _cache.get(account_id)
+        if index is None:
+            return _cache.set(account_id, None, _build(db, account_id))
+        _refresh(db, account_id, index)
+        return index
+
+def invalidate(account_id: str):
+    _cache.invalidate(account_id)
+
+def effective_zoom(zoom: int, min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> int:
+    """Coarsens the requested zoom until the viewport spans at most MAX_VIEWPORT_CELLS cells."""
+    zoom = max(0, min(MAX_ZOOM, zoom))
+    while zoom > 0:
+        r0, c0 = cell_of(min_lat, min_lng, zoom)
+        r1, c1 = cell_of(max_lat, max_lng, zoom)
+        if (r1 - r0 + 1) * (c1 - c0 + 1) <= MAX_VIEWPORT_CELLS:
+            break
+        zoom -= 1
+    return zoom
+
+def grid_cells(db: Session, account_id: str, zoom: int,
+               min_lat: float = -90.0, min_lng: float = -180.0,
+               max_lat: float = 90.0, max_lng: float = 180.0) -> Tuple[int, List[dict]]:
+    """
+    Returns (effective_zoom, cells) for the cells intersecting the viewport.
+    Work is bounded by the number of cells in view, never by the customer count.
+    """
+    zoom = effective_zoom(zoom, min_lat, min_lng, max_lat, max_lng)
+    grid = get_index(db, account_id).grid(zoom)
+    size = cell_size(zoom)
+
+    r0, c0 = cell_of(min_lat, min_lng, zoom)
+    r1, c1 = cell_of(max_lat, max_lng, zoom)
+    if (r1 - r0 + 1) * (c1 - c0 + 1) < len(grid):
+        keys = ((r, c) for r in range(r0, r1 + 1) for c in range(c0, c1 + 1) if (r, c) in grid)
+    else:
+        keys = (k for k in grid if r0 <= k[0] <= r1 and c0 <= k[1] <= c1)
+
+    cells = []
+    for r, c in keys:
+        sales, customers = grid[(r, c)]
+        cells.append({
+            "lat": -90.0 + (r + 0.5) * size,
+            "lng": -180.0 + (c + 0.5) * size,
+            "value": sales,
+            "customers": customers,
+        })
+    return zoom, cells
@@ -0,0 +1,22 @@
+from datetime import date, datetime
+from typing import Optional
+from sqlalchemy.orm import Session
+from backend.models import core
+
+# Last business day each per-tenant background job ran for. Stored in job_runs rather
+# than settings, so tenants can neither see nor edit it.
+
+def last_run(db: Session, account_id: str, job: str) -> Optional[date]:
+    return db.query(core.JobRun.run_on).filter(
+        core.JobRun.account_id == account_id,
+        core.JobRun.job == job
+    ).scalar()
+
+def mark_run(db: Session, account_id: str, job: str, run_on: date):
+    """Records a completed run. Caller commits."""
+    row = db.get(core.JobRun, (account_id, job))
+    if row is None:
+        row = core.JobRun(account_id=account_id, job=job)
+        db.add(row)
+    row.run_on = run_on
+    row.updated_at = datetime.utcnow()
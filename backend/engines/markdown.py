@@ -0,0 +1,142 @@
+import json
+import logging
+from bisect import bisect_right
+from datetime import date, timedelta
+from typing import List, Optional, Tuple
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from backend.models import core
+from backend.cache import TenantCache
+from backend.engines import sales_dates
+
+# FreshFlow markdown pricing.
+# Batches with stock that expire within MAX_LOOKAHEAD_DAYS are read in one join with
+# their products (a range scan on ix_product_batches_account_expiry_qty) and priced in
+# one vectorized pass: days left are matched against the tenant's tiers with
+# searchsorted, so the cost per batch is the same however many tiers there are.
+# The priced window is cached per tenant until the business day rolls over or the
+# batches, prices or tier rules change (the newest batch/product updated_at catches
+# edits that keep counts and sums); requests only slice it by lookahead.
+
+# Tenants can replace these with the "markdown_tiers" setting: [[max_days_left, discount_pct], ...]
+DEFAULT_TIERS = ((2, 50.0), (5, 30.0), (10, 10.0))
+TIERS_SETTING_KEY = "markdown_tiers"
+MAX_LOOKAHEAD_DAYS = 30
+
+_cache = TenantCache()
+
+Tiers = Tuple[Tuple[int, float], ...]
+
+def parse_tiers(raw: Optional[str]) -> Tiers:
+    """Tiers sorted by days left. Raises ValueError for malformed rules."""
+    try:
+        tiers = tuple(sorted((int(days), float(pct)) for days, pct in json.loads(raw)))
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"{TIERS_SETTING_KEY} must be a list of [max_days_left, discount_pct] pairs") from e
+    if not tiers:
+        raise ValueError(f"{TIERS_SETTING_KEY} needs at least one tier")
+    if any(not 0 <= days <= MAX_LOOKAHEAD_DAYS or not 0 < pct <= 100 for days, pct in tiers):
+        raise ValueError(f"tiers need 0 <= max_days_left <= {MAX_LOOKAHEAD_DAYS} and 0 < discount_pct <= 100")
+    if len({days for days, _ in tiers}) != len(tiers):
+        raise ValueError("tier days must be unique")
+    return tiers
+
+def get_tiers(db: Session, account_id: str) -> Tiers:
+    raw = db.query(core.Setting.value).filter(
+        core.Setting.account_id == account_id,
+        core.Setting.key == TIERS_SETTING_KEY
+    ).scalar()
+    if not raw:
+        return DEFAULT_TIERS
+    try:
+        return parse_tiers(raw)
+    except ValueError as e:
+        logging.getLogger("uvicorn").warning(f"Ignoring invalid {TIERS_SETTING_KEY} for {account_id}: {e}")
+        return DEFAULT_TIERS
+
+def discounts(days_left: np.ndarray, tiers: Tiers) -> np.ndarray:
+    """Discount % per batch: the first tier whose max_days_left covers it, 0 past the last tier or once expired."""
+    limits = np.array([days for days, _ in tiers])
+    pcts = np.append([pct for _, pct in tiers], 0.0)
+    pct = pcts[np.searchsorted(limits, days_left, side="left")]
+    return np.where(days_left < 0, 0.0, pct)
+
+def _window(account_id: str, today: date):
+    return (
+        core.ProductBatch.account_id == account_id,
+        core.ProductBatch.expiry_date <= today + timedelta(days=MAX_LOOKAHEAD_DAYS),
+        core.ProductBatch.quantity > 0
+    )
+
+def _fingerprint(db: Session, account_id: str, today: date, tiers: Tiers):
+    count, qty, last_created, prices, batch_updated, product_updated = db.query(
+        func.count(core.ProductBatch.id),
+        func.sum(core.ProductBatch.quantity),
+        func.max(core.ProductBatch.created_at),
+        func.sum(core.Product.price),
+        func.max(core.ProductBatch.updated_at),
+        func.max(core.Product.updated_at)
+    ).outerjoin(core.Product, core.Product.id == core.ProductBatch.product_id).filter(
+        *_window(account_id, today)
+    ).one()
+    return (today, count, qty, str(last_created), prices, str(batch_updated), str(product_updated), tiers)
+
+def _price(db: Session, account_id: str, today: date, tiers: Tiers) -> List[dict]:
+    rows = db.query(
+        core.ProductBatch.id,
+        core.ProductBatch.product_id,
+        core.ProductBatch.batch_code,
+        core.ProductBatch.expiry_date,
+        core.ProductBatch.quantity,
+        core.ProductBatch.cost_price,
+        core.Product.name,
+        core.Product.price
+    ).outerjoin(core.Product, core.Product.id == core.ProductBatch.product_id).filter(
+        *_window(account_id, today)
+    ).order_by(core.ProductBatch.expiry_date, core.ProductBatch.id).all()
+    if not rows:
+        return []
+
+    days_left = np.array([(r.expiry_date - today).days for r in rows])
+    qty = np.array([r.quantity for r in rows], dtype=float)
+    cost = np.array([r.cost_price or 0.0 for r in rows])
+    price = np.array([r.price or 0.0 for r in rows])
+    pct = discounts(days_left, tiers)
+    new_price = np.round(price * (1 - pct / 100), 2)
+
+    return [{
+        "batch_id": r.id,
+        "product_id": r.product_id,
+        "product_name": r.name or "Unknown",
+        "batch_code": r.batch_code,
+        "expiry_date": r.expiry_date,
+        "quantity": r.quantity,
+        "cost_price": float(cost[i]),
+        "days_left": int(days_left[i]),
+        "expired": bool(days_left[i] < 0),
+        "suggested_discount": float(pct[i]),
+        "current_price": float(price[i]),
+        "new_price": float(new_price[i]),
+        "total_risk": float(qty[i] * cost[i]),
+    } for i, r in enumerate(rows)]
+
+def get_markdowns(db: Session, account_id: str, lookahead: Optional[int] = None) -> List[dict]:
+    """
+    Batches expiring within `lookahead` days (default: the last tier), soonest first,
+    with their suggested discount and marked-down price. Expired stock is included
+    without a discount so it can be written off.
+    """
+    today = sales_dates.today(db, account_id)
+    tiers = get_tiers(db, account_id)
+    if lookahead is None:
+        lookahead = tiers[-1][0]
+
+    fingerprint = _fingerprint(db, account_id, today, tiers)
+    cached = _cache.get(account_id)
+    if cached is None or cached[0] != fingerprint:
+        priced = _price(db, account_id, today, tiers)
+        cached = _cache.set(account_id, None, (fingerprint, priced, [m["days_left"] for m in priced]))
+    # Sorted by expiry, so the window is a prefix
+    _, priced, days_left = cached
+    return priced[:bisect_right(days_left, lookahead)]
@@ -0,0 +1,91 @@
+from collections import Counter
+from datetime import date, datetime
+from typing import List, Optional
+from sqlalchemy import case, insert, update
+from sqlalchemy.orm import Session
+from backend.models import core
+from backend.crud.base import generate_unique_id
+from backend.engines import expiry, sales_dates, scorecards
+
+# FreshFlow goods receipts (GRN).
+# A delivery is received against its PurchaseOrder in one transaction: every line
+# becomes a ProductBatch in a single multi-row INSERT, stock moves with one set-based
+# UPDATE of the per-product totals (scoped to the tenant), and the PO is marked
+# RECEIVED with the date VendorTrust scores punctuality on, folding it into the
+# supplier's scorecard. The new batches are then placed in the expiry calendar.
+
+PENDING = "PENDING"
+RECEIVED = "RECEIVED"
+
+class ReceiptError(ValueError):
+    pass
+
+def receive(db: Session, account_id: str, po_id: str, lines: List, received_date: Optional[date] = None,
+            quality_rating: Optional[float] = None) -> Optional[dict]:
+    """Receives a delivery against a PO. Returns None for an unknown PO, raises ReceiptError for bad input."""
+    po = db.query(core.PurchaseOrder).filter(
+        core.PurchaseOrder.id == po_id,
+        core.PurchaseOrder.account_id == account_id
+    ).with_for_update().first()
+    if po is None:
+        return None
+    if po.status == RECEIVED:
+        raise ReceiptError(f"Purchase order {po_id} was already received on {po.received_date}")
+    if po.status != PENDING:
+        raise ReceiptError(f"Purchase order {po_id} is {po.status}; place it before receiving")
+    if not lines:
+        raise ReceiptError("A goods receipt needs at least one line")
+    if any(l.quantity <= 0 for l in lines):
+        raise ReceiptError("Received quantities must be positive")
+    if quality_rating is not None and not 0 <= quality_rating <= 5:
+        raise ReceiptError("quality_rating must be between 0 and 5")
+
+    units = Counter()
+    for l in lines:
+        units[l.product_id] += l.quantity
+    known = {r[0] for r in db.query(core.Product.id).filter(
+        core.Product.account_id == account_id,
+        core.Product.id.in_(list(units))
+    ).all()}
+    unknown = sorted(set(units) - known)
+    if unknown:
+        raise ReceiptError(f"Unknown products: {', '.join(unknown)}")
+
+    now = datetime.utcnow()
+    batches = [{
+        "id": generate_unique_id(),
+        "account_id": account_id,
+        "product_id": l.product_id,
+        "purchase_order_id": po_id,
+        "batch_code": l.batch_code,
+        "expiry_date": l.expiry_date,
+        "quantity": l.quantity,
+        "cost_price": l.cost_price,
+        "created_at": now,
+    } for l in lines]
+    try:
+        db.execute(insert(core.ProductBatch), batches)
+        db.execute(
+            update(core.Product)
+            .where(core.Product.account_id == account_id, core.Product.id.in_(list(units)))
+            .values(stock_quantity=core.Product.stock_quantity + case(dict(units), value=core.Product.id, else_=0))
+            .execution_options(synchronize_session=False)
+        )
+        po.status = RECEIVED
+        po.received_date = received_date or sales_dates.today(db, account_id)
+        if quality_rating is not None:
+            po.quality_rating = quality_rating
+        scorecards.record_receipt(db, po)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    expiry.sweep(db, account_id, batch_ids=[b["id"] for b in batches])
+    db.refresh(po)
+    return {
+        "purchase_order": po,
+        "batches": len(batches),
+        "units": sum(units.values()),
+        "products": len(units),
+    }
@@ -0,0 +1,269 @@
+import logging
+import threading
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Callable, Dict, List, Optional
+import numpy as np
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+from backend.models import core
+from backend.crud.base import generate_unique_id
+from backend.engines import job_runs, sales_dates, scorecards, velocity
+
+# Automated replenishment.
+# Every product of a tenant is evaluated in one vectorized pass: daily demand mean and
+# spread come from the velocity rollup over the last HISTORY_DAYS complete days, lead
+# time from the scorecard of the supplier that last delivered the product, and stock
+# position is stock on hand plus units on open (PENDING) POs. A product is ordered from
+# its default supplier if set, else from whoever last delivered or was last sent a PO
+# line for it, else from a supplier specialising in its category.
+#   reorder point = mean x lead + safety,  safety = SERVICE_Z x sd x sqrt(lead)
+#   order-up-to   = mean x (lead + REVIEW_DAYS) + safety
+# Products at or below their reorder point are ordered up to target, rounded up to
+# whole packs, and grouped into one DRAFT purchase order per supplier. A background
+# job regenerates each tenant's drafts once per business day.
+
+HISTORY_DAYS = 28
+REVIEW_DAYS = 7 # days between ordering opportunities
+DEFAULT_LEAD_DAYS = 7.0 # suppliers without measured receipts
+SERVICE_Z = 1.65 # ~95% cycle service level
+DRAFT = "DRAFT"
+OPEN = "PENDING"
+JOB = "replenishment"
+RUN_INTERVAL_S = 300
+
+logger = logging.getLogger("uvicorn")
+
+_run_lock = threading.Lock()
+_stop = threading.Event()
+_worker: Optional[threading.Thread] = None
+
+def _demand(db: Session, account_id: str, today: date, columns: Dict[str, int]) -> np.ndarray:
+    """(HISTORY_DAYS, products) units sold per complete day, from the velocity rollup."""
+    first = today - timedelta(days=HISTORY_DAYS)
+    Y = np.zeros((HISTORY_DAYS, len(columns)))
+    rollup = velocity.get_rollup(db, account_id, today)
+    for product_id, days in rollup.daily.items():
+        col = columns.get(product_id)
+        if col is None:
+            continue
+        for day, units in days.items():
+            if first <= day < today:
+                Y[(day - first).days, col] += units
+    return Y
+
+def _latest(rows) -> Dict[str, str]:
+    """product_id -> supplier_id of the most recent (product, supplier, date) row."""
+    latest = {}
+    for product_id, supplier_id, day in rows:
+        if product_id not in latest or (day or date.min) > latest[product_id][1]:
+            latest[product_id] = (supplier_id, day or date.min)
+    return {pid: sid for pid, (sid, _) in latest.items()}
+
+def _suppliers(db: Session, account_id: str, products: List) -> Dict[str, str]:
+    """product_id -> supplier to order it from (see the header for the order of preference)."""
+    received = _latest(db.query(
+        core.ProductBatch.product_id, core.PurchaseOrder.supplier_id, func.max(core.PurchaseOrder.received_date)
+    ).join(core.PurchaseOrder, core.PurchaseOrder.id == core.ProductBatch.purchase_order_id).filter(
+        core.ProductBatch.account_id == account_id,
+        core.PurchaseOrder.supplier_id.isnot(None)
+    ).group_by(core.ProductBatch.product_id, core.PurchaseOrder.supplier_id).all())
+    ordered = _latest(db.query(
+        core.PurchaseOrderLine.product_id, core.PurchaseOrder.supplier_id, func.max(core.PurchaseOrder.order_date)
+    ).join(core.PurchaseOrder, core.PurchaseOrder.id == core.PurchaseOrderLine.purchase_order_id).filter(
+        core.PurchaseOrder.account_id == account_id,
+        core.PurchaseOrder.status != DRAFT,
+        core.PurchaseOrder.supplier_id.isnot(None)
+    ).group_by(core.PurchaseOrderLine.product_id, core.PurchaseOrder.supplier_id).all())
+
+    suppliers = db.query(core.Supplier.id, core.Supplier.category_specialty).filter(
+        core.Supplier.account_id == account_id
+    ).order_by(core.Supplier.name, core.Supplier.id).all()
+    known = {sid for sid, _ in suppliers}
+    by_category = {}
+    for sid, specialty in suppliers:
+        if specialty:
+            by_category.setdefault(specialty.strip().lower(), sid)
+
+    chosen = {}
+    for p in products:
+        default = p.supplier_id if p.supplier_id in known else None
+        sid = default or received.get(p.id) or ordered.get(p.id) or by_category.get((p.category or "").strip().lower())
+        if sid is not None:
+            chosen[p.id] = sid
+    return chosen
+
+def _on_order(db: Session, account_id: str) -> Dict[str, int]:
+    return dict(db.query(core.PurchaseOrderLine.product_id, func.sum(core.PurchaseOrderLine.quantity)).join(
+        core.PurchaseOrder, core.PurchaseOrder.id == core.PurchaseOrderLine.purchase_order_id
+    ).filter(
+        core.PurchaseOrder.account_id == account_id,
+        core.PurchaseOrder.status == OPEN
+    ).group_by(core.PurchaseOrderLine.product_id).all())
+
+def plan(db: Session, account_id: str, today: Optional[date] = None) -> List[dict]:
+    """Order suggestions for every product at or below its reorder point, largest order value first."""
+    today = today or sales_dates.today(db, account_id)
+    products = db.query(
+        core.Product.id, core.Product.name, core.Product.category, core.Product.stock_quantity, core.Product.cost_price,
+        core.Product.pack_size, core.Product.supplier_id
+    ).filter(core.Product.account_id == account_id).order_by(core.Product.id).all()
+    if not products:
+        return []
+    columns = {p.id: i for i, p in enumerate(products)}
+    supplier_of = _suppliers(db, account_id, products)
+    lead_of = scorecards.lead_times(db, account_id)
+    on_order_of = _on_order(db, account_id)
+
+    Y = _demand(db, account_id, today, columns)
+    mean = Y.mean(axis=0)
+    sd = Y.std(axis=0, ddof=1)
+    lead = np.array([lead_of.get(supplier_of.get(p.id), DEFAULT_LEAD_DAYS) for p in products])
+    stock = np.array([p.stock_quantity or 0 for p in products], dtype=float)
+    on_order = np.array([on_order_of.get(p.id) or 0 for p in products], dtype=float)
+    pack = np.array([max(p.pack_size or 1, 1) for p in products], dtype=float)
+
+    safety = SERVICE_Z * sd * np.sqrt(lead)
+    reorder_point = mean * lead + safety
+    target = mean * (lead + REVIEW_DAYS) + safety
+    position = stock + on_order
+    shortfall = np.maximum(target - position, 0)
+    qty = np.ceil(shortfall / pack) * pack
+    due = (mean > 0) & (position <= reorder_point) & (qty > 0)
+
+    suggestions = []
+    for i in np.flatnonzero(due):
+        p = products[i]
+        suggestions.append({
+            "product_id": p.id,
+            "product_name": p.name,
+            "supplier_id": supplier_of.get(p.id),
+            "stock_quantity": int(stock[i]),
+            "on_order": int(on_order[i]),
+            "daily_demand": float(mean[i]),
+            "lead_days": float(lead[i]),
+            "safety_stock": float(safety[i]),
+            "reorder_point": float(reorder_point[i]),
+            "order_up_to": float(target[i]),
+            "pack_size": int(pack[i]),
+            "order_qty": int(qty[i]),
+            "unit_cost": p.cost_price or 0.0,
+        })
+    suggestions.sort(key=lambda s: (-s["order_qty"] * s["unit_cost"], s["product_id"]))
+    return suggestions
+
+def run(db: Session, account_id: str, today: Optional[date] = None) -> dict:
+    """Replaces the tenant's DRAFT purchase orders with one per supplier from the current plan. Commits."""
+    today = today or sales_dates.today(db, account_id)
+    with _run_lock:
+        suggestions = plan(db, account_id, today)
+        drafts = select(core.PurchaseOrder.id).where(
+            core.PurchaseOrder.account_id == account_id,
+            core.PurchaseOrder.status == DRAFT
+        )
+        db.execute(delete(core.PurchaseOrderLine).where(core.PurchaseOrderLine.purchase_order_id.in_(drafts)))
+        db.execute(delete(core.PurchaseOrder).where(core.PurchaseOrder.account_id == account_id, core.PurchaseOrder.status == DRAFT))
+
+        by_supplier = defaultdict(list)
+        for s in suggestions:
+            if s["supplier_id"] is not None:
+                by_supplier[s["supplier_id"]].append(s)
+        orders, lines = [], []
+        for supplier_id, items in sorted(by_supplier.items()):
+            po_id = generate_unique_id()
+            lead = max(s["lead_days"] for s in items)
+            orders.append({"id": po_id, "account_id": account_id, "supplier_id": supplier_id, "order_date": today,
+                           "expected_date": today + timedelta(days=int(np.ceil(lead))), "status": DRAFT,
+                           "notes": f"Replenishment suggestion for {len(items)} products"})
+            lines.extend({"id": generate_unique_id(), "purchase_order_id": po_id, "account_id": account_id,
+                          "product_id": s["product_id"], "quantity": s["order_qty"], "unit_cost": s["unit_cost"]}
+                         for s in items)
+        if orders:
+            db.execute(insert(core.PurchaseOrder), orders)
+            db.execute(insert(core.PurchaseOrderLine), lines)
+
+        job_runs.mark_run(db, account_id, JOB, today)
+        db.commit()
+
+    return {
+        "run_on": today,
+        "suggestions": len(suggestions),
+        "draft_orders": [o["id"] for o in orders],
+        "unassigned": [s["product_id"] for s in suggestions if s["supplier_id"] is None],
+    }
+
+def get_drafts(db: Session, account_id: str) -> List[dict]:
+    orders = db.query(core.PurchaseOrder).filter(
+        core.PurchaseOrder.account_id == account_id,
+        core.PurchaseOrder.status == DRAFT
+    ).order_by(core.PurchaseOrder.supplier_id).all()
+    lines = defaultdict(list)
+    for line, name in db.query(core.PurchaseOrderLine, core.Product.name).outerjoin(
+        core.Product, core.Product.id == core.PurchaseOrderLine.product_id
+    ).filter(
+        core.PurchaseOrderLine.purchase_order_id.in_([o.id for o in orders])
+    ).order_by(core.PurchaseOrderLine.product_id).all():
+        lines[line.purchase_order_id].append({"product_id": line.product_id, "product_name": name,
+                                              "quantity": line.quantity, "unit_cost": line.unit_cost})
+    return [{"purchase_order": o, "lines": lines[o.id],
+             "total_cost": sum(l["quantity"] * (l["unit_cost"] or 0.0) for l in lines[o.id])} for o in orders]
+
+def place(db: Session, account_id: str, po_id: str) -> Optional[core.PurchaseOrder]:
+    """Turns a draft into an open order, whose lines then count as stock on order. Raises ValueError."""
+    po = db.query(core.PurchaseOrder).filter(
+        core.PurchaseOrder.id == po_id,
+        core.PurchaseOrder.account_id == account_id
+    ).first()
+    if po is None:
+        return None
+    if po.status != DRAFT:
+        raise ValueError(f"Purchase order {po_id} is {po.status}, not a draft")
+    today = sales_dates.today(db, account_id)
+    if po.order_date is not None and po.expected_date is not None:
+        po.expected_date += today - po.order_date
+    po.status = OPEN
+    po.order_date = today
+    db.commit()
+    db.refresh(po)
+    return po
+
+def run_due(db: Session) -> int:
+    """Runs every tenant that hasn't been planned for its current business day."""
+    ran = 0
+    for account_id, in db.query(core.Account.id).all():
+        today = sales_dates.today(db, account_id)
+        if job_runs.last_run(db, account_id, JOB) != today:
+            run(db, account_id, today)
+            ran += 1
+    return ran
+
+def _run(session_factory: Callable[[], Session], interval: float):
+    while True:
+        db = session_factory()
+        try:
+            ran = run_due(db)
+            if ran:
+                logger.info(f"Replenishment planned {ran} tenants")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Replenishment run failed: {e}")
+        finally:
+            db.close()
+        if _stop.wait(interval):
+            return
+
+def start(session_factory: Callable[[], Session], interval: float = RUN_INTERVAL_S):
+    """Starts the daily replenishment job (idempotent)."""
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        return
+    _stop.clear()
+    _worker = threading.Thread(target=_run, args=(session_factory, interval), name="replenishment", daemon=True)
+    _worker.start()
+
+def shutdown():
+    global _worker
+    _stop.set()
+    if _worker is not None:
+        _worker.join(timeout=5)
+        _worker = None
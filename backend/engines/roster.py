@@ -0,0 +1,245 @@
+import json
+import logging
+import math
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from backend.models import core
+from backend.cache import TenantCache
+from backend.engines import forecast, sales_dates
+
+# ShiftSmart roster solver.
+# Staffing needs come from demand: an hourly transaction profile per weekday (local
+# time, last PROFILE_DAYS days) is scaled by the ratio of IsoBar's forecast units for
+# the day to that weekday's historical average, then turned into staff per hour at
+# TXNS_PER_STAFF_HOUR. A slot needs enough staff for its busiest hour.
+# Assignment is a greedy min-cost heuristic: slots are filled tightest first (fewest
+# eligible staff per required head), each with the cheapest eligible staff, ties going
+# to whoever has worked least; nobody works two slots a day, beyond max weekly hours or
+# across a shift they already have (including overnight ones from the day before).
+# Applying a plan is done by the caller through the guarded shift write path.
+
+# Tenants can replace these with the "shift_slots" setting: {"name": [start_hour, end_hour]}
+DEFAULT_SLOTS = {
+    "Morning (9AM-2PM)": (9, 14),
+    "Evening (2PM-9PM)": (14, 21),
+}
+SLOTS_SETTING_KEY = "shift_slots"
+PROFILE_DAYS = 56
+TXNS_PER_STAFF_HOUR = 12
+MIN_STAFF_PER_SLOT = 1
+MAX_WEEKLY_HOURS = 48
+UNKNOWN_SLOT_HOURS = 5
+
+_cache = TenantCache()
+
+def get_slots(db: Session, account_id: str) -> Dict[str, Tuple[int, int]]:
+    raw = db.query(core.Setting.value).filter(
+        core.Setting.account_id == account_id,
+        core.Setting.key == SLOTS_SETTING_KEY
+    ).scalar()
+    if not raw:
+        return dict(DEFAULT_SLOTS)
+    try:
+        slots = {name: (int(start), int(end)) for name, (start, end) in json.loads(raw).items()}
+        if not slots or any(not 0 <= s < e <= 24 for s, e in slots.values()):
+            raise ValueError("hours must satisfy 0 <= start < end <= 24")
+        return slots
+    except (ValueError, TypeError, AttributeError) as e:
+        logging.getLogger("uvicorn").warning(f"Ignoring invalid {SLOTS_SETTING_KEY} for {account_id}: {e}")
+        return dict(DEFAULT_SLOTS)
+
+def slot_window(name: str, slots: Dict[str, Tuple[int, int]]) -> Optional[Tuple[int, int]]:
+    """(start_hour, end_hour) of a slot; hand-entered names like "Morning" match the slot they start."""
+    if name in slots:
+        return slots[name]
+    word = (name or "").split(" ")[0].lower()
+    for slot, window in slots.items():
+        if word and slot.lower().startswith(word):
+            return window
+    return None
+
+def slot_hours(name: str, slots: Dict[str, Tuple[int, int]]) -> int:
+    window = slot_window(name, slots)
+    return window[1] - window[0] if window else UNKNOWN_SLOT_HOURS
+
+def shift_times(day: date, name: str, slots: Dict[str, Tuple[int, int]]) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """Local start/end datetimes of a slot on a day, or (None, None) for an unknown slot."""
+    window = slot_window(name, slots)
+    if window is None:
+        return None, None
+    start = datetime.combine(day, time()) + timedelta(hours=window[0])
+    return start, datetime.combine(day, time()) + timedelta(hours=window[1])
+
+def hourly_profile(db: Session, account_id: str, today: date) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (profile, units): profile[weekday, hour] is average transactions in that local hour,
+    units[weekday] the average units sold per day. Cached per tenant per day.
+    """
+    cached = _cache.get(account_id, ("profile", today))
+    if cached is not None:
+        return cached
+
+    first = today - timedelta(days=PROFILE_DAYS)
+    sales_dates.backfill(db, account_id)
+    tz = sales_dates.get_timezone(db, account_id)
+    counts = np.zeros((7, 24))
+    for ts, in db.query(core.Transaction.timestamp).filter(
+        core.Transaction.account_id == account_id,
+        core.Transaction.sales_date >= first,
+        core.Transaction.sales_date < today
+    ).all():
+        local = ts.replace(tzinfo=timezone.utc).astimezone(tz)
+        counts[local.weekday(), local.hour] += 1
+
+    units = np.zeros(7)
+    for day, qty in db.query(core.Transaction.sales_date, func.sum(core.TransactionItem.quantity)).join(
+        core.TransactionItem, core.TransactionItem.transaction_id == core.Transaction.id
+    ).filter(
+        core.Transaction.account_id == account_id,
+        core.Transaction.sales_date >= first,
+        core.Transaction.sales_date < today
+    ).group_by(core.Transaction.sales_date).all():
+        units[day.weekday()] += qty or 0
+
+    weekdays = np.zeros(7)
+    for i in range(PROFILE_DAYS):
+        weekdays[(first + timedelta(days=i)).weekday()] += 1
+    result = (counts / weekdays[:, None], units / weekdays)
+    # Keep only today's entry for the tenant
+    _cache.invalidate(account_id, ("profile", today - timedelta(days=1)))
+    return _cache.set(account_id, ("profile", today), result)
+
+def _forecast_units(db: Session, account_id: str, today: date, days: List[date]) -> Dict[date, float]:
+    future = [d for d in days if d >= today]
+    if not future:
+        return {}
+    state, contexts = forecast.get_state(db, account_id, today)
+    if not state.product_ids:
+        return {}
+    horizon = (max(future) - today).days + 1
+    qty, _ = forecast.predict_matrix(state, today, horizon, contexts)
+    totals = qty.sum(axis=1)
+    return {d: float(totals[(d - today).days]) for d in future}
+
+def requirements(db: Session, account_id: str, start: date, days: int) -> List[dict]:
+    """Staff needed per (date, slot), with the expected transactions behind the number."""
+    today = sales_dates.today(db, account_id)
+    slots = get_slots(db, account_id)
+    profile, avg_units = hourly_profile(db, account_id, today)
+    dates = [start + timedelta(days=i) for i in range(days)]
+    forecast_units = _forecast_units(db, account_id, today, dates)
+
+    needs = []
+    for d in dates:
+        wd = d.weekday()
+        scale = 1.0
+        if d in forecast_units and avg_units[wd] > 0:
+            scale = forecast_units[d] / avg_units[wd]
+        hourly = profile[wd] * scale
+        for name, (h0, h1) in slots.items():
+            peak = float(hourly[h0:h1].max()) if h1 > h0 else 0.0
+            t0, t1 = shift_times(d, name, slots)
+            needs.append({
+                "date": d,
+                "slot": name,
+                "hours": h1 - h0,
+                "start_time": t0,
+                "end_time": t1,
+                "expected_txns": float(hourly[h0:h1].sum()),
+                "peak_txns_per_hour": peak,
+                "required": max(MIN_STAFF_PER_SLOT, math.ceil(peak / TXNS_PER_STAFF_HOUR)),
+            })
+    return needs
+
+def solve(needs: List[dict], staff: List[Tuple[str, float]], existing: Dict[Tuple[date, str], List[str]],
+          worked_hours: Dict[str, float], busy_days: Dict[str, set], max_hours: float = MAX_WEEKLY_HOURS,
+          booked: Optional[Dict[str, List[Tuple[datetime, datetime]]]] = None) -> List[dict]:
+    """
+    Greedy min-cost assignment. `staff` is [(staff_id, hourly_rate)]; `existing` holds
+    staff already rostered per (date, slot), counted towards the requirement; hours and
+    busy days include existing shifts. `booked` holds each person's stored shift
+    intervals, which no assigned slot may overlap. max_hours caps each person over the
+    whole plan (a week by default). Returns the needs with assigned staff and cost.
+    """
+    hours = defaultdict(float, worked_hours)
+    days_off = defaultdict(set, {k: set(v) for k, v in busy_days.items()})
+    booked = booked or {}
+    rate = dict(staff)
+
+    def free(sid, need):
+        t0, t1 = need.get("start_time"), need.get("end_time")
+        return t0 is None or not any(b0 < t1 and t0 < b1 for b0, b1 in booked.get(sid, ()))
+
+    def eligible(need):
+        return [sid for sid, _ in staff if need["date"] not in days_off[sid] and hours[sid] + need["hours"] <= max_hours
+                and free(sid, need)]
+
+    plan = []
+    for need in needs:
+        already = existing.get((need["date"], need["slot"]), [])
+        plan.append(dict(need, assigned=[], existing=list(already), open=max(need["required"] - len(already), 0)))
+
+    # Tightest slots first: least slack between eligible staff and open heads
+    pending = [p for p in plan if p["open"] > 0]
+    while pending:
+        pending.sort(key=lambda p: (len(eligible(p)) - p["open"], p["date"], p["slot"]))
+        p = pending.pop(0)
+        picks = sorted(eligible(p), key=lambda sid: (rate[sid] or 0.0, hours[sid], sid))[:p["open"]]
+        for sid in picks:
+            p["assigned"].append(sid)
+            hours[sid] += p["hours"]
+            days_off[sid].add(p["date"])
+        p["open"] -= len(picks)
+
+    for p in plan:
+        p["shortfall"] = p.pop("open")
+        p["cost"] = sum((rate[sid] or 0.0) * p["hours"] for sid in p["assigned"])
+    return plan
+
+def build_roster(db: Session, account_id: str, start: date, days: int = 7, max_hours: float = MAX_WEEKLY_HOURS) -> dict:
+    """Plans the roster against the stored shifts; nothing is written (see proposed_shifts)."""
+    slots = get_slots(db, account_id)
+    needs = requirements(db, account_id, start, days)
+    staff = db.query(core.Staff.id, core.Staff.hourly_rate).filter(core.Staff.account_id == account_id).all()
+    end = start + timedelta(days=days - 1)
+
+    # Shifts last under a day (shifts.MAX_SHIFT_HOURS), so only the day before can reach into the plan
+    shifts = db.query(
+        core.Shift.staff_id, core.Shift.date, core.Shift.slot, core.Shift.start_time, core.Shift.end_time
+    ).join(core.Staff).filter(
+        core.Staff.account_id == account_id,
+        core.Shift.date.between(start - timedelta(days=1), end)
+    ).all()
+    existing, worked, busy, booked = defaultdict(list), defaultdict(float), defaultdict(set), defaultdict(list)
+    for staff_id, day, slot, t0, t1 in shifts:
+        if t0 and t1:
+            booked[staff_id].append((t0, t1))
+        if day < start:
+            continue
+        existing[(day, slot)].append(staff_id)
+        worked[staff_id] += (t1 - t0).total_seconds() / 3600 if t0 and t1 else slot_hours(slot, slots)
+        busy[staff_id].add(day)
+
+    plan = solve(needs, [(s[0], s[1]) for s in staff], existing, worked, busy, max_hours, booked)
+
+    hours = defaultdict(float, worked)
+    for p in plan:
+        for sid in p["assigned"]:
+            hours[sid] += p["hours"]
+    return {
+        "start": start,
+        "days": days,
+        "applied": False,
+        "total_cost": sum(p["cost"] for p in plan),
+        "shortfall": sum(p["shortfall"] for p in plan),
+        "slots": plan,
+        "staff_hours": dict(hours),
+    }
+
+def proposed_shifts(plan: dict) -> List[dict]:
+    """The shifts a plan assigns, as {staff_id, date, slot} for the shift write path."""
+    return [{"staff_id": sid, "date": p["date"], "slot": p["slot"]} for p in plan["slots"] for sid in p["assigned"]]
@@ -0,0 +1,81 @@
+import logging
+import os
+from datetime import date, datetime, timezone
+from typing import Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from sqlalchemy import bindparam, update
+from sqlalchemy.orm import Session
+from backend.models import core
+from backend.cache import TenantCache
+
+# Stored business day of each sale.
+# Transaction.timestamp is UTC; transactions.sales_date holds the calendar day of the
+# sale in the tenant's timezone (Setting "timezone", an IANA name), indexed with
+# account_id. Analytics bucket and filter on it directly, so day-based queries are
+# index range scans instead of func.date(timestamp) over every row.
+
+TIMEZONE_SETTING_KEY = "timezone"
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "UTC")
+BACKFILL_BATCH = 5000
+
+_cache = TenantCache()
+
+def _zone(name: Optional[str]) -> ZoneInfo:
+    try:
+        return ZoneInfo(name or DEFAULT_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        logging.getLogger("uvicorn").warning(f"Unknown timezone '{name}', using {DEFAULT_TIMEZONE}")
+        return ZoneInfo(DEFAULT_TIMEZONE)
+
+def get_timezone(db: Session, account_id: str) -> ZoneInfo:
+    name = db.query(core.Setting.value).filter(
+        core.Setting.account_id == account_id,
+        core.Setting.key == TIMEZONE_SETTING_KEY
+    ).scalar()
+    cached = _cache.get(account_id)
+    if cached is not None and cached[0] == name:
+        return cached[1]
+    return _cache.set(account_id, None, (name, _zone(name)))[1]
+
+def local_date(ts: datetime, tz: ZoneInfo) -> date:
+    """Calendar day of a naive-UTC timestamp in the tenant's timezone."""
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(tz).date()
+
+def today(db: Session, account_id: str) -> date:
+    return datetime.now(get_timezone(db, account_id)).date()
+
+def backfill(db: Session, account_id: str, batch: int = BACKFILL_BATCH) -> int:
+    """Fills missing sales_date values for one tenant, `batch` rows per commit."""
+    tz = get_timezone(db, account_id)
+    stmt = update(core.Transaction).where(core.Transaction.id == bindparam("txn_id")).values(
+        sales_date=bindparam("day")
+    ).execution_options(synchronize_session=False)
+    filled = 0
+    while True:
+        rows = db.query(core.Transaction.id, core.Transaction.timestamp).filter(
+            core.Transaction.account_id == account_id,
+            core.Transaction.sales_date.is_(None),
+            core.Transaction.timestamp.isnot(None)
+        ).limit(batch).all()
+        if not rows:
+            return filled
+        db.connection().execute(stmt, [{"txn_id": txn_id, "day": local_date(ts, tz)} for txn_id, ts in rows])
+        db.commit()
+        filled += len(rows)
+
+def backfill_all(db: Session) -> int:
+    """Migration backfill for rows written before the column existed or by other writers."""
+    accounts = [r[0] for r in db.query(core.Transaction.account_id).filter(
+        core.Transaction.sales_date.is_(None)
+    ).distinct().all()]
+    return sum(backfill(db, account_id) for account_id in accounts)
+
+def recompute(db: Session, account_id: str) -> int:
+    """Re-derives every sales_date of a tenant after its timezone setting changes."""
+    db.query(core.Transaction).filter(core.Transaction.account_id == account_id).update(
+        {core.Transaction.sales_date: None}, synchronize_session=False
+    )
+    db.commit()
+    return backfill(db, account_id)
@@ -0,0 +1,129 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from backend.models import core
+
+# VendorTrust supplier scorecards.
+# Each supplier keeps running aggregates in supplier_scorecards (POs received, on-time
+# count, total days late, order-to-receipt lead days, an EWMA of quality ratings) that
+# are folded forward in the same transaction that receives a PO. Scorecard reads are
+# one row per supplier, and the risk check when a PO is raised is a primary-key lookup
+# instead of a history scan. Replenishment reads supplier lead times from here too.
+
+QUALITY_ALPHA = 0.3 # weight of the newest rating in the quality EWMA
+HIGH_RISK = (70.0, 3.0) # on-time % / quality below these is high risk
+MEDIUM_RISK = (90.0, 4.0)
+
+
+def _fold(card: core.SupplierScorecard, po: core.PurchaseOrder):
+    card.po_count = (card.po_count or 0) + 1
+    if po.expected_date is not None and po.received_date is not None:
+        days_late = max((po.received_date - po.expected_date).days, 0)
+        card.timed_count = (card.timed_count or 0) + 1
+        card.on_time_count = (card.on_time_count or 0) + (days_late == 0)
+        card.total_delay_days = (card.total_delay_days or 0) + days_late
+    if po.order_date is not None and po.received_date is not None:
+        card.lead_count = (card.lead_count or 0) + 1
+        card.total_lead_days = (card.total_lead_days or 0) + max((po.received_date - po.order_date).days, 0)
+    if po.quality_rating is not None:
+        if card.quality_ewma is None:
+            card.quality_ewma = po.quality_rating
+        else:
+            card.quality_ewma = QUALITY_ALPHA * po.quality_rating + (1 - QUALITY_ALPHA) * card.quality_ewma
+        card.rated_count = (card.rated_count or 0) + 1
+    if po.received_date is not None and (card.last_received_date is None or po.received_date > card.last_received_date):
+        card.last_received_date = po.received_date
+    card.updated_at = datetime.utcnow()
+
+def record_receipt(db: Session, po: core.PurchaseOrder):
+    """Folds a received PO into its supplier's scorecard. Caller commits."""
+    card = db.query(core.SupplierScorecard).filter(
+        core.SupplierScorecard.supplier_id == po.supplier_id
+    ).with_for_update().first()
+    if card is None:
+        card = core.SupplierScorecard(supplier_id=po.supplier_id, account_id=po.account_id)
+        db.add(card)
+    _fold(card, po)
+
+def rebuild(db: Session, account_id: str) -> int:
+    """Recomputes a tenant's scorecards from its received POs (oldest first). Commits."""
+    db.query(core.SupplierScorecard).filter(core.SupplierScorecard.account_id == account_id).delete(
+        synchronize_session=False
+    )
+    cards = {}
+    for po in db.query(core.PurchaseOrder).filter(
+        core.PurchaseOrder.account_id == account_id,
+        core.PurchaseOrder.status == "RECEIVED",
+        core.PurchaseOrder.supplier_id.isnot(None)
+    ).order_by(core.PurchaseOrder.received_date, core.PurchaseOrder.id).all():
+        if po.supplier_id not in cards:
+            cards[po.supplier_id] = core.SupplierScorecard(supplier_id=po.supplier_id, account_id=account_id)
+        _fold(cards[po.supplier_id], po)
+    db.add_all(cards.values())
+    db.commit()
+    return len(cards)
+
+def backfill_all(db: Session) -> int:
+    """Migration backfill for tenants with received POs but no scorecards yet."""
+    scored = db.query(core.SupplierScorecard.account_id).distinct()
+    accounts = [r[0] for r in db.query(core.PurchaseOrder.account_id).filter(
+        core.PurchaseOrder.status == "RECEIVED",
+        core.PurchaseOrder.account_id.notin_(scored)
+    ).distinct().all()]
+    return sum(rebuild(db, account_id) for account_id in accounts)
+
+def metrics(card: Optional[core.SupplierScorecard]) -> dict:
+    if card is None or not card.po_count:
+        return {"po_count": 0, "on_time_rate": None, "mean_delay_days": None, "mean_lead_days": None, "quality_score": None,
+                "last_received_date": None, "risk": "Low", "risk_reasons": []}
+    on_time = 100.0 * card.on_time_count / card.timed_count if card.timed_count else None
+    risk, reasons = assess(on_time, card.quality_ewma)
+    return {
+        "po_count": card.po_count,
+        "on_time_rate": on_time,
+        "mean_delay_days": card.total_delay_days / card.timed_count if card.timed_count else None,
+        "mean_lead_days": card.total_lead_days / card.lead_count if card.lead_count else None,
+        "quality_score": card.quality_ewma,
+        "last_received_date": card.last_received_date,
+        "risk": risk,
+        "risk_reasons": reasons,
+    }
+
+def assess(on_time: Optional[float], quality: Optional[float]) -> Tuple[str, List[str]]:
+    """("Low" | "Medium" | "High", reasons) for an on-time % and quality score."""
+    for level, (min_on_time, min_quality) in (("High", HIGH_RISK), ("Medium", MEDIUM_RISK)):
+        reasons = []
+        if on_time is not None and on_time < min_on_time:
+            reasons.append(f"on-time rate {on_time:.0f}% is below {min_on_time:.0f}%")
+        if quality is not None and quality < min_quality:
+            reasons.append(f"quality {quality:.1f}/5 is below {min_quality:.1f}")
+        if reasons:
+            return level, reasons
+    return "Low", []
+
+def lead_times(db: Session, account_id: str) -> Dict[str, float]:
+    """supplier_id -> mean days from order to receipt, for suppliers with any measured PO."""
+    return {sid: total / count for sid, total, count in db.query(
+        core.SupplierScorecard.supplier_id, core.SupplierScorecard.total_lead_days, core.SupplierScorecard.lead_count
+    ).filter(
+        core.SupplierScorecard.account_id == account_id,
+        core.SupplierScorecard.lead_count > 0
+    ).all()}
+
+def get_scorecards(db: Session, account_id: str) -> List[dict]:
+    """One scorecard per supplier of the tenant (suppliers without receipts included)."""
+    rows = db.query(core.Supplier, core.SupplierScorecard).outerjoin(
+        core.SupplierScorecard, core.SupplierScorecard.supplier_id == core.Supplier.id
+    ).filter(core.Supplier.account_id == account_id).order_by(core.Supplier.name, core.Supplier.id).all()
+    return [dict(metrics(card), supplier_id=s.id, supplier_name=s.name, category_specialty=s.category_specialty)
+            for s, card in rows]
+
+def risk_warning(db: Session, account_id: str, supplier_id: str) -> Optional[str]:
+    """Warning text for ordering from a medium/high-risk supplier, from one primary-key lookup."""
+    card = db.get(core.SupplierScorecard, supplier_id)
+    if card is None or card.account_id != account_id:
+        return None
+    m = metrics(card)
+    if m["risk"] == "Low":
+        return None
+    return f"{m['risk']} risk supplier: " + "; ".join(m["risk_reasons"])
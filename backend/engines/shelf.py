@@ -0,0 +1,101 @@
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+from sqlalchemy.orm import Session
+import shelf_engine
+from backend.models import core
+from backend.cache import TenantCache
+from backend.crud.base import CATALOG_VERSION_KEY
+
+# ShelfSense grid scoring for the API.
+# Each tenant's science tags (Product.science_tags) and rule overrides are loaded into
+# a catalog that shelf_engine compiles once per version into its bitmask rule index.
+# Grids are split into one chunk per core and scored in a shared process pool, so a
+# whole-store layout costs about (aisles / cores) grid scorings of wall time. Small
+# requests are scored inline, where pool round trips would cost more than the work.
+
+# Tenants can add or override KNOWLEDGE_BASE rules with this setting (JSON, same shape).
+RULES_SETTING_KEY = "shelf_rules"
+
+POOL_MIN_CELLS = 2000
+MAX_WORKERS = os.cpu_count() or 1
+
+_cache = TenantCache()
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=MAX_WORKERS)
+        return _pool
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+def _chunks(items: list, n: int) -> List[list]:
+    size = -(-len(items) // n)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def _tag_version(db: Session, account_id: str):
+    """
+    The tenant's catalog_version (bumped by every product create, delete, rename or
+    science_tags edit) plus its rules setting, read together in one key lookup.
+    """
+    values = dict(db.query(core.Setting.key, core.Setting.value).filter(
+        core.Setting.account_id == account_id,
+        core.Setting.key.in_((CATALOG_VERSION_KEY, RULES_SETTING_KEY))
+    ).all())
+    return (account_id, values.get(CATALOG_VERSION_KEY), values.get(RULES_SETTING_KEY))
+
+def _load_rules(account_id: str, raw: Optional[str]) -> dict:
+    knowledge_base = dict(shelf_engine.KNOWLEDGE_BASE)
+    if raw:
+        try:
+            custom = json.loads(raw)
+            for tag, rule in custom.items():
+                if "score" not in rule or "msg" not in rule:
+                    raise ValueError(f"rule '{tag}' needs score and msg")
+                knowledge_base[tag] = rule
+        except (ValueError, AttributeError, TypeError) as e:
+            logging.getLogger("uvicorn").warning(f"Ignoring invalid {RULES_SETTING_KEY} for {account_id}: {e}")
+    return knowledge_base
+
+def get_catalog(db: Session, account_id: str) -> tuple:
+    """
+    (version, tags_by_name, knowledge_base) for the tenant, as accepted by shelf_engine.
+    Rebuilt only when the tag version changes.
+    """
+    version = _tag_version(db, account_id)
+    cached = _cache.get(account_id)
+    if cached is not None and cached[0] == version:
+        return cached
+
+    rows = db.query(core.Product.name, core.Product.science_tags).filter(
+        core.Product.account_id == account_id,
+        core.Product.science_tags.isnot(None)
+    ).all()
+    tags_by_name = {}
+    for name, raw in rows:
+        tags_by_name.setdefault(name, set()).update(shelf_engine.parse_science_tags(raw))
+    catalog = (version, {n: sorted(t) for n, t in tags_by_name.items()}, _load_rules(account_id, version[-1]))
+    return _cache.set(account_id, None, catalog)
+
+def score_grids(grids: List[List[List[Optional[str]]]], catalog: Optional[tuple] = None) -> List[dict]:
+    cells = sum(len(g) * (len(g[0]) if g else 0) for g in grids)
+    if MAX_WORKERS == 1 or len(grids) == 1 or cells < POOL_MIN_CELLS:
+        return shelf_engine.score_grids(grids, catalog)
+
+    results = []
+    chunks = _chunks(grids, MAX_WORKERS)
+    for chunk in _get_pool().map(shelf_engine.score_grids, chunks, [catalog] * len(chunks)):
+        results.extend(chunk)
+    return results
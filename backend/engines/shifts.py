@@ -0,0 +1,154 @@
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime, timedelta
+from itertools import accumulate
+from typing import Iterable, List, Set
+from sqlalchemy import bindparam, update
+from sqlalchemy.orm import Session
+from backend.models import core
+from backend.crud.base import generate_unique_id
+from backend.engines import roster, sales_dates
+
+# ShiftSmart shift intervals.
+# Every shift carries local start/end times (from its slot unless given explicitly) and
+# no shift is longer than MAX_SHIFT_HOURS, so any shift overlapping an instant or an
+# interval starts inside a bounded window before it. Both overlap checks and "who is on
+# at 18:30" are therefore range scans on the start_time indexes, and overlap checks
+# bisect each staff member's sorted intervals instead of comparing every pair.
+# Writers (single and bulk shifts, week replacement and roster apply) hold the booking
+# lock and the staff rows (FOR UPDATE) from the overlap check until they commit, so two
+# requests can't both pass the check and double-book.
+
+MAX_SHIFT_HOURS = 16
+
+_booking_lock = threading.Lock() # SQLite ignores FOR UPDATE; serializes writers in this process
+
+
+class ShiftConflict(ValueError):
+    def __init__(self, conflicts: List[dict]):
+        self.conflicts = conflicts
+        super().__init__("; ".join(
+            f"{c['staff_id']} {c['start_time']:%Y-%m-%d %H:%M}-{c['end_time']:%H:%M} overlaps {c['conflicts_with']}"
+            for c in conflicts
+        ))
+
+
+def booking():
+    """Held from the overlap check until the shift rows are committed."""
+    return _booking_lock
+
+def lock_staff(db: Session, account_id: str, staff_ids: Iterable[str]) -> Set[str]:
+    """Locks the tenant's staff rows among `staff_ids` until commit; returns the ids found."""
+    ids = set(staff_ids)
+    if not ids:
+        return set()
+    return {r[0] for r in db.query(core.Staff.id).filter(
+        core.Staff.account_id == account_id,
+        core.Staff.id.in_(ids)
+    ).with_for_update().all()}
+
+def to_local(db: Session, account_id: str, at: datetime) -> datetime:
+    """Naive tenant-local wall-clock time; aware datetimes are converted, naive ones are taken as local."""
+    if at.tzinfo is None:
+        return at
+    return at.astimezone(sales_dates.get_timezone(db, account_id)).replace(tzinfo=None)
+
+def resolve(db: Session, account_id: str, shifts: Iterable) -> List[dict]:
+    """Shift rows with start/end times filled in from the tenant's slots. Raises ValueError."""
+    slots = roster.get_slots(db, account_id)
+    now = datetime.utcnow()
+    rows = []
+    for s in shifts:
+        start, end = s.start_time, s.end_time
+        if start is None or end is None:
+            start, end = roster.shift_times(s.date, s.slot, slots)
+            if start is None:
+                raise ValueError(f"Unknown slot '{s.slot}': give start_time and end_time")
+        else:
+            start, end = to_local(db, account_id, start), to_local(db, account_id, end)
+            if start.date() != s.date:
+                raise ValueError(f"Shift on {s.date} can't start at {start:%Y-%m-%d %H:%M}")
+        if not timedelta(0) < end - start <= timedelta(hours=MAX_SHIFT_HOURS):
+            raise ValueError(f"Shifts must end after they start and last at most {MAX_SHIFT_HOURS} hours")
+        rows.append({"id": generate_unique_id(), "staff_id": s.staff_id, "date": s.date, "slot": s.slot,
+                     "start_time": start, "end_time": end, "created_at": now})
+    return rows
+
+def find_conflicts(db: Session, rows: List[dict]) -> List[dict]:
+    """Overlaps of new rows with each other and with stored shifts (one ranged query)."""
+    if not rows:
+        return []
+    conflicts = []
+    by_staff = defaultdict(list)
+    for r in rows:
+        by_staff[r["staff_id"]].append(r)
+
+    # New rows among themselves
+    for staff_rows in by_staff.values():
+        staff_rows.sort(key=lambda r: r["start_time"])
+        for prev, cur in zip(staff_rows, staff_rows[1:]):
+            if cur["start_time"] < prev["end_time"]:
+                conflicts.append(dict(cur, conflicts_with=prev["id"]))
+
+    lo = min(r["start_time"] for r in rows) - timedelta(hours=MAX_SHIFT_HOURS)
+    hi = max(r["end_time"] for r in rows)
+    stored = db.query(core.Shift.id, core.Shift.staff_id, core.Shift.start_time, core.Shift.end_time).filter(
+        core.Shift.staff_id.in_(list(by_staff)),
+        core.Shift.start_time >= lo,
+        core.Shift.start_time < hi
+    ).order_by(core.Shift.staff_id, core.Shift.start_time).all()
+    intervals = defaultdict(list)
+    for shift_id, staff_id, start, end in stored:
+        intervals[staff_id].append((start, end, shift_id))
+
+    for staff_id, staff_rows in by_staff.items():
+        existing = intervals.get(staff_id)
+        if not existing:
+            continue
+        starts = [i[0] for i in existing]
+        # Running max of end times, with the shift that reaches it
+        reach = list(accumulate(((e, sid) for _, e, sid in existing), max))
+        for r in staff_rows:
+            i = bisect_left(starts, r["end_time"]) - 1 # last stored shift starting before r ends
+            if i >= 0 and reach[i][0] > r["start_time"]:
+                conflicts.append(dict(r, conflicts_with=reach[i][1]))
+    return conflicts
+
+def check(db: Session, rows: List[dict]):
+    conflicts = find_conflicts(db, rows)
+    if conflicts:
+        raise ShiftConflict(conflicts)
+
+def on_duty(db: Session, account_id: str, at: datetime) -> list:
+    """(Shift, name, role, hourly_rate) rows covering an instant (naive = tenant-local)."""
+    at = to_local(db, account_id, at)
+    return db.query(core.Shift, core.Staff.name, core.Staff.role, core.Staff.hourly_rate).join(
+        core.Staff, core.Staff.id == core.Shift.staff_id
+    ).filter(
+        core.Staff.account_id == account_id,
+        core.Shift.start_time > at - timedelta(hours=MAX_SHIFT_HOURS),
+        core.Shift.start_time <= at,
+        core.Shift.end_time > at
+    ).order_by(core.Shift.start_time, core.Staff.name).all()
+
+def backfill_times(db: Session) -> int:
+    """Derives start/end times from the slot for shifts written without them."""
+    rows = db.query(core.Shift.id, core.Shift.date, core.Shift.slot, core.Staff.account_id).join(
+        core.Staff, core.Staff.id == core.Shift.staff_id
+    ).filter(core.Shift.start_time.is_(None), core.Shift.date.isnot(None)).all()
+    slots_by_account = {}
+    params = []
+    for shift_id, day, slot, account_id in rows:
+        if account_id not in slots_by_account:
+            slots_by_account[account_id] = roster.get_slots(db, account_id)
+        start, end = roster.shift_times(day, slot, slots_by_account[account_id])
+        if start is not None:
+            params.append({"shift_id": shift_id, "t0": start, "t1": end})
+    if params:
+        stmt = update(core.Shift).where(core.Shift.id == bindparam("shift_id")).values(
+            start_time=bindparam("t0"), end_time=bindparam("t1")
+        ).execution_options(synchronize_session=False)
+        db.connection().execute(stmt, params)
+        db.commit()
+    return len(params)
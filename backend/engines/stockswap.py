@@ -0,0 +1,258 @@
+import logging
+import math
+import re
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from backend.models import core
+from backend.cache import Watermark
+from backend.engines.catchment import EARTH_RADIUS_KM
+
+# StockSwap marketplace matching.
+# Open B2B listings of every tenant live in one process-wide MarketIndex: product names
+# are normalized and split into character trigrams with an inverted index (trigram ->
+# listing slots), so a fuzzy name query only touches listings sharing a trigram with
+# it. Candidate overlaps are counted with np.unique over the matched postings, scored
+# by trigram Jaccard similarity, then filtered by haversine distance over numpy arrays.
+# Results rank by similarity band (SIMILARITY_BAND wide) first and distance second,
+# so a near-exact match a little further away beats a weak match next door.
+# The index is folded forward from b2b_deals.updated_at with a watermark (re-reading a
+# short overlap window for late commits), so new and closed listings show up without
+# rescanning the table.
+
+OFFER = "OFFER"
+REQUEST = "REQUEST"
+KINDS = (OFFER, REQUEST)
+OPEN = "OPEN"
+CLOSED = "CLOSED"
+MIN_SIMILARITY = 0.3
+SIMILARITY_BAND = 0.1
+DEFAULT_RADIUS_KM = 50.0
+LOW_STOCK_THRESHOLD = 10 # same cut-off as the dashboard's low-stock list
+MAX_MATCH_PRODUCTS = 50
+MATCHES_PER_PRODUCT = 5
+LOCATION_SETTING_KEY = "store_location" # "lat,lng"
+
+logger = logging.getLogger("uvicorn")
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def normalize(name: Optional[str]) -> str:
+    """Lowercase alphanumeric words with simple plurals folded ("Tomatoes 1KG" -> "tomato 1kg")."""
+    words = []
+    for w in _WORD.findall((name or "").lower()):
+        if len(w) > 4 and w.endswith("es") and w[-3] in "osxz":
+            w = w[:-2]
+        elif len(w) > 3 and w.endswith("s") and not w.endswith("ss"):
+            w = w[:-1]
+        words.append(w)
+    return " ".join(words)
+
+def trigrams(normalized: str) -> set:
+    grams = set()
+    for w in normalized.split():
+        padded = f"  {w} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class MarketIndex:
+    def __init__(self):
+        self.slot: Dict[str, int] = {} # deal id -> slot
+        self.rows: List[Optional[dict]] = [] # slot -> listing, None once removed
+        self.sizes = np.zeros(0, dtype=np.int64) # slot -> trigram count (grown by doubling)
+        self.lat = np.zeros(0)
+        self.lng = np.zeros(0)
+        self.postings: Dict[str, List[int]] = defaultdict(list)
+        self.watermark = Watermark()
+        self.dead = 0
+
+    def add(self, deal: core.B2BDeal):
+        self.remove(deal.id)
+        grams = trigrams(normalize(deal.product_name))
+        slot = len(self.rows)
+        self.slot[deal.id] = slot
+        self.rows.append({
+            "deal_id": deal.id,
+            "account_id": deal.account_id,
+            "kind": deal.kind or OFFER,
+            "store_name": deal.store_name,
+            "product_name": deal.product_name,
+            "category": deal.category,
+            "category_norm": normalize(deal.category) or None,
+            "quantity": deal.quantity,
+            "price_per_unit": deal.price_per_unit,
+            "acc_phone": deal.acc_phone,
+        })
+        if slot == len(self.sizes):
+            capacity = max(1024, 2 * slot)
+            self.sizes = np.resize(self.sizes, capacity)
+            self.lat = np.resize(self.lat, capacity)
+            self.lng = np.resize(self.lng, capacity)
+        self.sizes[slot] = len(grams)
+        self.lat[slot] = deal.latitude if deal.latitude is not None else math.nan
+        self.lng[slot] = deal.longitude if deal.longitude is not None else math.nan
+        for g in grams:
+            self.postings[g].append(slot)
+
+    def remove(self, deal_id: str):
+        slot = self.slot.pop(deal_id, None)
+        if slot is not None:
+            self.rows[slot] = None
+            self.dead += 1
+
+    def live(self) -> int:
+        return len(self.slot)
+
+    def search(self, query: str, kind: str, exclude_account: Optional[str] = None, category: Optional[str] = None,
+               lat: Optional[float] = None, lng: Optional[float] = None, radius_km: Optional[float] = None,
+               limit: int = 20) -> List[dict]:
+        grams = trigrams(normalize(query))
+        lists = [self.postings[g] for g in grams if g in self.postings]
+        if not lists:
+            return []
+        # Cost follows the matched postings, not the index size
+        candidates, overlap = np.unique(np.concatenate([np.asarray(l, dtype=np.int64) for l in lists]), return_counts=True)
+        similarity = overlap / (len(grams) + self.sizes[candidates] - overlap)
+        keep = similarity >= MIN_SIMILARITY
+        candidates, similarity = candidates[keep], similarity[keep]
+
+        category = normalize(category) or None
+        chosen = [i for i, s in enumerate(candidates) if self._accepts(self.rows[s], kind, exclude_account, category)]
+        candidates, similarity = candidates[chosen], similarity[chosen]
+
+        distance = np.full(len(candidates), np.nan)
+        if lat is not None and lng is not None and len(candidates):
+            distance = haversine_km(lat, lng, self.lat[candidates], self.lng[candidates])
+            if radius_km is not None:
+                near = ~(distance > radius_km) # listings without a location stay, ranked last
+                candidates, similarity, distance = candidates[near], similarity[near], distance[near]
+
+        # Best similarity band first, nearest within a band (unknown distance last), then exact similarity
+        band = np.floor(similarity / SIMILARITY_BAND + 1e-9)
+        order = np.lexsort((-similarity, np.where(np.isnan(distance), np.inf, distance), -band))[:limit]
+        return [dict(self.rows[candidates[i]], similarity=float(similarity[i]),
+                     distance_km=None if np.isnan(distance[i]) else float(distance[i])) for i in order]
+
+    @staticmethod
+    def _accepts(row: Optional[dict], kind: str, exclude_account: Optional[str], category: Optional[str]) -> bool:
+        return (
+            row is not None
+            and row["kind"] == kind
+            and row["account_id"] != exclude_account
+            and (category is None or row["category_norm"] == category)
+        )
+
+
+def haversine_km(lat: float, lng: float, lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+    p1, p2 = np.radians(lat), np.radians(lats)
+    dphi, dlmb = p2 - p1, np.radians(lngs - lng)
+    a = np.sin(dphi / 2) ** 2 + np.cos(p1) * np.cos(p2) * np.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+_index: Optional[MarketIndex] = None
+_lock = threading.Lock()
+
+def _is_open(deal: core.B2BDeal) -> bool:
+    return (deal.status or OPEN) == OPEN
+
+def _build(db: Session) -> MarketIndex:
+    index = MarketIndex()
+    for deal in db.query(core.B2BDeal).filter(or_(core.B2BDeal.status.is_(None), core.B2BDeal.status == OPEN)).all():
+        index.add(deal)
+        index.watermark.advance(deal.updated_at, deal.id)
+    # Writes before the build may have no updated_at; start the watermark after them
+    latest = db.query(core.B2BDeal.updated_at, core.B2BDeal.id).filter(core.B2BDeal.updated_at.isnot(None)).order_by(
+        core.B2BDeal.updated_at.desc()
+    ).first()
+    if latest is not None:
+        index.watermark.advance(latest[0], latest[1])
+    logger.info(f"StockSwap index built with {index.live()} open listings")
+    return index
+
+def _refresh(db: Session, index: MarketIndex):
+    query = db.query(core.B2BDeal).filter(core.B2BDeal.updated_at.isnot(None))
+    since = index.watermark.since()
+    if since is not None:
+        query = query.filter(core.B2BDeal.updated_at >= since)
+    for deal in query.order_by(core.B2BDeal.updated_at, core.B2BDeal.id).all():
+        if not index.watermark.accepts(deal.updated_at, deal.id):
+            continue
+        if _is_open(deal):
+            index.add(deal)
+        else:
+            index.remove(deal.id)
+        index.watermark.advance(deal.updated_at, deal.id)
+
+def get_index(db: Session) -> MarketIndex:
+    global _index
+    with _lock:
+        if _index is None or _index.dead > max(_index.live(), 1000):
+            # Rebuilt from scratch on first use and once removed slots outnumber live ones
+            _index = _build(db)
+        else:
+            _refresh(db, _index)
+        return _index
+
+def reset():
+    global _index
+    with _lock:
+        _index = None
+
+def store_location(db: Session, account_id: str) -> Tuple[Optional[float], Optional[float]]:
+    raw = db.query(core.Setting.value).filter(
+        core.Setting.account_id == account_id,
+        core.Setting.key == LOCATION_SETTING_KEY
+    ).scalar()
+    if not raw:
+        return None, None
+    try:
+        lat, lng = (float(v) for v in raw.split(","))
+        return lat, lng
+    except ValueError:
+        logger.warning(f"Ignoring invalid {LOCATION_SETTING_KEY} for {account_id}: {raw}")
+        return None, None
+
+def close(db: Session, account_id: str, deal_id: str) -> Optional[core.B2BDeal]:
+    deal = db.query(core.B2BDeal).filter(core.B2BDeal.id == deal_id, core.B2BDeal.account_id == account_id).first()
+    if deal is None:
+        return None
+    deal.status = CLOSED
+    deal.updated_at = datetime.utcnow()
+    db.commit()
+    db.refresh(deal)
+    return deal
+
+def search(db: Session, account_id: str, query: str, kind: str = OFFER, category: Optional[str] = None,
+           lat: Optional[float] = None, lng: Optional[float] = None, radius_km: Optional[float] = DEFAULT_RADIUS_KM,
+           limit: int = 20) -> List[dict]:
+    """Other tenants' open listings of `kind` matching `query`, nearest first. Raises ValueError."""
+    if kind not in KINDS:
+        raise ValueError(f"kind must be one of: {', '.join(KINDS)}")
+    if lat is None or lng is None:
+        lat, lng = store_location(db, account_id)
+    return get_index(db).search(query, kind, account_id, category, lat, lng, radius_km, limit)
+
+def match_low_stock(db: Session, account_id: str, radius_km: Optional[float] = DEFAULT_RADIUS_KM,
+                    threshold: int = LOW_STOCK_THRESHOLD) -> List[dict]:
+    """Offers from other tenants for each of the tenant's low-stock products (lowest stock first)."""
+    products = db.query(core.Product.id, core.Product.name, core.Product.stock_quantity).filter(
+        core.Product.account_id == account_id,
+        core.Product.stock_quantity < threshold
+    ).order_by(core.Product.stock_quantity, core.Product.id).limit(MAX_MATCH_PRODUCTS).all()
+    if not products:
+        return []
+    lat, lng = store_location(db, account_id)
+    index = get_index(db)
+    results = []
+    for product_id, name, stock in products:
+        offers = index.search(name, OFFER, account_id, None, lat, lng, radius_km, MATCHES_PER_PRODUCT)
+        if offers:
+            results.append({"product_id": product_id, "product_name": name, "stock_quantity": stock or 0, "offers": offers})
+    return results
@@ -0,0 +1,169 @@
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from backend.models import core
+from backend.cache import WATERMARK_OVERLAP, TenantCache, Watermark
+from backend.engines import sales_dates
+
+# Sales velocity engine.
+# Keeps a per-tenant daily rollup of units sold per product (product -> day -> units),
+# built with one grouped pass over transaction_items (bucketed on the indexed
+# transactions.sales_date) and then folded forward from transactions past the
+# watermark. Rolling 7/30/90-day windows are read from the rollup, so requests
+# never rescan sales history.
+
+WINDOWS = (7, 30, 90)
+ROLLUP_DAYS = max(WINDOWS)
+DEFAULT_COVER_THRESHOLD = 60 # days of stock on hand before an item counts as stagnant
+
+_cache = TenantCache()
+
+
+class SalesRollup:
+    def __init__(self, start: date):
+        self.start = start # oldest day kept
+        self.daily: Dict[str, Dict[date, int]] = defaultdict(lambda: defaultdict(int))
+        self.watermark = Watermark()
+        self.version = 0 # bumped whenever the rollup changes
+
+    def add(self, product_id: str, day: date, units: int):
+        if day >= self.start:
+            self.daily[product_id][day] += units or 0
+
+    def prune(self, start: date):
+        """Drops days older than `start` (day rollover)."""
+        if start <= self.start:
+            return
+        self.start = start
+        for product_id in list(self.daily):
+            days = self.daily[product_id]
+            for d in [d for d in days if d < start]:
+                del days[d]
+            if not days:
+                del self.daily[product_id]
+        self.version += 1
+
+    def window_units(self, product_id: str, today: date, days: int) -> int:
+        cutoff = today - timedelta(days=days - 1)
+        return sum(u for d, u in self.daily.get(product_id, {}).items() if d >= cutoff)
+
+
+def _build(db: Session, account_id: str, today: date) -> SalesRollup:
+    rollup = SalesRollup(today - timedelta(days=ROLLUP_DAYS - 1))
+    sales_dates.backfill(db, account_id)
+    latest = db.query(func.max(core.Transaction.timestamp)).filter(
+        core.Transaction.account_id == account_id
+    ).scalar()
+    if latest is None:
+        return rollup
+
+    day = core.Transaction.sales_date
+    rows = db.query(
+        core.TransactionItem.product_id,
+        day,
+        func.sum(core.TransactionItem.quantity)
+    ).join(core.Transaction).filter(
+        core.Transaction.account_id == account_id,
+        day >= rollup.start,
+        core.Transaction.timestamp <= latest
+    ).group_by(core.TransactionItem.product_id, day).all()
+
+    for product_id, d, units in rows:
+        rollup.add(product_id, d, units)
+
+    rollup.watermark = Watermark(latest, (tuple(r) for r in db.query(core.Transaction.id, core.Transaction.timestamp).filter(
+        core.Transaction.account_id == account_id,
+        core.Transaction.timestamp.between(latest - WATERMARK_OVERLAP, latest)
+    ).all()))
+    return rollup
+
+def _refresh(db: Session, account_id: str, rollup: SalesRollup):
+    query = db.query(
+        core.Transaction.id,
+        core.Transaction.timestamp,
+        core.Transaction.sales_date,
+        core.TransactionItem.product_id,
+        core.TransactionItem.quantity
+    ).join(core.Transaction).filter(core.Transaction.account_id == account_id)
+    since = rollup.watermark.since()
+    if since is not None:
+        query = query.filter(core.Transaction.timestamp >= since)
+
+    rows = [r for r in query.all() if rollup.watermark.accepts(r[1], r[0])]
+    tz = sales_dates.get_timezone(db, account_id) if rows else None
+    for txn_id, ts, day, product_id, qty in rows:
+        rollup.add(product_id, day or sales_dates.local_date(ts, tz), qty)
+    for txn_id, ts, _, _, _ in rows:
+        rollup.watermark.advance(ts, txn_id)
+    if rows:
+        rollup.version += 1
+
+def get_rollup(db: Session, account_id: str, today: Optional[date] = None) -> SalesRollup:
+    today = today or sales_dates.today(db, account_id)
+    with _cache.lock():
+        rollup = _cache.get(account_id)
+        if rollup is None:
+            return _cache.set(account_id, None, _build(db, account_id, today))
+        rollup.prune(today - timedelta(days=ROLLUP_DAYS - 1))
+        _refresh(db, account_id, rollup)
+        return rollup
+
+def invalidate(account_id: str):
+    _cache.invalidate(account_id)
+
+def get_velocities(db: Session, account_id: str, today: Optional[date] = None) -> Dict[str, dict]:
+    """
+    product_id -> {units_7d, units_30d, units_90d, daily_velocity}.
+    Memoized per rollup version and day, so repeated reads cost a dict lookup.
+    """
+    today = today or sales_dates.today(db, account_id)
+    rollup = get_rollup(db, account_id, today)
+    key = ("velocity", rollup.version, today)
+    cached = _cache.get(account_id, "velocity")
+    if cached and cached[0] == key:
+        return cached[1]
+
+    result = {}
+    for product_id in rollup.daily:
+        units = {w: rollup.window_units(product_id, today, w) for w in WINDOWS}
+        result[product_id] = {
+            "units_7d": units[7],
+            "units_30d": units[30],
+            "units_90d": units[90],
+            "daily_velocity": units[30] / 30.0,
+        }
+    _cache.set(account_id, "velocity", (key, result))
+    return result
+
+def get_stagnant_products(db: Session, account_id: str, cover_threshold: float = DEFAULT_COVER_THRESHOLD,
+                          limit: Optional[int] = None) -> List[dict]:
+    """Stocked products whose days-of-cover at the 30-day velocity exceeds `cover_threshold`."""
+    velocities = get_velocities(db, account_id)
+    products = db.query(core.Product.id, core.Product.name, core.Product.stock_quantity).filter(
+        core.Product.account_id == account_id,
+        core.Product.stock_quantity > 0
+    ).all()
+
+    flagged = []
+    for product_id, name, stock in products:
+        v = velocities.get(product_id)
+        rate = v["daily_velocity"] if v else 0.0
+        cover = stock / rate if rate > 0 else None
+        if cover is not None and cover <= cover_threshold:
+            continue
+        flagged.append({
+            "product_id": product_id,
+            "product_name": name,
+            "stock_quantity": stock,
+            "units_7d": v["units_7d"] if v else 0,
+            "units_30d": v["units_30d"] if v else 0,
+            "units_90d": v["units_90d"] if v else 0,
+            "daily_velocity": rate,
+            "days_of_cover": cover,
+        })
+
+    # No recent sales at all sorts first, then by how long current stock lasts
+    flagged.sort(key=lambda f: (f["days_of_cover"] is not None, -(f["days_of_cover"] or 0), -f["stock_quantity"]))
+    return flagged[:limit] if limit else flagged
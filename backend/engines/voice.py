@@ -0,0 +1,125 @@
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+import nlp_engine
+from backend.models import core
+from backend.cache import TenantCache
+from backend.crud.base import generate_unique_id, get_catalog_version
+
+# VoiceAudit batch processing for the API.
+# Transcripts are parsed with nlp_engine's precompiled patterns, each distinct spoken
+# product phrase is resolved once against the tenant's cached trigram matcher, and the
+# resulting stock changes and VoiceLog rows are written in one transaction.
+
+_cache = TenantCache()
+
+def get_matcher(db: Session, account_id: str) -> Optional[nlp_engine.ProductMatcher]:
+    """
+    Per-tenant ProductMatcher, rebuilt only when the tenant's catalog_version moves
+    (bumped by product creates, renames and deletes), so a lookup is one key read and
+    stock movements never rebuild the index.
+    """
+    version = get_catalog_version(db, account_id)
+    cached = _cache.get(account_id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    rows = db.query(core.Product.id, core.Product.name).filter(core.Product.account_id == account_id).all()
+    matcher = nlp_engine.ProductMatcher([{"id": r[0], "name": r[1]} for r in rows]) if rows else None
+    _cache.set(account_id, None, (version, matcher))
+    return matcher
+
+def invalidate(account_id: str):
+    _cache.invalidate(account_id)
+
+def parse_commands(db: Session, account_id: str, transcripts: List[str]) -> List[dict]:
+    """Parses a batch; product phrases repeated across the batch are matched once."""
+    parsed: List[Tuple[dict, Optional[str]]] = [nlp_engine.parse_command_text(t) for t in transcripts]
+    queries = {q for _, q in parsed if q is not None}
+    if not queries:
+        return [r for r, _ in parsed]
+
+    matcher = get_matcher(db, account_id)
+    matches = {q: matcher.match(q) if matcher else (None, 0.0) for q in queries}
+
+    results = []
+    for result, query in parsed:
+        if query is not None:
+            if matcher is None:
+                result['status_msg'] = "Database is empty."
+            else:
+                nlp_engine.apply_match(result, query, *matches[query])
+        results.append(result)
+    return results
+
+def reconcile(start: int, commands: List[Tuple[str, int]]) -> int:
+    """Folds ADD/SET/REMOVE commands, in spoken order, over a starting stock level."""
+    stock = start
+    for action, qty in commands:
+        if action == 'ADD':
+            stock += qty
+        elif action == 'SET':
+            stock = qty
+        elif action == 'REMOVE':
+            stock = max(0, stock - qty)
+    return stock
+
+def apply_stock_changes(db: Session, account_id: str, results: List[dict]) -> Dict[str, int]:
+    """
+    Applies successful commands to product stock (no commit). Products are loaded with one
+    IN query and each product's commands are folded in memory, so the flush issues one
+    UPDATE per touched product. Each applied result gets 'new_stock', the stock right
+    after that command. Returns product_id -> final stock.
+    """
+    by_product: Dict[str, List[dict]] = {}
+    for r in results:
+        if r['status_msg'] == "Success":
+            by_product.setdefault(r['product_id'], []).append(r)
+    if not by_product:
+        return {}
+
+    products = db.query(core.Product).filter(
+        core.Product.account_id == account_id,
+        core.Product.id.in_(list(by_product))
+    ).all()
+    final_stock = {}
+    for p in products:
+        stock = p.stock_quantity or 0
+        for r in by_product[p.id]:
+            stock = reconcile(stock, [(r['action'], r['qty'])])
+            r['new_stock'] = stock
+        p.stock_quantity = final_stock[p.id] = stock
+    return final_stock
+
+def log_rows(account_id: str, results: List[dict]) -> List[dict]:
+    return [{
+        "id": generate_unique_id(),
+        "account_id": account_id,
+        "transcript": r['original_text'],
+        "action_extracted": r['action'],
+        "confidence_score": r['confidence'],
+    } for r in results]
+
+def process_commands(db: Session, account_id: str, transcripts: List[str], apply: bool = True) -> List[dict]:
+    """
+    Parses, resolves and (optionally) applies a batch of transcripts in one transaction.
+    Each result gains 'applied' and 'new_stock' (the running stock after that command).
+    """
+    results = parse_commands(db, account_id, transcripts)
+    final_stock = {}
+    if apply:
+        try:
+            final_stock = apply_stock_changes(db, account_id, results)
+            rows = log_rows(account_id, results)
+            if rows:
+                db.execute(insert(core.VoiceLog), rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+    for r in results:
+        r['applied'] = r['product_id'] in final_stock
+        if not r['applied']:
+            r['new_stock'] = None
+    return results
@@ -0,0 +1,133 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import delete, insert, select
+from sqlalchemy.engine import Engine
+from backend.models import core
+from backend.crud.base import generate_unique_id
+
+# VoiceLog ingestion and retention.
+# Single log writes are buffered in memory and written with one multi-row INSERT once
+# FLUSH_ROWS rows are pending or the oldest has waited FLUSH_INTERVAL_MS, whichever
+# comes first. Rows are grouped by the engine of the session that submitted them, so
+# each lands in the database it was written against. A background thread does the
+# time-based flushes and prunes logs older than the retention window in small batches.
+
+FLUSH_ROWS = 500
+FLUSH_INTERVAL_MS = 250
+RETENTION_DAYS = int(os.getenv("VOICE_LOG_RETENTION_DAYS", "90"))
+PRUNE_INTERVAL_S = 3600
+PRUNE_BATCH = 5000
+
+logger = logging.getLogger("uvicorn")
+
+
+class VoiceLogBuffer:
+    def __init__(self, max_rows: int = FLUSH_ROWS, max_wait_ms: int = FLUSH_INTERVAL_MS):
+        self.max_rows = max_rows
+        self.max_wait = max_wait_ms / 1000.0
+        self._pending: Dict[Engine, List[dict]] = {}
+        self._count = 0
+        self._oldest: Optional[float] = None
+        self._lock = threading.Lock() # guards _pending
+        self._flush_lock = threading.Lock() # one writer at a time, so readers see complete flushes
+
+    def add(self, bind: Engine, row: dict) -> dict:
+        with self._lock:
+            self._pending.setdefault(bind, []).append(row)
+            self._count += 1
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            full = self._count >= self.max_rows
+        if full:
+            self.flush()
+        return row
+
+    def due(self) -> bool:
+        with self._lock:
+            return self._oldest is not None and time.monotonic() - self._oldest >= self.max_wait
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._count, self._oldest = 0, None
+            written = 0
+            for bind, rows in pending.items():
+                try:
+                    with bind.begin() as conn:
+                        conn.execute(insert(core.VoiceLog), rows)
+                    written += len(rows)
+                except Exception as e:
+                    logger.error(f"Dropped {len(rows)} voice logs: {e}")
+            return written
+
+
+buffer = VoiceLogBuffer()
+_known_engines = set()
+_stop = threading.Event()
+_worker: Optional[threading.Thread] = None
+
+def _now() -> datetime:
+    return datetime.utcnow()
+
+def log(bind: Engine, account_id: str, transcript: str, action_extracted: Optional[str] = "AUDIT",
+        confidence_score: float = 0.0) -> dict:
+    """Queues one VoiceLog row and returns it as it will be stored."""
+    _known_engines.add(bind)
+    return buffer.add(bind, {
+        "id": generate_unique_id(),
+        "account_id": account_id,
+        "transcript": transcript,
+        "action_extracted": action_extracted,
+        "confidence_score": confidence_score,
+        "created_at": _now(),
+    })
+
+def prune(bind: Engine, retention_days: int = RETENTION_DAYS) -> int:
+    """Deletes logs past the retention window, PRUNE_BATCH rows per transaction."""
+    cutoff = _now() - timedelta(days=retention_days)
+    removed = 0
+    while True:
+        with bind.begin() as conn:
+            ids = select(core.VoiceLog.id).where(core.VoiceLog.created_at < cutoff).limit(PRUNE_BATCH)
+            result = conn.execute(delete(core.VoiceLog).where(core.VoiceLog.id.in_(ids)))
+        removed += result.rowcount or 0
+        if not result.rowcount or result.rowcount < PRUNE_BATCH:
+            return removed
+
+def _run(interval: float):
+    last_prune = time.monotonic()
+    while not _stop.wait(interval):
+        if buffer.due():
+            buffer.flush()
+        if time.monotonic() - last_prune >= PRUNE_INTERVAL_S:
+            last_prune = time.monotonic()
+            for bind in list(_known_engines):
+                try:
+                    removed = prune(bind)
+                    if removed:
+                        logger.info(f"Pruned {removed} voice logs older than {RETENTION_DAYS} days")
+                except Exception as e:
+                    logger.error(f"Voice log pruning failed: {e}")
+
+def start(bind: Engine):
+    """Starts the background flusher/pruner (idempotent)."""
+    global _worker
+    _known_engines.add(bind)
+    if _worker is not None and _worker.is_alive():
+        return
+    _stop.clear()
+    _worker = threading.Thread(target=_run, args=(FLUSH_INTERVAL_MS / 1000.0 / 2,), name="voice-log-writer", daemon=True)
+    _worker.start()
+
+def shutdown():
+    global _worker
+    _stop.set()
+    if _worker is not None:
+        _worker.join(timeout=5)
+        _worker = None
+    buffer.flush()
@@ -1,16 +1,30 @@
+import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from backend.database_config import engine, Base
+from backend.migrations import upgrade_schema
 from backend.routers import products, auth, dashboard, pos, restaurant, modules, settings
 
-# Create tables
-Base.metadata.create_all(bind=engine)
-
 app = FastAPI(title="VyaparMind API", version="1.0.0")
 
+def startup_jobs_enabled() -> bool:
+    """
+    Schema sync, demo seeding and the background workers all run against the configured
+    database, not the get_db dependency. Set VYMIND_STARTUP_JOBS=0 to skip them (the
+    test suite does, and brings its own engine). Data backfills are not run here; see
+    `python -m backend.migrations`.
+    """
+    return os.getenv("VYMIND_STARTUP_JOBS", "1") == "1"
+
 @app.on_event("startup")
 def startup_event():
-    # ... (startup logic)
+    if not startup_jobs_enabled():
+        return
+
+    # Create tables
+    Base.metadata.create_all(bind=engine)
+    upgrade_schema(engine)
+
     from backend.database_config import SessionLocal
     from backend.models import core
     from backend import auth as auth_utils
@@ -47,6 +61,25 @@ def startup_event():
     finally:
         db.close()
 
+    from backend.engines import voice_log
+    voice_log.start(engine)
+
+    from backend.engines import expiry
+    from backend.engines import replenishment
+    expiry.start(SessionLocal)
+    replenishment.start(SessionLocal)
+
+@app.on_event("shutdown")
+def shutdown_event():
+    from backend.engines import shelf as shelf_sense
+    from backend.engines import voice_log
+    from backend.engines import expiry
+    from backend.engines import replenishment
+    shelf_sense.shutdown()
+    voice_log.shutdown()
+    expiry.shutdown()
+    replenishment.shutdown()
+
 app.include_router(auth.router)
 app.include_router(products.router)
 app.include_router(dashboard.router)
@@ -0,0 +1,62 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import sessionmaker
+from backend.database_config import Base
+
+# Settings keys that earlier versions used for internal job bookkeeping (now job_runs)
+LEGACY_SETTING_KEYS = ("expiry_swept_on", "replenishment_run_on")
+
+def upgrade_schema(bind):
+    """
+    Additive schema sync for databases created before a model change.
+    create_all() only creates missing tables, so new nullable columns and new
+    indexes on existing tables are applied here. Nothing is dropped or altered.
+    """
+    inspector = inspect(bind)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        with bind.begin() as conn:
+            for column in table.columns:
+                if column.name in existing or column.primary_key or not column.nullable:
+                    continue
+                col_type = column.type.compile(dialect=bind.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}'))
+
+        for index in table.indexes:
+            index.create(bind, checkfirst=True)
+
+def backfill_data(bind):
+    """
+    One-off data backfills for rows written before a column existed. Each is a pass over
+    its table, so they run as an explicit step, not on every process start.
+    """
+    from backend.models import core
+    from backend.engines import sales_dates, scorecards
+    from backend.engines import shifts as shifts_engine
+    db = sessionmaker(autocommit=False, autoflush=False, bind=bind)()
+    try:
+        counts = {
+            "sales_dates": sales_dates.backfill_all(db),
+            "shift_times": shifts_engine.backfill_times(db),
+            "scorecards": scorecards.backfill_all(db),
+        }
+        counts["legacy_settings"] = db.query(core.Setting).filter(
+            core.Setting.key.in_(LEGACY_SETTING_KEYS)
+        ).delete(synchronize_session=False)
+        db.commit()
+        return counts
+    finally:
+        db.close()
+
+def migrate(bind):
+    from backend.models import core # registers every table on Base.metadata
+    Base.metadata.create_all(bind=bind)
+    upgrade_schema(bind)
+    return backfill_data(bind)
+
+if __name__ == "__main__":
+    # python -m backend.migrations  (after deploying a release with schema changes)
+    from backend.database_config import engine
+    print(migrate(engine))
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, String, Float, Integer, ForeignKey, DateTime, Date, Text, UniqueConstraint
+from datetime import datetime
+from sqlalchemy import Column, String, Float, Integer, ForeignKey, DateTime, Date, Text, UniqueConstraint, Index
 from sqlalchemy.sql import func
 from backend.database_config import Base
 
@@ -23,16 +24,20 @@ class Product(Base):
     stock_quantity = Column(Integer, default=0)
     tax_rate = Column(Float, default=0.0)
     science_tags = Column(String)
+    pack_size = Column(Integer, nullable=True) # supplier case size; orders are rounded up to it
+    supplier_id = Column(String, ForeignKey("suppliers.id"), nullable=True) # default supplier for replenishment
     updated_at = Column(DateTime, onupdate=func.now())
     created_at = Column(DateTime, server_default=func.now())
 
 class Transaction(Base):
     __tablename__ = "transactions"
+    __table_args__ = (Index('ix_transactions_account_sales_date', 'account_id', 'sales_date'),)
 
     id = Column(String, primary_key=True)
     account_id = Column(String, ForeignKey("accounts.id"), index=True)
     customer_id = Column(String, ForeignKey("customers.id"), nullable=True)
     timestamp = Column(DateTime, server_default=func.now(), index=True)
+    sales_date = Column(Date, nullable=True) # business day in the tenant's timezone
     total_amount = Column(Float, nullable=False)
     total_profit = Column(Float, nullable=False)
     payment_method = Column(String, default="CASH")
@@ -60,6 +65,8 @@ class Customer(Base):
     email = Column(String)
     city = Column(String, default="Unknown")
     pincode = Column(String, default="000000")
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
     loyalty_points = Column(Integer, default=0)
     created_at = Column(DateTime, server_default=func.now())
 
@@ -130,10 +137,36 @@ class PurchaseOrder(Base):
     order_date = Column(Date)
     expected_date = Column(Date)
     received_date = Column(Date)
-    status = Column(String, default="PENDING")
+    status = Column(String, default="PENDING") # DRAFT, PENDING, RECEIVED
     quality_rating = Column(Float)
     notes = Column(Text)
 
+class PurchaseOrderLine(Base):
+    __tablename__ = "purchase_order_lines"
+
+    id = Column(String, primary_key=True)
+    purchase_order_id = Column(String, ForeignKey("purchase_orders.id"), index=True)
+    account_id = Column(String, ForeignKey("accounts.id"), index=True)
+    product_id = Column(String, ForeignKey("products.id"))
+    quantity = Column(Integer)
+    unit_cost = Column(Float)
+
+class SupplierScorecard(Base):
+    __tablename__ = "supplier_scorecards"
+
+    supplier_id = Column(String, ForeignKey("suppliers.id"), primary_key=True)
+    account_id = Column(String, ForeignKey("accounts.id"), index=True)
+    po_count = Column(Integer, default=0) # received POs
+    timed_count = Column(Integer, default=0) # received POs with an expected date
+    on_time_count = Column(Integer, default=0)
+    total_delay_days = Column(Integer, default=0)
+    lead_count = Column(Integer, default=0) # received POs with an order date
+    total_lead_days = Column(Integer, default=0)
+    quality_ewma = Column(Float, nullable=True)
+    rated_count = Column(Integer, default=0)
+    last_received_date = Column(Date, nullable=True)
+    updated_at = Column(DateTime)
+
 class Staff(Base):
     __tablename__ = "staff"
 
@@ -146,11 +179,18 @@ class Staff(Base):
 
 class Shift(Base):
     __tablename__ = "shifts"
+    __table_args__ = (
+        Index('ix_shifts_date_staff', 'date', 'staff_id'),
+        Index('ix_shifts_staff_start', 'staff_id', 'start_time'),
+        Index('ix_shifts_start_time', 'start_time'),
+    )
 
     id = Column(String, primary_key=True)
     staff_id = Column(String, ForeignKey("staff.id"), index=True)
     date = Column(Date)
     slot = Column(String)
+    start_time = Column(DateTime, nullable=True) # local wall-clock time
+    end_time = Column(DateTime, nullable=True)
     created_at = Column(DateTime, server_default=func.now())
 
 class ProductBatch(Base):
@@ -159,11 +199,51 @@ class ProductBatch(Base):
     id = Column(String, primary_key=True)
     account_id = Column(String, ForeignKey("accounts.id"), index=True)
     product_id = Column(String, ForeignKey("products.id"), index=True)
+    purchase_order_id = Column(String, ForeignKey("purchase_orders.id"), nullable=True, index=True) # set by goods receipts
     batch_code = Column(String)
     expiry_date = Column(Date, index=True)
     quantity = Column(Integer)
     cost_price = Column(Float)
     created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow) # markdown pricing fingerprints on it
+
+    __table_args__ = (Index('ix_product_batches_account_expiry_qty', 'account_id', 'expiry_date', 'quantity'),)
+
+class ExpiryBucket(Base):
+    __tablename__ = "expiry_buckets"
+    __table_args__ = (Index('ix_expiry_buckets_account_tier', 'account_id', 'tier', 'expiry_date'),)
+
+    batch_id = Column(String, ForeignKey("product_batches.id"), primary_key=True)
+    account_id = Column(String, ForeignKey("accounts.id"), index=True)
+    product_id = Column(String, ForeignKey("products.id"))
+    tier = Column(String) # EXPIRED, TODAY, 2D, 7D, 30D
+    expiry_date = Column(Date)
+    quantity = Column(Integer)
+    value = Column(Float) # quantity x batch cost price
+    swept_on = Column(Date)
+
+class ExpiryAlert(Base):
+    __tablename__ = "expiry_alerts"
+    __table_args__ = (Index('ix_expiry_alerts_account_created', 'account_id', 'created_at'),)
+
+    id = Column(String, primary_key=True)
+    account_id = Column(String, ForeignKey("accounts.id"), index=True)
+    batch_id = Column(String, ForeignKey("product_batches.id"))
+    product_id = Column(String, ForeignKey("products.id"))
+    tier = Column(String)
+    expiry_date = Column(Date)
+    quantity = Column(Integer)
+    created_at = Column(DateTime, server_default=func.now())
+    acknowledged_at = Column(DateTime, nullable=True)
+
+class JobRun(Base):
+    __tablename__ = "job_runs"
+
+    # Bookkeeping of per-tenant background jobs, kept out of the user-editable settings
+    account_id = Column(String, ForeignKey("accounts.id"), primary_key=True)
+    job = Column(String, primary_key=True) # expiry_sweep, replenishment
+    run_on = Column(Date) # tenant business day of the last completed run
+    updated_at = Column(DateTime)
 
 class DailyContext(Base):
     __tablename__ = "daily_context"
@@ -173,9 +253,11 @@ class DailyContext(Base):
     weather_tag = Column(String)
     event_tag = Column(String)
     notes = Column(Text)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow) # the demand cube fingerprints on it
 
 class B2BDeal(Base):
     __tablename__ = "b2b_deals"
+    __table_args__ = (Index('ix_b2b_deals_updated', 'updated_at'),)
 
     id = Column(String, primary_key=True)
     account_id = Column(String, ForeignKey("accounts.id"), index=True)
@@ -184,7 +266,13 @@ class B2BDeal(Base):
     quantity = Column(Integer)
     price_per_unit = Column(Float)
     acc_phone = Column(String)
+    kind = Column(String, nullable=True) # OFFER (default), REQUEST
+    category = Column(String, nullable=True)
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    status = Column(String, nullable=True) # OPEN (default), CLOSED
     created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, nullable=True) # set on every write; the marketplace index refreshes from it
 
 class CrowdCampaign(Base):
     __tablename__ = "crowd_campaigns"
@@ -201,6 +289,7 @@ class CrowdCampaign(Base):
 
 class VoiceLog(Base):
     __tablename__ = "voice_logs"
+    __table_args__ = (Index('ix_voice_logs_account_created', 'account_id', 'created_at'),)
 
     id = Column(String, primary_key=True)
     account_id = Column(String, ForeignKey("accounts.id"), index=True)
@@ -208,3 +297,42 @@ class VoiceLog(Base):
     action_extracted = Column(String, default="AUDIT")
     confidence_score = Column(Float, default=0.0)
     created_at = Column(DateTime, server_default=func.now())
+
+class CycleCountSession(Base):
+    __tablename__ = "cycle_count_sessions"
+
+    id = Column(String, primary_key=True)
+    account_id = Column(String, ForeignKey("accounts.id"), index=True)
+    status = Column(String, default="OPEN") # OPEN, APPLIED
+    created_by = Column(String)
+    created_at = Column(DateTime, server_default=func.now())
+    applied_at = Column(DateTime, nullable=True)
+
+class CycleCountEntry(Base):
+    __tablename__ = "cycle_count_entries"
+
+    id = Column(String, primary_key=True)
+    session_id = Column(String, ForeignKey("cycle_count_sessions.id"), index=True)
+    account_id = Column(String, ForeignKey("accounts.id"))
+    seq = Column(Integer) # spoken order within the session
+    transcript = Column(Text)
+    action = Column(String)
+    qty = Column(Integer, default=0)
+    product_id = Column(String, nullable=True)
+    product_name = Column(String, nullable=True)
+    confidence_score = Column(Float, default=0.0)
+    status_msg = Column(String)
+    status = Column(String, default="ACTIVE") # ACTIVE, UNDONE, REJECTED
+    created_at = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (Index('ux_cycle_count_entries_session_seq', 'session_id', 'seq', unique=True),)
+
+class CycleCountVariance(Base):
+    __tablename__ = "cycle_count_variances"
+
+    session_id = Column(String, ForeignKey("cycle_count_sessions.id"), primary_key=True)
+    product_id = Column(String, primary_key=True)
+    account_id = Column(String, ForeignKey("accounts.id"), index=True)
+    expected_qty = Column(Integer)
+    counted_qty = Column(Integer)
+    variance = Column(Integer)
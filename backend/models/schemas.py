@@ -1,5 +1,5 @@
 from pydantic import BaseModel, ConfigDict, EmailStr
-from typing import Optional, List
+from typing import Dict, Optional, List
 from datetime import datetime, date
 
 class Token(BaseModel):
@@ -58,6 +58,8 @@ class ProductBase(BaseModel):
     stock_quantity: Optional[int] = 0
     tax_rate: Optional[float] = 0.0
     science_tags: Optional[str] = None
+    pack_size: Optional[int] = None
+    supplier_id: Optional[str] = None
 
 class ProductCreate(ProductBase):
     id: Optional[str] = None
@@ -71,6 +73,8 @@ class ProductUpdate(BaseModel):
     stock_quantity: Optional[int] = None
     tax_rate: Optional[float] = None
     science_tags: Optional[str] = None
+    pack_size: Optional[int] = None
+    supplier_id: Optional[str] = None
 
 class Product(ProductBase):
     id: str
@@ -85,6 +89,8 @@ class CustomerBase(BaseModel):
     email: Optional[str] = None
     city: Optional[str] = "Unknown"
     pincode: Optional[str] = "000000"
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
     loyalty_points: Optional[int] = 0
 
 class CustomerCreate(CustomerBase):
@@ -197,8 +203,72 @@ class PurchaseOrderCreate(PurchaseOrderBase):
 class PurchaseOrder(PurchaseOrderBase):
     id: str
     account_id: str
+    risk_warning: Optional[str] = None # set when the PO is raised with a risky supplier
     model_config = ConfigDict(from_attributes=True)
 
+class ReplenishmentSuggestion(BaseModel):
+    product_id: str
+    product_name: Optional[str] = None
+    supplier_id: Optional[str] = None # supplier of the last goods receipt
+    stock_quantity: int
+    on_order: int
+    daily_demand: float
+    lead_days: float
+    safety_stock: float
+    reorder_point: float
+    order_up_to: float
+    pack_size: int
+    order_qty: int
+    unit_cost: float
+
+class ReplenishmentRun(BaseModel):
+    run_on: date
+    suggestions: int
+    draft_orders: List[str]
+    unassigned: List[str] # products due for reorder with no known supplier
+
+class PurchaseOrderLine(BaseModel):
+    product_id: str
+    product_name: Optional[str] = None
+    quantity: int
+    unit_cost: Optional[float] = None
+
+class DraftPurchaseOrder(BaseModel):
+    purchase_order: PurchaseOrder
+    lines: List[PurchaseOrderLine]
+    total_cost: float
+
+class SupplierScorecard(BaseModel):
+    supplier_id: str
+    supplier_name: Optional[str] = None
+    category_specialty: Optional[str] = None
+    po_count: int
+    on_time_rate: Optional[float] = None # % of received POs on or before the expected date
+    mean_delay_days: Optional[float] = None
+    mean_lead_days: Optional[float] = None # order to receipt
+    quality_score: Optional[float] = None # EWMA of quality ratings, 0-5
+    last_received_date: Optional[date] = None
+    risk: str # Low, Medium, High
+    risk_reasons: List[str] = []
+
+class GoodsReceiptLine(BaseModel):
+    product_id: str
+    batch_code: str
+    expiry_date: date
+    quantity: int
+    cost_price: float
+
+class GoodsReceipt(BaseModel):
+    lines: List[GoodsReceiptLine]
+    received_date: Optional[date] = None # defaults to the tenant's business day
+    quality_rating: Optional[float] = None # 0-5
+
+class GoodsReceiptResult(BaseModel):
+    purchase_order: PurchaseOrder
+    batches: int
+    units: int
+    products: int
+
 # --- ShiftSmart Schemas ---
 class StaffBase(BaseModel):
     name: str
@@ -219,6 +289,8 @@ class ShiftBase(BaseModel):
     staff_id: str
     date: date
     slot: str
+    start_time: Optional[datetime] = None # local; derived from the slot when omitted
+    end_time: Optional[datetime] = None
 
 class ShiftCreate(ShiftBase):
     id: Optional[str] = None
@@ -228,6 +300,45 @@ class Shift(ShiftBase):
     created_at: datetime
     model_config = ConfigDict(from_attributes=True)
 
+class ShiftView(Shift):
+    staff_name: Optional[str] = None
+    role: Optional[str] = None
+    hourly_rate: Optional[float] = None
+
+class ShiftBulkCreate(BaseModel):
+    shifts: List[ShiftBase]
+
+class ShiftWeekReplace(BaseModel):
+    start_date: date # the 7 days from here are replaced
+    shifts: List[ShiftBase]
+
+class RosterRequest(BaseModel):
+    start_date: date
+    days: int = 7
+    max_hours: float = 48.0 # per person over the whole plan
+    apply: bool = False # True = create the proposed Shift rows
+
+class RosterSlot(BaseModel):
+    date: date
+    slot: str
+    hours: int
+    expected_txns: float
+    peak_txns_per_hour: float
+    required: int
+    existing: List[str] # staff already rostered
+    assigned: List[str] # staff proposed by the solver
+    shortfall: int
+    cost: float
+
+class RosterPlan(BaseModel):
+    start: date
+    days: int
+    applied: bool
+    total_cost: float
+    shortfall: int
+    slots: List[RosterSlot]
+    staff_hours: Dict[str, float]
+
 # --- FreshFlow Schemas ---
 class ProductBatchBase(BaseModel):
     product_id: str
@@ -246,6 +357,57 @@ class ProductBatch(ProductBatchBase):
     created_at: datetime
     model_config = ConfigDict(from_attributes=True)
 
+class BatchMarkdown(BaseModel):
+    batch_id: str
+    product_id: str
+    product_name: str
+    batch_code: str
+    expiry_date: date
+    quantity: int
+    cost_price: float
+    days_left: int
+    expired: bool
+    suggested_discount: float
+    current_price: float
+    new_price: float
+    total_risk: float
+
+class ExpiryTier(BaseModel):
+    tier: str
+    batches: int
+    quantity: int
+    value: float
+
+class ExpiryCalendarItem(BaseModel):
+    batch_id: str
+    batch_code: Optional[str] = None
+    product_id: Optional[str] = None
+    product_name: str
+    tier: str
+    expiry_date: date
+    days_left: int
+    quantity: int
+    value: float
+
+class ExpiryCalendar(BaseModel):
+    as_of: date
+    tiers: List[ExpiryTier]
+    items: List[ExpiryCalendarItem]
+
+class ExpiryAlert(BaseModel):
+    id: str
+    batch_id: str
+    product_id: Optional[str] = None
+    product_name: str
+    tier: str # tier the batch crossed into
+    expiry_date: date
+    quantity: int
+    created_at: datetime
+    acknowledged_at: Optional[datetime] = None
+
+class ExpiryAlertAck(BaseModel):
+    alert_ids: List[str]
+
 # --- Misc Schemas ---
 class DailyContextBase(BaseModel):
     date: date
@@ -266,6 +428,10 @@ class B2BDealBase(BaseModel):
     quantity: int
     price_per_unit: float
     acc_phone: Optional[str] = None
+    kind: Optional[str] = "OFFER" # OFFER: stock for sale, REQUEST: stock wanted
+    category: Optional[str] = None
+    latitude: Optional[float] = None # defaults to the "store_location" setting
+    longitude: Optional[float] = None
 
 class B2BDealCreate(B2BDealBase):
     id: Optional[str] = None
@@ -274,9 +440,28 @@ class B2BDealCreate(B2BDealBase):
 class B2BDeal(B2BDealBase):
     id: str
     account_id: str
+    status: Optional[str] = "OPEN"
     created_at: datetime
     model_config = ConfigDict(from_attributes=True)
 
+class MarketListing(BaseModel):
+    deal_id: str
+    kind: str
+    store_name: Optional[str] = None
+    product_name: str
+    category: Optional[str] = None
+    quantity: Optional[int] = None
+    price_per_unit: Optional[float] = None
+    acc_phone: Optional[str] = None
+    similarity: float # trigram similarity of the product names, 0-1
+    distance_km: Optional[float] = None
+
+class LowStockMatch(BaseModel):
+    product_id: str
+    product_name: str
+    stock_quantity: int
+    offers: List[MarketListing]
+
 class CrowdCampaignBase(BaseModel):
     item_name: str
     description: Optional[str] = None
@@ -315,11 +500,37 @@ class DemandPredictionRequest(BaseModel):
 class PredictionItem(BaseModel):
     product_name: str
     total_qty: int
+    avg_daily_qty: float = 0.0
+    days_observed: int = 0 # days with this weather/event context behind the estimate
 
 class DemandPredictionResponse(BaseModel):
     context: str
     predictions: List[PredictionItem]
 
+class ForecastPoint(BaseModel):
+    date: date
+    qty: float
+    lower: float # 95% interval
+    upper: float
+    weather_tag: Optional[str] = None # planned context applied to this day, if any
+    event_tag: Optional[str] = None
+
+class ProductForecast(BaseModel):
+    product_id: str
+    product_name: Optional[str] = None
+    alpha: float # fitted level smoothing rate
+    points: List[ForecastPoint]
+
+class BacktestResult(BaseModel):
+    model: str
+    wape: Optional[float] = None # sum |error| / sum actual
+    mape: Optional[float] = None # over product-days with sales
+    seconds: float # fit + predict time over all folds
+    seconds_per_fold: float
+    folds: int
+    products: int
+    horizon: int
+
 # --- VoiceAudit ---
 class VoiceLogBase(BaseModel):
     transcript: str
@@ -336,6 +547,53 @@ class VoiceLog(VoiceLogBase):
     created_at: datetime
     model_config = ConfigDict(from_attributes=True)
 
+class VoiceCommandBatch(BaseModel):
+    transcripts: List[str]
+    apply: bool = True # False = parse and resolve only
+
+class VoiceCommandResult(BaseModel):
+    transcript: str
+    action: str # ADD, SET, REMOVE, UNKNOWN
+    qty: int
+    product_id: Optional[str] = None
+    product_name: Optional[str] = None
+    confidence: float
+    status_msg: str
+    applied: bool
+    new_stock: Optional[int] = None
+
+class CycleCountCommands(BaseModel):
+    transcripts: List[str]
+
+class CycleCountEntry(BaseModel):
+    id: str
+    seq: int
+    transcript: str
+    action: str
+    qty: int
+    product_id: Optional[str] = None
+    product_name: Optional[str] = None
+    confidence_score: float
+    status_msg: str
+    status: str # ACTIVE, UNDONE, REJECTED
+    model_config = ConfigDict(from_attributes=True)
+
+class CycleCountLine(BaseModel):
+    product_id: str
+    product_name: Optional[str] = None
+    expected_qty: int
+    counted_qty: int
+    variance: int
+
+class CycleCountSession(BaseModel):
+    id: str
+    status: str # OPEN, APPLIED
+    created_by: Optional[str] = None
+    created_at: Optional[datetime] = None
+    applied_at: Optional[datetime] = None
+    entries: List[CycleCountEntry] = []
+    lines: List[CycleCountLine] = [] # preview while OPEN, recorded variance once APPLIED
+
 # --- ChurnGuard ---
 class ChurnRisk(BaseModel):
     customer_id: str
@@ -352,6 +610,25 @@ class GeoPoint(BaseModel):
     lng: float
     value: float # e.g. total sales or customer count
 
+class GeoCell(BaseModel):
+    lat: float # cell centre
+    lng: float
+    value: float # total sales in the cell
+    customers: int
+
+class GeoGrid(BaseModel):
+    zoom: int # effective zoom (coarsened if the viewport was too large)
+    cell_size: float # degrees
+    cells: List[GeoCell]
+
+class CatchmentZone(BaseModel):
+    lat: float # spend-weighted centroid
+    lng: float
+    radius_km: float # 90th percentile customer distance from the centroid
+    customers: int
+    revenue: float
+    revenue_share: float # 0-1
+
 # --- ShelfSense ---
 class ShelfInsight(BaseModel):
     product_id: str
@@ -361,6 +638,35 @@ class ShelfInsight(BaseModel):
     metric: float # e.g. Days to Expiry, or Days Since Last Sale
     severity: str # High, Medium, Low
 
+class PlanogramGrid(BaseModel):
+    label: Optional[str] = None # e.g. aisle/bay name
+    cells: List[List[Optional[str]]] # rows of product names, None/"" for empty slots
+
+class ShelfAnalyzeRequest(BaseModel):
+    grids: List[PlanogramGrid]
+
+class ShelfConflict(BaseModel):
+    cell_a: List[int] # [row, col]
+    cell_b: List[int]
+    product_a: str
+    product_b: str
+
+class ShelfAnalysis(BaseModel):
+    label: Optional[str] = None
+    score: int # 0-100
+    logs: List[str]
+    conflicts: List[ShelfConflict]
+
+class ProductVelocity(BaseModel):
+    product_id: str
+    product_name: str
+    stock_quantity: int
+    units_7d: int
+    units_30d: int
+    units_90d: int
+    daily_velocity: float # units/day over the last 30 days
+    days_of_cover: Optional[float] = None # None when nothing sold in 30 days
+
 # --- Online Ordering ---
 class OnlineOrder(BaseModel):
     order_id: str
@@ -1,11 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from typing import List
-from datetime import date
+from datetime import date, datetime
 from backend.database_config import get_db
 from backend.models import schemas, core
 from backend.crud import modules
 from backend.auth import get_current_user
+from backend.engines.shifts import ShiftConflict
+from backend.engines import markdown
 
 router = APIRouter(
     prefix="/modules",
@@ -29,6 +31,13 @@ def create_supplier(
     supplier_create = schemas.SupplierCreate(**supplier.model_dump(), account_id=current_user.account_id)
     return modules.create_supplier(db, supplier_create)
 
+@router.get("/suppliers/scorecards", response_model=List[schemas.SupplierScorecard])
+def read_supplier_scorecards(
+    db: Session = Depends(get_db),
+    current_user: core.User = Depends(get_current_user)
+):
+    return modules.get_supplier_scorecards(db, current_user.account_id)
+
 @router.get("/purchase-orders", response_model=List[schemas.PurchaseOrder])
 def read_pos(
     db: Session = Depends(get_db),
@@ -45,6 +54,39 @@ def create_po(
     po_create = schemas.PurchaseOrderCreate(**po.model_dump(), account_id=current_user.account_id)
     return modules.create_purchase_order(db, po_create)
 
+@router.post("/purchase-orders/{po_id}/place", response_model=schemas.PurchaseOrder)
+def place_purchase_order(
+    po_id: str,
+    db: Session = Depends(get_db),
+    current_user: core.User = Depends(get_current_user)
+):
+    try:
+        po = modules.place_purchase_order(db, current_user.account_id, po_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if po is None:
+        raise HTTPException(status_code=404, detail="Purchase order not found")
+    return po
+
+MAX_RECEIPT_LINES = 2000
+
+@router.post("/purchase-orders/{po_id}/receive", response_model=schemas.GoodsReceiptResult)
+def receive_purchase_order(
+    po_id: str,
+    receipt: schemas.GoodsReceipt,
+    db: Session = Depends(get_db),
+    current_user: core.User = Depends(get_current_user)
+):
+    if len(receipt.lines) > MAX_RECEIPT_LINES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_RECEIPT_LINES} lines per goods receipt")
+    try:
+        result = modules.receive_purchase_order(db, current_user.account_id, po_id, receipt)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Purchase order not found")
+    return result
+
 # --- ShiftSmart ---
 @router.get("/staff", response_model=List[schemas.Staff])
 def read_staff(
@@ -62,6 +104,58 @@ def create_staff(
     staff_create = schemas.StaffCreate(**staff.model_dump(), account_id=current_user.account_id)
     return modules.create_staff(db, staff_create)
 
+MAX_SHIFT_RANGE_DAYS = 62
+MAX_SHIFT_BATCH = 2000
+
+@router.get("/shifts", response_model=List[schemas.ShiftView])
+def list_shifts(
+    start: date,
+    end: date,
+    db: Session = Depends(get_db),
+    current_user: core.User = Depends(get_current_user)
+):
+    if end < start or (end - start).days >= MAX_SHIFT_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"Range must be 1 to {MAX_SHIFT_RANGE_DAYS} days")
+    return modules.list_shifts(db, current_user.account_id, start, end)
+
+@router.post("/shifts/bulk", response_model=List[schemas.Shift])
+def create_shifts(
+    batch: schemas.ShiftBulkCreate,
+    db: Session = Depends(get_db),
+    current_user: core.User = Depends(get_current_user)
+):
+    if len(batch.shifts) > MAX_SHIFT_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_SHIFT_BATCH} shifts per request")
+    try:
+        return modules.create_shifts(db, current_user.account_id, batch.shifts)
+    except ShiftConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.put("/shifts/week", response_model=List[schemas.Shift])
+def replace_week(
+    week: schemas.ShiftWeekReplace,
+    db: Session = Depends(get_db),
+    current_user: core.User = Depends(get_current_user)
+):
+    if len(week.shifts) > MAX_SHIFT_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_SHIFT_BATCH} shifts per request")
+    try:
+        return modules.replace_week(db, current_user.account_id, week.start_date, week.shifts)
+    except ShiftConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/shifts/on-duty", response_model=List[schemas.ShiftView])
+def read_on_duty(
+    at: datetime,
+    db: Session = Depends(get_db),
+    current_user: core.User = Depends(get_current_user)
+):
+    return modules.get_on_duty(db, current_user.account_id, at)
+
 @router.get("/shifts/{staff_id}", response_model=List[schemas.Shift])
 def read_shifts(
     staff_id: str,
@@ -76,9 +170,56 @@ def create_shift(
     db: Session = Depends(get_db),
     current_user: core.User = Depends(get_current_user)
 ):
-    return modules.create_shift(db, shift)
+    try:
+        return modules.create_shift(db, current_user.account_id, shift)
+    except ShiftConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+MAX_ROSTER_DAYS = 31
+
+@router.post("/shifts/roster", response_model=schemas.RosterPlan)
+def build_roster(
+    request: schemas.RosterRequest,
+    db: Session = Depends(get_db),
+    current_user: core.User = Depends(get_current_user)
+):
+    if not 1 <= request.days <= MAX_ROSTER_DAYS:
+        raise HTTPException(status_code=400, detail=f"days must be between 1 and {MAX_ROSTER_DAYS}")
+    try:
+        return modules.build_roster(db, current_user.account_id, request)
+    except ShiftConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# --- Replenishment ---
+@router.get("/replenishment/suggestions", response_model=List[schemas.ReplenishmentSuggestion])
+def read_replenishment_suggestions(
+    supplier_id: str = None,
+    db: Session = Depends(get_db),
+    current_user: core.User = Depends(get_current_user)
+):
+    return modules.get_replenishment_plan(db, current_user.account_id, supplier_id)
+
+@router.post("/replenishment/run", response_model=schemas.ReplenishmentRun)
+def run_replenishment(
+    db: Session = Depends(get_db),
+    current_user: core.User = Depends(get_current_user)
+):
+    return modules.run_replenishment(db, current_user.account_id)
+
+@router.get("/replenishment/drafts", response_model=List[schemas.DraftPurchaseOrder])
+def read_draft_purchase_orders(
+    db: Session = Depends(get_db),
+    current_user: core.User = Depends(get_current_user)
+):
+    return modules.get_draft_purchase_orders(db, current_user.account_id)
 
 # --- FreshFlow ---
+MAX_MARKDOWN_LOOKAHEAD = markdown.MAX_LOOKAHEAD_DAYS
+
 @router.get("/batches", response_model=List[schemas.ProductBatch])
 def read_batches(
     db: Session = Depends(get_db),
@@ -86,6 +227,45 @@ def read_batches(
 ):
     return modules.get_batches(db, current_user.account_id)
 
+@router.get("/batches/markdowns", response_model=List[schemas.BatchMarkdown])
+def read_batch_markdowns(
+    lookahead: int = Query(None, ge=0, le=MAX_MARKDOWN_LOOKAHEAD), # default: the tenant's last tier
+    db: Session = Depends(get_db),
+    current_user: core.User = Depends(get_current_user)
+):
+    return modules.get_markdowns(db, current_user.account_id, lookahead)
+
+@router.get("/batches/expiry-calendar", response_model=schemas.ExpiryCalendar)
+def read_expiry_calendar(
+    tier: str = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
+    db: Session = Depends(get_db),
+    current_user: core.User = Depends(get_current_user)
+):
+    try:
+        return modules.get_expiry_calendar(db, current_user.account_id, tier, skip, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/batches/expiry-alerts", response_model=List[schemas.ExpiryAlert])
+def read_expiry_alerts(
+    pending_only: bool = True,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
+    db: Session = Depends(get_db),
+    current_user: core.User = Depends(get_current_user)
+):
+    return modules.get_expiry_alerts(db, current_user.account_id, pending_only, skip, limit)
+
+@router.post("/batches/expiry-alerts/ack")
+def acknowledge_expiry_alerts(
+    ack: schemas.ExpiryAlertAck,
+    db: Session = Depends(get_db),
+    current_user: core.User = Depends(get_current_user)
+):
+    return modules.acknowledge_expiry_alerts(db, current_user.account_id, ack.alert_ids)
+
 @router.post("/batches", response_model=schemas.ProductBatch)
 def create_batch(
     batch: schemas.ProductBatchBase,
@@ -93,7 +273,10 @@ def create_batch(
     current_user: core.User = Depends(get_current_user)
 ):
     batch_create = schemas.ProductBatchCreate(**batch.model_dump(), account_id=current_user.account_id)
-    return modules.create_batch(db, batch_create)
+    try:
+        return modules.create_batch(db, batch_create)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 # --- IsoBar ---
 @router.get("/daily-context/{date_str}", response_model=schemas.DailyContext)
@@ -107,6 +290,31 @@ def read_daily_context(
         raise HTTPException(status_code=404, detail="No context for this date")
     return ctx
 
+@router.get("/isobar/forecast", response_model=List[schemas.ProductForecast])
+def read_demand_forecast(
+    days: int = Query(7, ge=1, le=60),
+    product_id: str = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    current_user: core.User = Depends(get_current_user)
+):
+    return modules.get_demand_forecast(db, current_user.account_id, days, product_id, skip, limit)
+
+@router.get("/isobar/backtest", response_model=List[schemas.BacktestResult])
+def run_forecast_backtest(
+    horizon: int = Query(7, ge=1, le=60),
+    folds: int = Query(4, ge=1, le=52),
+    models: str = None, # comma-separated, default all
+    db: Session = Depends(get_db),
+    current_user: core.User = Depends(get_current_user)
+):
+    names = [m.strip() for m in models.split(",") if m.strip()] if models else None
+    try:
+        return modules.run_forecast_backtest(db, current_user.account_id, horizon, folds, names)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.post("/daily-context", response_model=schemas.DailyContext)
 def set_daily_context(
     ctx: schemas.DailyContextBase,
@@ -131,7 +339,46 @@ def create_b2b_deal(
     current_user: core.User = Depends(get_current_user)
 ):
     deal_create = schemas.B2BDealCreate(**deal.model_dump(), account_id=current_user.account_id)
-    return modules.create_b2b_deal(db, deal_create)
+    try:
+        return modules.create_b2b_deal(db, deal_create)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/b2b-deals/{deal_id}/close", response_model=schemas.B2BDeal)
+def close_b2b_deal(
+    deal_id: str,
+    db: Session = Depends(get_db),
+    current_user: core.User = Depends(get_current_user)
+):
+    deal = modules.close_b2b_deal(db, current_user.account_id, deal_id)
+    if deal is None:
+        raise HTTPException(status_code=404, detail="Deal not found")
+    return deal
+
+@router.get("/stockswap/search", response_model=List[schemas.MarketListing])
+def search_stockswap(
+    q: str,
+    kind: str = "OFFER", # OFFER: who sells it, REQUEST: who needs it
+    category: str = None,
+    lat: float = None,
+    lng: float = None,
+    radius_km: float = Query(50.0, gt=0),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: core.User = Depends(get_current_user)
+):
+    try:
+        return modules.search_marketplace(db, current_user.account_id, q, kind, category, lat, lng, radius_km, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/stockswap/matches", response_model=List[schemas.LowStockMatch])
+def read_stockswap_matches(
+    radius_km: float = Query(50.0, gt=0),
+    db: Session = Depends(get_db),
+    current_user: core.User = Depends(get_current_user)
+):
+    return modules.match_low_stock_offers(db, current_user.account_id, radius_km)
 
 # --- CrowdStock ---
 @router.get("/crowd-campaigns", response_model=List[schemas.CrowdCampaign])
@@ -161,10 +408,13 @@ def vote_campaign(
 # --- VoiceAudit ---
 @router.get("/voice-logs", response_model=List[schemas.VoiceLog])
 def read_voice_logs(
+    limit: int = Query(100, ge=1, le=500),
+    before: datetime = None,
+    before_id: str = None,
     db: Session = Depends(get_db),
     current_user: core.User = Depends(get_current_user)
 ):
-    return modules.get_voice_logs(db, current_user.account_id)
+    return modules.get_voice_logs(db, current_user.account_id, limit, before, before_id)
 
 @router.post("/voice-logs", response_model=schemas.VoiceLog)
 def create_voice_log(
@@ -175,6 +425,84 @@ def create_voice_log(
     log_create = schemas.VoiceLogCreate(**log.model_dump(), account_id=current_user.account_id)
     return modules.create_voice_log(db, log_create)
 
+MAX_VOICE_BATCH = 5000
+
+@router.post("/voice/commands", response_model=List[schemas.VoiceCommandResult])
+def process_voice_commands(
+    batch: schemas.VoiceCommandBatch,
+    db: Session = Depends(get_db),
+    current_user: core.User = Depends(get_current_user)
+):
+    if len(batch.transcripts) > MAX_VOICE_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_VOICE_BATCH} transcripts per batch")
+    return modules.process_voice_commands(db, current_user.account_id, batch)
+
+MAX_CYCLE_COUNT_BATCH = 1000
+
+@router.post("/voice/sessions", response_model=schemas.CycleCountSession)
+def create_cycle_count(
+    db: Session = Depends(get_db),
+    current_user: core.User = Depends(get_current_user)
+):
+    return modules.create_cycle_count(db, current_user.account_id, current_user.username)
+
+@router.get("/voice/sessions/{session_id}", response_model=schemas.CycleCountSession)
+def read_cycle_count(
+    session_id: str,
+    db: Session = Depends(get_db),
+    current_user: core.User = Depends(get_current_user)
+):
+    session = modules.get_cycle_count(db, current_user.account_id, session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session
+
+@router.post("/voice/sessions/{session_id}/commands", response_model=schemas.CycleCountSession)
+def add_cycle_count_commands(
+    session_id: str,
+    commands: schemas.CycleCountCommands,
+    db: Session = Depends(get_db),
+    current_user: core.User = Depends(get_current_user)
+):
+    if len(commands.transcripts) > MAX_CYCLE_COUNT_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_CYCLE_COUNT_BATCH} transcripts per request")
+    try:
+        session = modules.add_cycle_count_commands(db, current_user.account_id, session_id, commands)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session
+
+@router.post("/voice/sessions/{session_id}/undo", response_model=schemas.CycleCountSession)
+def undo_cycle_count_entry(
+    session_id: str,
+    entry_id: str = None,
+    db: Session = Depends(get_db),
+    current_user: core.User = Depends(get_current_user)
+):
+    try:
+        session = modules.undo_cycle_count_entry(db, current_user.account_id, session_id, entry_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session
+
+@router.post("/voice/sessions/{session_id}/apply", response_model=schemas.CycleCountSession)
+def apply_cycle_count(
+    session_id: str,
+    db: Session = Depends(get_db),
+    current_user: core.User = Depends(get_current_user)
+):
+    try:
+        session = modules.apply_cycle_count(db, current_user.account_id, session_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session
+
 # --- ChurnGuard ---
 @router.get("/churn-risk", response_model=List[schemas.ChurnRisk])
 def read_churn_risk(
@@ -191,13 +519,72 @@ def read_geoviz(
 ):
     return modules.get_geo_data(db, current_user.account_id)
 
+@router.get("/geoviz/grid", response_model=schemas.GeoGrid)
+def read_geoviz_grid(
+    zoom: int = Query(6, ge=0, le=18),
+    min_lat: float = Query(-90.0, ge=-90.0, le=90.0),
+    min_lng: float = Query(-180.0, ge=-180.0, le=180.0),
+    max_lat: float = Query(90.0, ge=-90.0, le=90.0),
+    max_lng: float = Query(180.0, ge=-180.0, le=180.0),
+    db: Session = Depends(get_db),
+    current_user: core.User = Depends(get_current_user)
+):
+    if min_lat > max_lat or min_lng > max_lng:
+        raise HTTPException(status_code=400, detail="Invalid viewport bounds")
+    return modules.get_geo_grid(db, current_user.account_id, zoom, min_lat, min_lng, max_lat, max_lng)
+
+@router.get("/geoviz/catchments", response_model=List[schemas.CatchmentZone])
+def read_geoviz_catchments(
+    k: int = Query(5, ge=1, le=50),
+    db: Session = Depends(get_db),
+    current_user: core.User = Depends(get_current_user)
+):
+    return modules.get_catchment_zones(db, current_user.account_id, k)
+
 # --- ShelfSense ---
 @router.get("/shelf-sense", response_model=List[schemas.ShelfInsight])
 def read_shelf_sense(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
+    db: Session = Depends(get_db),
+    current_user: core.User = Depends(get_current_user)
+):
+    return modules.get_shelf_insights(db, current_user.account_id, skip, limit)
+
+@router.get("/shelf-sense/expiry", response_model=List[schemas.ShelfInsight])
+def read_shelf_sense_expiry(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
+    db: Session = Depends(get_db),
+    current_user: core.User = Depends(get_current_user)
+):
+    return modules.get_expiry_insights(db, current_user.account_id, skip, limit)
+
+@router.get("/shelf-sense/stagnant", response_model=List[schemas.ProductVelocity])
+def read_shelf_sense_stagnant(
+    threshold_days: float = Query(60, gt=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    current_user: core.User = Depends(get_current_user)
+):
+    return modules.get_stagnant_stock(db, current_user.account_id, threshold_days, limit)
+
+MAX_PLANOGRAM_GRIDS = 500
+
+@router.post("/shelf-sense/analyze", response_model=List[schemas.ShelfAnalysis])
+def analyze_shelf_grids(
+    request: schemas.ShelfAnalyzeRequest,
     db: Session = Depends(get_db),
     current_user: core.User = Depends(get_current_user)
 ):
-    return modules.get_shelf_insights(db, current_user.account_id)
+    if not request.grids:
+        raise HTTPException(status_code=400, detail="No grids to analyze")
+    if len(request.grids) > MAX_PLANOGRAM_GRIDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_PLANOGRAM_GRIDS} grids per request")
+    for g in request.grids:
+        if not g.cells or any(len(row) != len(g.cells[0]) for row in g.cells):
+            raise HTTPException(status_code=400, detail="Each grid must be a non-empty rectangle")
+    return modules.analyze_shelf_grids(db, current_user.account_id, request.grids)
 
 # --- Online Ordering ---
 @router.get("/online-orders", response_model=List[schemas.OnlineOrder])
@@ -4,6 +4,7 @@ from backend.database_config import get_db
 from backend.models import schemas, core
 from backend.auth import get_current_user
 from backend.crud import base as crud_base
+from backend.engines import sales_dates
 from datetime import datetime
 
 router = APIRouter(
@@ -56,6 +57,7 @@ def process_checkout(
 
     # Create Transaction Record
     tx_id = crud_base.generate_unique_id(16)
+    now = datetime.utcnow()
     new_tx = core.Transaction(
         id=tx_id,
         account_id=aid,
@@ -64,7 +66,8 @@ def process_checkout(
         total_profit=total_profit,
         payment_method=transaction_data.payment_method,
         points_redeemed=transaction_data.points_redeemed,
-        timestamp=datetime.utcnow()
+        timestamp=now,
+        sales_date=sales_dates.local_date(now, sales_dates.get_timezone(db, aid))
     )
     
     db.add(new_tx)
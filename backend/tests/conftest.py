@@ -1,9 +1,13 @@
+import os
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
+# Keep the app's startup hook off the configured database; tests use the engine below
+os.environ["VYMIND_STARTUP_JOBS"] = "0"
+
 from backend.main import app
 from backend.database_config import Base, get_db
 
@@ -60,3 +64,11 @@ def client():
         
     # Drop tables
     Base.metadata.drop_all(bind=engine)
+
+@pytest.fixture
+def db_session():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
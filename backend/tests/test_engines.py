@@ -0,0 +1,192 @@
+import time
+import shelf_engine
+
+# Unit tests for the pure-Python engines at the repo root (no app or database needed)
+
+def _adjacent_pairs(grid):
+    rows, cols = len(grid), len(grid[0])
+    for r in range(rows):
+        for c in range(cols):
+            for nr, nc in ((r, c + 1), (r + 1, c)):
+                if nr < rows and nc < cols and grid[r][c] and grid[nr][nc]:
+                    yield grid[r][c], grid[nr][nc]
+
+def test_optimize_layout_removes_conflicts_and_never_regresses():
+    products = ["Apple", "Banana", "Onion", "Potato", "Chips", "Coke", "Beer", "Diapers", "Bread"]
+    # Row-major: Apple-Banana and Onion-Potato start out adjacent
+    start = [products[0:3], products[3:6], products[6:9]]
+    start_score, _ = shelf_engine.analyze_grid(start)
+    assert shelf_engine.find_conflicts(start)
+
+    result = shelf_engine.optimize_layout(products, 3, 3, time_budget=0.3, restarts=2, seed=1)
+    assert result["conflicts"] == 0
+    assert not shelf_engine.find_conflicts(result["grid"])
+    assert result["score"] >= start_score
+    assert sorted(p for row in result["grid"] for p in row) == sorted(products)
+
+def test_optimize_layout_keeps_an_already_optimal_layout():
+    # Only one product pair interacts; any arrangement keeping it adjacent is optimal
+    products = ["Chips", "Coke", "Rice", "Dal"]
+    start = [["Chips", "Coke"], ["Rice", "Dal"]]
+    result = shelf_engine.optimize_layout(products, 2, 2, time_budget=0.05, restarts=1, seed=3)
+    assert result["score"] >= shelf_engine.analyze_grid(start)[0]
+    assert ("Chips", "Coke") in {tuple(sorted(p)) for p in _adjacent_pairs(result["grid"])}
+
+class _InlinePool:
+    """Runs ProcessPoolExecutor.map in-process, so the test can see what each job is given."""
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        return False
+    def map(self, fn, jobs):
+        return [fn(job) for job in jobs]
+
+def test_optimize_layout_splits_budget_across_waves(monkeypatch):
+    budgets = []
+    def fake_anneal(job):
+        budgets.append(job[4])
+        return 0.0, list(job[0]), 0
+    monkeypatch.setattr(shelf_engine, "_anneal", fake_anneal)
+    monkeypatch.setattr(shelf_engine, "ProcessPoolExecutor", _InlinePool)
+
+    products = ["Apple", "Banana", "Onion", "Potato"]
+    # Each job gets time_budget / ceil(restarts / workers)
+    for restarts, workers, waves in ((1, None, 1), (4, None, 4), (4, 2, 2), (3, 2, 2), (2, 8, 1)):
+        budgets.clear()
+        shelf_engine.optimize_layout(products, 2, 2, time_budget=1.2, restarts=restarts, workers=workers)
+        assert budgets == [1.2 / waves] * restarts, (restarts, workers)
+
+def test_optimize_layout_respects_time_budget():
+    # Loose bound: only catches runs that take the whole budget per restart
+    products = ["Apple", "Banana", "Onion", "Potato", "Chips", "Coke", "Beer", "Diapers"] * 4
+    started = time.perf_counter()
+    shelf_engine.optimize_layout(products, 6, 6, time_budget=0.4, restarts=4, seed=0)
+    assert time.perf_counter() - started < 2 * 0.4
+
+def test_optimize_layout_in_process_pool():
+    products = ["Apple", "Banana", "Onion", "Potato", "Chips", "Coke", "Beer", "Diapers", "Bread"]
+    result = shelf_engine.optimize_layout(products, 3, 3, time_budget=0.4, restarts=2, workers=2, seed=0)
+    assert result["conflicts"] == 0
+    assert sorted(p for row in result["grid"] for p in row) == sorted(products)
+
+# Reference implementations: the original substring tag lookup and per-direction rule loop
+def _substring_tags(product_name):
+    tags = []
+    for key, val in shelf_engine.PRODUCT_SCIENCE_DB.items():
+        if key.lower() in product_name.lower():
+            tags.extend(val)
+    return set(tags)
+
+def _substring_effects(name_a, name_b):
+    hits = []
+    for current, neighbor in ((name_a, name_b), (name_b, name_a))[:1 if name_a == name_b else 2]:
+        neighbor_tags = _substring_tags(neighbor)
+        for tag in _substring_tags(current):
+            rule = shelf_engine.KNOWLEDGE_BASE.get(tag)
+            if not rule:
+                continue
+            for key, hard in (('conflicts_with', True), ('boosts', False)):
+                for target in rule.get(key, []):
+                    if target in neighbor_tags:
+                        hits.append((rule['score'], f"{rule['msg']} ({current} ↔ {neighbor})", hard))
+    return sum(h[0] for h in hits), sorted(h[1] for h in hits), any(h[2] for h in hits)
+
+NAMES = [
+    "Apple", "Pineapple Juice", "Green Apple Banana Mix", "BANANA chips", "Onion Potato Combo", "Coke Zero",
+    "Diet Coke & Chips", "Craft Beer", "Diapers XL", "Bread Jam Milk Pack", "Milkshake", "Rice", "",
+]
+
+def test_tag_matcher_matches_substring_lookup():
+    matcher = shelf_engine.TagMatcher(shelf_engine.PRODUCT_SCIENCE_DB)
+    for name in NAMES:
+        assert set(matcher.tags_for(name)) == _substring_tags(name), name
+    # Overlapping keys: "Pineapple" contains "Apple", multi-tag names union every key
+    assert "ethylene_producer" in matcher.tags_for("Pineapple Juice")
+    assert matcher.tags_for("Bread Jam Milk Pack") == {"breakfast_staple", "breakfast_complement"}
+
+def test_rule_index_matches_both_direction_rule_loop():
+    matcher = shelf_engine.TagMatcher(shelf_engine.PRODUCT_SCIENCE_DB)
+    rules = shelf_engine.RuleIndex(shelf_engine.KNOWLEDGE_BASE)
+    for a in NAMES:
+        for b in NAMES:
+            x, y = (a, b) if a <= b else (b, a)
+            delta, logs, conflict = rules.pair_effects(x, y, matcher.tags_for(x), matcher.tags_for(y))
+            assert (delta, sorted(logs), conflict) == _substring_effects(x, y), (x, y)
+
+    # The rule lives on the second name of the sorted pair, so it is only found in the reverse direction
+    delta, logs, conflict = rules.pair_effects("Banana", "Pineapple Juice", matcher.tags_for("Banana"),
+                                               matcher.tags_for("Pineapple Juice"))
+    assert conflict and delta == -50 and logs[0].endswith("(Pineapple Juice ↔ Banana)")
+
+def test_pair_effects_are_memoized():
+    matcher = shelf_engine.TagMatcher(shelf_engine.PRODUCT_SCIENCE_DB)
+    rules = shelf_engine.RuleIndex(shelf_engine.KNOWLEDGE_BASE)
+    grid = [["Chips", "Coke", "Chips"], ["Coke", "Chips", "Coke"]]
+    first = shelf_engine.analyze_grid(grid, matcher, rules)
+    misses = rules.pair_effects.cache_info().misses
+    assert shelf_engine.analyze_grid(grid, matcher, rules) == first
+    assert rules.pair_effects.cache_info().misses == misses
+    assert rules.pair_effects.cache_info().hits >= 1
+
+def test_product_matcher_fuzzy_match():
+    import nlp_engine
+    products = [{"id": "P1", "name": "Maggi Noodles"}, {"id": "P2", "name": "Coca-Cola 500ml"},
+                {"id": "P3", "name": "Lays Classic"}, {"id": "P4", "name": ""}]
+    matcher = nlp_engine.ProductMatcher(products)
+    assert len(matcher.products) == 3 # unnamed products are not indexed
+
+    product, conf = matcher.match("maggi")
+    assert product["id"] == "P1" and conf > nlp_engine.MATCH_CUTOFF
+    assert matcher.match("coca cola")[0]["id"] == "P2"
+    assert matcher.match("lays")[0]["id"] == "P3"
+    assert matcher.match("zzzz") == (None, 0.0)
+    assert matcher.match("") == (None, 0.0)
+    assert nlp_engine.find_closest_product("Lays", products)[0]["id"] == "P3"
+
+def test_parse_command_text():
+    import nlp_engine
+    result, query = nlp_engine.parse_command_text("Add 50 Maggi")
+    assert (result["action"], result["qty"], query) == ("ADD", 50, "maggi")
+    result, query = nlp_engine.parse_command_text("Set stock of Coke to 20")
+    assert (result["action"], result["qty"], query) == ("SET", 20, "coke")
+    result, query = nlp_engine.parse_command_text("Sold 5 Lays")
+    assert (result["action"], result["qty"], query) == ("REMOVE", 5, "lays")
+
+    for text, msg in [("", "Empty command."), ("Add Maggi", "Could not find a quantity number."),
+                      ("Maggi 5", "Could not understand action (Add/Set/Sold)."), ("add 5", "Could not identify product name.")]:
+        result, query = nlp_engine.parse_command_text(text)
+        assert query is None and result["status_msg"] == msg
+
+class _Frame:
+    """The slice of the pandas DataFrame API get_product_matcher uses."""
+    def __init__(self, records):
+        self.records = records
+        self.empty = not records
+    def __getitem__(self, columns):
+        return _Frame([{c: r[c] for c in columns} for r in self.records])
+    def to_dict(self, orient):
+        return list(self.records)
+
+def test_get_product_matcher_reads_catalog_only_on_version_change(monkeypatch):
+    import sys
+    import types
+    import nlp_engine
+    fetches = []
+    catalog = _Frame([{"id": "P1", "name": "Maggi"}])
+    fake_db = types.SimpleNamespace(get_current_account_id=lambda: "T1",
+                                    fetch_all_products=lambda: fetches.append(1) or catalog)
+    monkeypatch.setitem(sys.modules, "database", fake_db)
+    nlp_engine.invalidate_product_matcher()
+
+    first = nlp_engine.get_product_matcher(1)
+    assert nlp_engine.get_product_matcher(1) is first and nlp_engine.get_product_matcher() is first
+    assert len(fetches) == 1
+
+    catalog = _Frame([{"id": "P1", "name": "Maggi"}, {"id": "P2", "name": "Parle G"}])
+    assert nlp_engine.parse_voice_command("Add 3 parle g", catalog_version=2)["product_id"] == "P2"
+    assert len(fetches) == 2
+    nlp_engine.invalidate_product_matcher("T1")
+    nlp_engine.get_product_matcher(2)
+    assert len(fetches) == 3
@@ -1,4 +1,5 @@
 import pytest
+from sqlalchemy.exc import IntegrityError
 
 def get_auth_headers(client):
     # Use Demo Admin
@@ -11,6 +12,39 @@ def get_auth_headers(client):
     token = response.json()["access_token"]
     return {"Authorization": f"Bearer {token}"}
 
+def tenant_headers(client, db_session, account_id):
+    # A tenant of its own, so the test only sees the data it seeds
+    from backend.models import core
+    from backend import auth as auth_utils
+    company = f"Test Store {account_id}"
+    if db_session.get(core.Account, account_id) is None:
+        db_session.add_all([
+            core.Account(id=account_id, company_name=company, status="ACTIVE"),
+            core.User(id=f"ADMIN_{account_id}", account_id=account_id, username="admin", email=f"admin@{account_id.lower()}.test",
+                      password_hash=auth_utils.get_password_hash("admin123"), role="super_admin"),
+        ])
+        db_session.commit()
+    token = client.post("/auth/login", json={"company_name": company, "username": "admin", "password": "admin123"}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+def seed_weekly_sales(db_session, account_id, prefix, days=56):
+    """One product selling 20 units on weekends and 5 on weekdays, for the `days` before today."""
+    from datetime import datetime, timedelta
+    from backend.models import core
+    from backend.engines import sales_dates
+    product_id = f"{prefix}_CHAI"
+    db_session.add(core.Product(id=product_id, account_id=account_id, name="Chai Patti", price=5.0, cost_price=4.0, stock_quantity=100))
+    today = sales_dates.today(db_session, account_id)
+    for back in range(1, days + 1):
+        day = today - timedelta(days=back)
+        qty = 20 if day.weekday() >= 5 else 5
+        db_session.add(core.Transaction(id=f"{prefix}_T{back}", account_id=account_id, timestamp=datetime.combine(day, datetime.min.time()),
+                                        sales_date=day, total_amount=qty * 5.0, total_profit=qty))
+        db_session.add(core.TransactionItem(id=f"{prefix}_I{back}", transaction_id=f"{prefix}_T{back}", product_id=product_id,
+                                            product_name="Chai Patti", quantity=qty))
+    db_session.commit()
+    return product_id, today
+
 def test_supplier_workflow(client):
     headers = get_auth_headers(client)
     
@@ -64,3 +98,755 @@ def test_staff_workflow(client):
     res = client.post("/modules/shifts", json=shift_data, headers=headers)
     assert res.status_code == 200
     assert res.json()["slot"] == "Morning"
+
+def test_geoviz_grid(client, db_session):
+    from datetime import datetime
+    from backend.models import core
+    aid = "GEO_G"
+    headers = tenant_headers(client, db_session, aid)
+
+    db_session.add_all([
+        core.Customer(id="GEO_C1", account_id=aid, name="A", city="Hyderabad", latitude=17.40, longitude=78.47),
+        core.Customer(id="GEO_C2", account_id=aid, name="B", city="Hyderabad", latitude=17.41, longitude=78.48),
+        core.Customer(id="GEO_C3", account_id=aid, name="C", city="Warangal", latitude=17.97, longitude=79.59),
+        core.Transaction(id="GEO_T1", account_id=aid, customer_id="GEO_C1", total_amount=100.0, total_profit=10.0, timestamp=datetime(2026, 1, 1, 10)),
+        core.Transaction(id="GEO_T2", account_id=aid, customer_id="GEO_C2", total_amount=50.0, total_profit=5.0, timestamp=datetime(2026, 1, 1, 11)),
+        core.Transaction(id="GEO_T3", account_id=aid, customer_id="GEO_C3", total_amount=70.0, total_profit=7.0, timestamp=datetime(2026, 1, 1, 11)),
+    ])
+    db_session.commit()
+
+    params = {"zoom": 8, "min_lat": 17.0, "min_lng": 78.0, "max_lat": 18.5, "max_lng": 80.0}
+    res = client.get("/modules/geoviz/grid", params=params, headers=headers)
+    assert res.status_code == 200
+    cells = sorted(res.json()["cells"], key=lambda c: c["value"])
+    assert [(c["value"], c["customers"]) for c in cells] == [(70.0, 1), (150.0, 2)]
+
+    # New sales are folded into the cached aggregate
+    db_session.add(core.Transaction(id="GEO_T4", account_id=aid, customer_id="GEO_C3", total_amount=30.0, total_profit=3.0, timestamp=datetime(2026, 1, 2, 9)))
+    db_session.commit()
+    res = client.get("/modules/geoviz/grid", params=params, headers=headers)
+    cells = sorted(res.json()["cells"], key=lambda c: c["value"])
+    assert [(c["value"], c["customers"]) for c in cells] == [(100.0, 1), (150.0, 2)]
+
+    # A sale committed late with a timestamp just behind the watermark is still picked up, once
+    db_session.add(core.Transaction(id="GEO_T5", account_id=aid, customer_id="GEO_C1", total_amount=20.0, total_profit=2.0, timestamp=datetime(2026, 1, 2, 8, 55)))
+    db_session.commit()
+    for _ in range(2):
+        cells = sorted(client.get("/modules/geoviz/grid", params=params, headers=headers).json()["cells"], key=lambda c: c["value"])
+        assert [(c["value"], c["customers"]) for c in cells] == [(100.0, 1), (170.0, 2)]
+
+    # Viewport excluding Warangal only returns the Hyderabad cell
+    res = client.get("/modules/geoviz/grid", params={**params, "max_lng": 78.6}, headers=headers)
+    assert len(res.json()["cells"]) == 1
+
+def test_geoviz_catchments(client, db_session):
+    from datetime import datetime
+    from backend.models import core
+    aid = "GEO_K"
+    headers = tenant_headers(client, db_session, aid)
+    db_session.add_all([
+        core.Customer(id="GK_C1", account_id=aid, name="A", city="Hyderabad", latitude=17.40, longitude=78.47),
+        core.Customer(id="GK_C2", account_id=aid, name="B", city="Hyderabad", latitude=17.41, longitude=78.48),
+        core.Customer(id="GK_C3", account_id=aid, name="C", city="Warangal", latitude=17.97, longitude=79.59),
+        core.Transaction(id="GK_T1", account_id=aid, customer_id="GK_C1", total_amount=100.0, total_profit=10.0, timestamp=datetime(2026, 1, 1, 10)),
+        core.Transaction(id="GK_T2", account_id=aid, customer_id="GK_C2", total_amount=50.0, total_profit=5.0, timestamp=datetime(2026, 1, 1, 11)),
+        core.Transaction(id="GK_T3", account_id=aid, customer_id="GK_C3", total_amount=70.0, total_profit=7.0, timestamp=datetime(2026, 1, 1, 11)),
+    ])
+    db_session.commit()
+
+    res = client.get("/modules/geoviz/catchments", params={"k": 2}, headers=headers)
+    assert res.status_code == 200
+    zones = res.json()
+    assert [z["customers"] for z in zones] == [2, 1]
+    assert abs(sum(z["revenue_share"] for z in zones) - 1.0) < 1e-9
+    assert abs(zones[0]["lat"] - 17.40) < 0.05 and zones[0]["radius_km"] < 5
+
+    # Deterministic: same input, same zones
+    assert client.get("/modules/geoviz/catchments", params={"k": 2}, headers=headers).json() == zones
+
+def test_shelf_sense_expiry_paging(client, db_session):
+    from datetime import date, timedelta
+    from backend.models import core
+    aid = "SS_EXP"
+    headers = tenant_headers(client, db_session, aid)
+    today = date.today()
+
+    db_session.add(core.Product(id="SS_P1", account_id=aid, name="Yogurt", price=40.0, cost_price=30.0, stock_quantity=10))
+    for i, days in enumerate([20, 3, 9, 40]):
+        db_session.add(core.ProductBatch(id=f"SS_B{i}", account_id=aid, product_id="SS_P1", batch_code=f"Y{i}",
+                                         expiry_date=today + timedelta(days=days), quantity=5, cost_price=30.0))
+    db_session.commit()
+
+    res = client.get("/modules/shelf-sense/expiry", params={"limit": 2}, headers=headers)
+    assert res.status_code == 200
+    assert [(i["metric"], i["product_name"]) for i in res.json()] == [(3.0, "Yogurt"), (9.0, "Yogurt")]
+
+    res = client.get("/modules/shelf-sense/expiry", params={"skip": 2, "limit": 2}, headers=headers)
+    assert [i["metric"] for i in res.json()] == [20.0]
+
+def test_shelf_sense_stagnant_stock(client, db_session):
+    from datetime import datetime, timedelta
+    from backend.models import core
+    aid = "SS_VEL"
+    headers = tenant_headers(client, db_session, aid)
+    now = datetime.now()
+
+    db_session.add_all([
+        core.Product(id="VEL_FAST", account_id=aid, name="Fast Mover", price=10.0, cost_price=8.0, stock_quantity=20),
+        core.Product(id="VEL_SLOW", account_id=aid, name="Slow Mover", price=10.0, cost_price=8.0, stock_quantity=300),
+        core.Product(id="VEL_DEAD", account_id=aid, name="Dead Stock", price=10.0, cost_price=8.0, stock_quantity=15),
+        core.Transaction(id="VEL_T1", account_id=aid, total_amount=100.0, total_profit=20.0, timestamp=now - timedelta(days=2)),
+        core.TransactionItem(id="VEL_I1", transaction_id="VEL_T1", product_id="VEL_FAST", product_name="Fast Mover", quantity=60, price_at_sale=10.0, cost_at_sale=8.0),
+        core.TransactionItem(id="VEL_I2", transaction_id="VEL_T1", product_id="VEL_SLOW", product_name="Slow Mover", quantity=30, price_at_sale=10.0, cost_at_sale=8.0),
+    ])
+    db_session.commit()
+
+    res = client.get("/modules/shelf-sense/stagnant", headers=headers)
+    assert res.status_code == 200
+    flagged = {p["product_id"]: p for p in res.json()}
+    assert "VEL_FAST" not in flagged # 20 units at 2/day = 10 days of cover
+    assert flagged["VEL_SLOW"]["days_of_cover"] == 300.0
+    assert flagged["VEL_DEAD"]["days_of_cover"] is None
+
+    # New sales are folded into the cached rollup
+    db_session.add_all([
+        core.Transaction(id="VEL_T2", account_id=aid, total_amount=10.0, total_profit=2.0, timestamp=now - timedelta(days=1)),
+        core.TransactionItem(id="VEL_I3", transaction_id="VEL_T2", product_id="VEL_SLOW", product_name="Slow Mover", quantity=120, price_at_sale=10.0, cost_at_sale=8.0),
+    ])
+    db_session.commit()
+    res = client.get("/modules/shelf-sense/stagnant", headers=headers)
+    assert "VEL_SLOW" not in {p["product_id"] for p in res.json()}
+
+def test_shelf_sense_analyze(client, monkeypatch):
+    from backend.engines import shelf as shelf_sense
+    headers = get_auth_headers(client)
+    grids = [
+        {"label": "Aisle 1", "cells": [["Banana", "Apple"], ["Chips", "Coke"]]},
+        {"label": "Aisle 2", "cells": [["Bread", None], ["Jam", "Milk"]]},
+    ]
+    res = client.post("/modules/shelf-sense/analyze", json={"grids": grids}, headers=headers)
+    assert res.status_code == 200
+    aisle1, aisle2 = res.json()
+    assert aisle1["score"] == 70
+    assert aisle1["conflicts"] == [{"cell_a": [0, 0], "cell_b": [0, 1], "product_a": "Banana", "product_b": "Apple"}]
+    assert aisle2["conflicts"] == [] and len(aisle2["logs"]) == 1
+
+    # Same results through the process pool
+    monkeypatch.setattr(shelf_sense, "POOL_MIN_CELLS", 0)
+    monkeypatch.setattr(shelf_sense, "MAX_WORKERS", 2)
+    pooled = client.post("/modules/shelf-sense/analyze", json={"grids": grids}, headers=headers)
+    shelf_sense.shutdown()
+    assert pooled.json() == [aisle1, aisle2]
+
+    res = client.post("/modules/shelf-sense/analyze", json={"grids": [{"cells": [["A", "B"], ["C"]]}]}, headers=headers)
+    assert res.status_code == 400
+
+def test_shelf_sense_tenant_tags_and_rules(client):
+    headers = get_auth_headers(client)
+    for name, tags in [("Alphonso Mango", "['ethylene_producer']"), ("Kiwi", "ethylene_sensitive"), ("Samosa", None)]:
+        res = client.post("/products", json={"name": name, "price": 10.0, "cost_price": 5.0, "science_tags": tags}, headers=headers)
+        assert res.status_code == 200
+
+    grid = {"cells": [["Alphonso Mango", "Kiwi", "Samosa"]]}
+    res = client.post("/modules/shelf-sense/analyze", json={"grids": [grid]}, headers=headers)
+    assert res.json()[0]["score"] == 50
+    assert res.json()[0]["conflicts"][0]["product_b"] == "Kiwi"
+
+    # Tenant rule overrides are picked up on the next call
+    rules = '{"ethylene_sensitive": {"boosts": ["chai_snack"], "score": 10, "msg": "Tea time"}}'
+    client.put("/settings", json={"key": "shelf_rules", "value": rules}, headers=headers)
+    products = client.get("/products", params={"search": "Samosa"}, headers=headers).json()
+    client.put(f"/products/{products[0]['id']}", json={"science_tags": "chai_snack"}, headers=headers)
+    res = client.post("/modules/shelf-sense/analyze", json={"grids": [grid]}, headers=headers)
+    assert res.json()[0]["score"] == 60
+    assert res.json()[0]["logs"][-1] == "Tea time (Kiwi ↔ Samosa)"
+
+    # A same-length tag edit still invalidates the compiled catalog
+    kiwi = client.get("/products", params={"search": "Kiwi"}, headers=headers).json()[0]
+    client.put(f"/products/{kiwi['id']}", json={"science_tags": "moisture_sensitive"}, headers=headers)
+    res = client.post("/modules/shelf-sense/analyze", json={"grids": [grid]}, headers=headers)
+    assert res.json()[0]["score"] == 100 and res.json()[0]["conflicts"] == []
+
+def test_voice_command_batch(client, db_session):
+    from backend.models import core
+    from backend.engines import voice
+    headers = get_auth_headers(client)
+    aid = "9676260340"
+    db_session.add_all([
+        core.Product(id="VC_MAGGI", account_id=aid, name="Maggi Noodles", price=12.0, cost_price=10.0, stock_quantity=5),
+        core.Product(id="VC_COKE", account_id=aid, name="Coca Cola", price=40.0, cost_price=30.0, stock_quantity=8),
+    ])
+    db_session.commit()
+    voice.invalidate(aid) # products written outside the API
+
+    transcripts = ["Add 50 Maggi", "Sold 10 maggi noodles", "Set stock of Coca Cola to 20", "hello there", "Add 3 Unicorn Tears"]
+    res = client.post("/modules/voice/commands", json={"transcripts": transcripts}, headers=headers)
+    assert res.status_code == 200
+    results = res.json()
+    assert [r["action"] for r in results] == ["ADD", "REMOVE", "SET", "UNKNOWN", "ADD"]
+    # Running stock per command: 5 + 50, then - 10
+    assert results[0]["applied"] and results[0]["new_stock"] == 55
+    assert results[1]["new_stock"] == 45
+    assert results[2]["new_stock"] == 20
+    assert results[3]["new_stock"] is None
+    assert not results[4]["applied"] and results[4]["status_msg"] == "Product 'unicorn tears' not found."
+
+    db_session.expire_all()
+    assert db_session.get(core.Product, "VC_MAGGI").stock_quantity == 45
+    logged = db_session.query(core.VoiceLog).filter(core.VoiceLog.transcript.in_(transcripts)).count()
+    assert logged == len(transcripts)
+
+    # Parse-only batches leave stock untouched
+    res = client.post("/modules/voice/commands", json={"transcripts": ["Add 1 Coca Cola"], "apply": False}, headers=headers)
+    assert res.json()[0]["product_id"] == "VC_COKE" and not res.json()[0]["applied"]
+    db_session.expire_all()
+    assert db_session.get(core.Product, "VC_COKE").stock_quantity == 20
+
+def test_voice_cycle_count_session(client, db_session):
+    from backend.models import core
+    from backend.engines import voice
+    headers = get_auth_headers(client)
+    aid = "9676260340"
+    db_session.add_all([
+        core.Product(id="CC_SOAP", account_id=aid, name="Dove Soap", price=50.0, cost_price=40.0, stock_quantity=30),
+        core.Product(id="CC_RICE", account_id=aid, name="Basmati Rice", price=90.0, cost_price=70.0, stock_quantity=12),
+    ])
+    db_session.commit()
+    voice.invalidate(aid) # products written outside the API
+
+    session_id = client.post("/modules/voice/sessions", headers=headers).json()["id"]
+    res = client.post(f"/modules/voice/sessions/{session_id}/commands",
+                      json={"transcripts": ["Set stock of Dove Soap to 25", "Set stock of Basmati Rice to 9", "Add 4 Basmati Rice"]},
+                      headers=headers)
+    assert res.status_code == 200
+    assert [e["status"] for e in res.json()["entries"]] == ["ACTIVE", "ACTIVE", "ACTIVE"]
+
+    # Seqs follow spoken order and are unique per session
+    entries = db_session.query(core.CycleCountEntry).filter(core.CycleCountEntry.session_id == session_id).all()
+    assert sorted(e.seq for e in entries) == [1, 2, 3]
+    db_session.add(core.CycleCountEntry(id="CC_DUP", session_id=session_id, account_id=aid, seq=3, transcript="dup", status="REJECTED"))
+    with pytest.raises(IntegrityError):
+        db_session.commit()
+    db_session.rollback()
+
+    # Staged counts don't touch stock; undo drops the last one from the preview
+    db_session.expire_all()
+    assert db_session.get(core.Product, "CC_RICE").stock_quantity == 12
+    res = client.post(f"/modules/voice/sessions/{session_id}/undo", headers=headers)
+    lines = {l["product_id"]: l for l in res.json()["lines"]}
+    assert lines["CC_RICE"]["counted_qty"] == 9 and lines["CC_SOAP"]["variance"] == -5
+
+    res = client.post(f"/modules/voice/sessions/{session_id}/apply", headers=headers)
+    assert res.status_code == 200 and res.json()["status"] == "APPLIED"
+    db_session.expire_all()
+    assert db_session.get(core.Product, "CC_SOAP").stock_quantity == 25
+    assert db_session.get(core.Product, "CC_RICE").stock_quantity == 9
+    variance = db_session.query(core.CycleCountVariance).filter(core.CycleCountVariance.session_id == session_id).all()
+    assert {v.product_id: v.variance for v in variance} == {"CC_SOAP": -5, "CC_RICE": -3}
+
+    res = client.post(f"/modules/voice/sessions/{session_id}/commands", json={"transcripts": ["Add 1 Dove Soap"]}, headers=headers)
+    assert res.status_code == 400
+    assert client.get("/modules/voice/sessions/missing", headers=headers).status_code == 404
+
+def test_voice_log_buffered_paging_and_retention(client, db_session):
+    from datetime import datetime, timedelta
+    from backend.models import core
+    from backend.engines import voice_log
+    headers = get_auth_headers(client)
+    aid = "9676260340"
+    db_session.query(core.VoiceLog).delete()
+    db_session.commit()
+
+    for i in range(3):
+        res = client.post("/modules/voice-logs", json={"transcript": f"count {i}", "confidence_score": 0.5}, headers=headers)
+        assert res.status_code == 200 and res.json()["account_id"] == aid
+
+    page = client.get("/modules/voice-logs?limit=2", headers=headers).json()
+    assert len(page) == 2
+    rest = client.get("/modules/voice-logs", params={"limit": 2, "before": page[-1]["created_at"], "before_id": page[-1]["id"]},
+                      headers=headers).json()
+    assert len(rest) == 1
+    assert {r["transcript"] for r in page + rest} == {"count 0", "count 1", "count 2"}
+
+    db_session.add(core.VoiceLog(id="OLD_LOG", account_id=aid, transcript="last year",
+                                 created_at=datetime.utcnow() - timedelta(days=voice_log.RETENTION_DAYS + 1)))
+    db_session.commit()
+    assert voice_log.prune(db_session.get_bind()) == 1
+    assert db_session.query(core.VoiceLog).count() == 3
+
+def test_isobar_demand_cube(client, db_session):
+    from datetime import date, datetime, timedelta
+    from backend.models import core
+    headers = get_auth_headers(client)
+    aid = "9676260340"
+
+    def sale(txn_id, ts, name, qty):
+        db_session.add(core.Transaction(id=txn_id, account_id=aid, timestamp=ts, total_amount=qty * 10.0, total_profit=qty))
+        db_session.add(core.TransactionItem(id=f"{txn_id}_1", transaction_id=txn_id, product_name=name, quantity=qty))
+
+    now = datetime.now()
+    sale("ISO_T1", datetime(2020, 7, 1, 10), "Umbrella", 6)
+    sale("ISO_T2", now - timedelta(seconds=2), "Umbrella", 2)
+    sale("ISO_T3", now - timedelta(seconds=1), "Pakora Mix", 4)
+    db_session.commit()
+    for day in ("2020-07-01", now.date().isoformat()):
+        client.post("/modules/daily-context", json={"date": day, "weather_tag": "Monsoon", "event_tag": "None"}, headers=headers)
+
+    res = client.post("/settings/predict", json={"weather": "Monsoon", "event": "None"}, headers=headers)
+    preds = res.json()["predictions"]
+    assert preds[0] == {"product_name": "Umbrella", "total_qty": 8, "avg_daily_qty": 4.0, "days_observed": 2}
+
+    # New sales fold in; re-tagging a day moves only that day's sales
+    sale("ISO_T4", now, "Pakora Mix", 6)
+    db_session.commit()
+    client.post("/modules/daily-context", json={"date": "2020-07-01", "weather_tag": "Sunny", "event_tag": "None"}, headers=headers)
+    preds = client.post("/settings/predict", json={"weather": "Monsoon", "event": "None"}, headers=headers).json()["predictions"]
+    assert [(p["product_name"], p["total_qty"], p["days_observed"]) for p in preds] == [("Pakora Mix", 10, 1), ("Umbrella", 2, 1)]
+    sunny = client.post("/settings/predict", json={"weather": "Sunny", "event": "None"}, headers=headers).json()["predictions"]
+    assert sunny[0]["product_name"] == "Umbrella" and sunny[0]["total_qty"] == 6
+
+    # Re-tagging a past day outside the API is picked up too
+    db_session.get(core.DailyContext, (aid, date(2020, 7, 1))).weather_tag = "Monsoon"
+    db_session.commit()
+    preds = client.post("/settings/predict", json={"weather": "Monsoon", "event": "None"}, headers=headers).json()["predictions"]
+    assert [(p["product_name"], p["total_qty"], p["days_observed"]) for p in preds] == [("Pakora Mix", 10, 2), ("Umbrella", 8, 2)]
+
+def test_sales_date_follows_tenant_timezone(client, db_session):
+    from datetime import date, datetime
+    from backend.models import core
+    headers = get_auth_headers(client)
+    aid = "9676260340"
+    db_session.add(core.Transaction(id="TZ_T1", account_id=aid, timestamp=datetime(2021, 3, 1, 20, 0), total_amount=10.0, total_profit=1.0))
+    db_session.commit()
+
+    res = client.put("/settings", json={"key": "timezone", "value": "Asia/Kolkata"}, headers=headers)
+    assert res.status_code == 200
+    db_session.expire_all()
+    # 20:00 UTC is already the next day in India
+    assert db_session.get(core.Transaction, "TZ_T1").sales_date == date(2021, 3, 2)
+
+    client.put("/settings", json={"key": "timezone", "value": "UTC"}, headers=headers)
+    db_session.expire_all()
+    assert db_session.get(core.Transaction, "TZ_T1").sales_date == date(2021, 3, 1)
+
+def test_migration_backfills(client, db_session):
+    from datetime import date, datetime
+    from backend.models import core
+    from backend import migrations
+    aid = "9676260340"
+    db_session.add(core.Transaction(id="MG_T1", account_id=aid, timestamp=datetime(2021, 5, 1, 10, 0), total_amount=5.0, total_profit=1.0))
+    db_session.add(core.Setting(account_id=aid, key="expiry_swept_on", value="2021-05-01"))
+    db_session.commit()
+
+    counts = migrations.backfill_data(db_session.get_bind())
+    assert counts["sales_dates"] >= 1 and counts["legacy_settings"] == 1
+    db_session.expire_all()
+    assert db_session.get(core.Transaction, "MG_T1").sales_date == date(2021, 5, 1)
+    assert migrations.backfill_data(db_session.get_bind())["sales_dates"] == 0
+
+def test_isobar_forecast(client, db_session):
+    from datetime import datetime, timedelta
+    from backend.engines import forecast
+    headers = get_auth_headers(client)
+    aid = "9676260340"
+    _, today = seed_weekly_sales(db_session, aid, "FC")
+    forecast.invalidate(aid)
+
+    res = client.get("/modules/isobar/forecast?days=7&product_id=FC_CHAI", headers=headers)
+    assert res.status_code == 200
+    points = res.json()[0]["points"]
+    assert len(points) == 7
+    weekend = [p["qty"] for p in points if datetime.fromisoformat(p["date"]).weekday() >= 5]
+    weekday = [p["qty"] for p in points if datetime.fromisoformat(p["date"]).weekday() < 5]
+    assert min(weekend) > max(weekday)
+    assert all(p["lower"] <= p["qty"] <= p["upper"] for p in points)
+
+    # The next day only folds in the newly completed day
+    state, _ = forecast.get_state(db_session, aid, today)
+    steps = state.steps
+    state, _ = forecast.get_state(db_session, aid, today + timedelta(days=1))
+    assert state.steps == steps + 1 and state.last_day == today
+
+def test_isobar_backtest(client, db_session, monkeypatch):
+    from backend.engines import backtest
+    aid = "ISO_BT"
+    headers = tenant_headers(client, db_session, aid)
+    seed_weekly_sales(db_session, aid, "BT")
+
+    res = client.get("/modules/isobar/backtest?horizon=7&folds=3", headers=headers)
+    assert res.status_code == 200
+    report = {r["model"]: r for r in res.json()}
+    assert set(report) == set(backtest.MODELS)
+    # A strict weekly pattern favours seasonal models
+    assert report["seasonal_naive"]["wape"] < report["naive"]["wape"]
+    assert all(r["folds"] == 3 for r in report.values())
+
+    # The pooled path gives the same numbers
+    monkeypatch.setattr(backtest, "POOL_MIN_CELLS", 0)
+    monkeypatch.setattr(backtest, "MAX_WORKERS", 2)
+    pooled = client.get("/modules/isobar/backtest?horizon=7&folds=3&models=naive,seasonal_naive", headers=headers).json()
+    assert {r["model"]: r["wape"] for r in pooled} == {m: report[m]["wape"] for m in ("naive", "seasonal_naive")}
+
+    assert client.get("/modules/isobar/backtest?models=prophet", headers=headers).status_code == 400
+
+def test_shiftsmart_roster(client, db_session):
+    from datetime import date, timedelta
+    from backend.models import core
+    headers = get_auth_headers(client)
+    cheap = [client.post("/modules/staff", json={"name": n, "role": "Cashier", "hourly_rate": r}, headers=headers).json()["id"]
+             for n, r in (("Asha", 5.0), ("Bala", 6.0))]
+
+    start = date.today() + timedelta(days=30)
+    res = client.post("/modules/shifts/roster", json={"start_date": start.isoformat(), "days": 2, "max_hours": 12, "apply": True},
+                      headers=headers)
+    assert res.status_code == 200
+    plan = res.json()
+    assert len(plan["slots"]) == 4 and plan["shortfall"] == 0
+    for day in (start, start + timedelta(days=1)):
+        staffed = [sid for s in plan["slots"] if s["date"] == day.isoformat() for sid in s["assigned"]]
+        assert sorted(staffed) == sorted(cheap) # cheapest first, one slot per person per day
+    assert all(h <= 12 for h in plan["staff_hours"].values())
+    assert plan["total_cost"] == sum(s["cost"] for s in plan["slots"])
+
+    created = db_session.query(core.Shift).filter(core.Shift.date.in_([start, start + timedelta(days=1)])).count()
+    assert created == 4
+    # Re-planning counts the applied shifts instead of staffing the slots again
+    again = client.post("/modules/shifts/roster", json={"start_date": start.isoformat(), "days": 2}, headers=headers).json()
+    assert all(not s["assigned"] and len(s["existing"]) == 1 for s in again["slots"])
+
+def test_roster_apply_respects_booked_shifts(client, db_session):
+    from datetime import date, datetime, time, timedelta
+    from backend.models import core
+    headers = tenant_headers(client, db_session, "ROSTER_B")
+    asha, bala = [client.post("/modules/staff", json={"name": n, "role": "Cashier", "hourly_rate": r}, headers=headers).json()["id"]
+                  for n, r in (("Asha", 5.0), ("Bala", 6.0))]
+    start = date.today() + timedelta(days=40)
+
+    # Asha's overnight shift from the day before runs into both of the day's slots
+    eve = datetime.combine(start - timedelta(days=1), time(23))
+    res = client.post("/modules/shifts", json={"staff_id": asha, "date": (start - timedelta(days=1)).isoformat(), "slot": "Night",
+                                               "start_time": eve.isoformat(), "end_time": (eve + timedelta(hours=16)).isoformat()},
+                      headers=headers)
+    assert res.status_code == 200
+
+    res = client.post("/modules/shifts/roster", json={"start_date": start.isoformat(), "days": 1, "apply": True}, headers=headers)
+    assert res.status_code == 200
+    plan = res.json()
+    assert plan["applied"] and plan["shortfall"] == 1
+    assert [sid for s in plan["slots"] for sid in s["assigned"]] == [bala]
+    booked = db_session.query(core.Shift.staff_id).filter(core.Shift.date == start).all()
+    assert [r[0] for r in booked] == [bala]
+
+    # Applying again books nobody twice
+    again = client.post("/modules/shifts/roster", json={"start_date": start.isoformat(), "days": 1, "apply": True}, headers=headers)
+    assert again.status_code == 200 and not any(s["assigned"] for s in again.json()["slots"])
+    assert db_session.query(core.Shift).filter(core.Shift.date == start).count() == 1
+
+def test_shift_bulk_and_week_listing(client):
+    headers = get_auth_headers(client)
+    ids = [client.post("/modules/staff", json={"name": n, "role": "Packer", "hourly_rate": 9.0}, headers=headers).json()["id"]
+           for n in ("Chitra", "Dev")]
+    week = "2027-03-01"
+
+    res = client.post("/modules/shifts/bulk", json={"shifts": [
+        {"staff_id": ids[0], "date": "2027-03-01", "slot": "Morning (9AM-2PM)"},
+        {"staff_id": ids[1], "date": "2027-03-02", "slot": "Evening (2PM-9PM)"},
+    ]}, headers=headers)
+    assert res.status_code == 200 and len(res.json()) == 2
+
+    listed = client.get("/modules/shifts?start=2027-03-01&end=2027-03-07", headers=headers).json()
+    assert [(s["staff_name"], s["date"]) for s in listed] == [("Chitra", "2027-03-01"), ("Dev", "2027-03-02")]
+
+    # Unknown staff rejects the whole batch
+    res = client.post("/modules/shifts/bulk", json={"shifts": [
+        {"staff_id": ids[0], "date": "2027-03-03", "slot": "Morning (9AM-2PM)"},
+        {"staff_id": "NOPE", "date": "2027-03-03", "slot": "Morning (9AM-2PM)"},
+    ]}, headers=headers)
+    assert res.status_code == 400
+    assert len(client.get("/modules/shifts?start=2027-03-01&end=2027-03-07", headers=headers).json()) == 2
+
+    res = client.put("/modules/shifts/week", json={"start_date": week, "shifts": [
+        {"staff_id": ids[1], "date": "2027-03-05", "slot": "Morning (9AM-2PM)"},
+    ]}, headers=headers)
+    assert res.status_code == 200
+    listed = client.get("/modules/shifts?start=2027-03-01&end=2027-03-07", headers=headers).json()
+    assert [(s["staff_name"], s["date"]) for s in listed] == [("Dev", "2027-03-05")]
+    assert client.get("/modules/shifts?start=2027-03-07&end=2027-03-01", headers=headers).status_code == 400
+
+def test_shift_overlaps_and_on_duty(client):
+    headers = get_auth_headers(client)
+    sid = client.post("/modules/staff", json={"name": "Esha", "role": "Cashier", "hourly_rate": 9.0}, headers=headers).json()["id"]
+
+    res = client.post("/modules/shifts", json={"staff_id": sid, "date": "2027-04-01", "slot": "Evening (2PM-9PM)"}, headers=headers)
+    assert res.status_code == 200 and res.json()["start_time"] == "2027-04-01T14:00:00"
+
+    # Overlaps with the stored evening shift, and within the batch itself
+    clash = client.post("/modules/shifts", json={"staff_id": sid, "date": "2027-04-01", "slot": "Late",
+                                                 "start_time": "2027-04-01T20:00:00", "end_time": "2027-04-02T02:00:00"},
+                        headers=headers)
+    assert clash.status_code == 409
+    res = client.post("/modules/shifts/bulk", json={"shifts": [
+        {"staff_id": sid, "date": "2027-04-02", "slot": "Morning (9AM-2PM)"},
+        {"staff_id": sid, "date": "2027-04-02", "slot": "Brunch", "start_time": "2027-04-02T11:00:00", "end_time": "2027-04-02T15:00:00"},
+    ]}, headers=headers)
+    assert res.status_code == 409
+    # Back-to-back is fine
+    res = client.post("/modules/shifts", json={"staff_id": sid, "date": "2027-04-01", "slot": "Night",
+                                               "start_time": "2027-04-01T21:00:00", "end_time": "2027-04-02T03:00:00"},
+                      headers=headers)
+    assert res.status_code == 200
+
+    on = client.get("/modules/shifts/on-duty?at=2027-04-01T18:30:00", headers=headers).json()
+    assert [(s["staff_name"], s["slot"]) for s in on] == [("Esha", "Evening (2PM-9PM)")]
+    on = client.get("/modules/shifts/on-duty?at=2027-04-02T01:00:00", headers=headers).json()
+    assert [s["slot"] for s in on] == ["Night"]
+    # Aware instants are converted to tenant-local time (UTC here), not stripped of their offset
+    on = client.get("/modules/shifts/on-duty", params={"at": "2027-04-02T06:30:00+05:30"}, headers=headers).json()
+    assert [s["slot"] for s in on] == ["Night"]
+
+    # Explicit times must start on the shift's date, after conversion to local time
+    for start, end in [("2027-04-06T09:00:00", "2027-04-06T12:00:00"), ("2027-04-05T03:30:00+05:30", "2027-04-05T08:30:00+05:30")]:
+        res = client.post("/modules/shifts", json={"staff_id": sid, "date": "2027-04-05", "slot": "Custom",
+                                                   "start_time": start, "end_time": end}, headers=headers)
+        assert res.status_code == 400
+    assert client.post("/modules/shifts", json={"staff_id": sid, "date": "2027-04-03", "slot": "Mystery"},
+                       headers=headers).status_code == 400
+
+def test_freshflow_markdowns(client, db_session):
+    from datetime import date, timedelta
+    from backend.models import core
+    headers = get_auth_headers(client)
+    aid = "9676260340"
+    today = date.today()
+
+    db_session.add(core.Product(id="MD_P1", account_id=aid, name="Paneer", price=100.0, cost_price=60.0, stock_quantity=40))
+    for i, days in enumerate([-1, 1, 2, 4, 8, 20]):
+        db_session.add(core.ProductBatch(id=f"MD_B{i}", account_id=aid, product_id="MD_P1", batch_code=f"P{i}",
+                                         expiry_date=today + timedelta(days=days), quantity=5, cost_price=60.0))
+    db_session.commit()
+
+    def markdowns(**params):
+        res = client.get("/modules/batches/markdowns", params=params, headers=headers)
+        assert res.status_code == 200
+        return [(m["days_left"], m["suggested_discount"], m["new_price"]) for m in res.json() if m["product_id"] == "MD_P1"]
+
+    # Default window is the last tier; expired stock comes back without a discount
+    assert markdowns() == [(-1, 0.0, 100.0), (1, 50.0, 50.0), (2, 50.0, 50.0), (4, 30.0, 70.0), (8, 10.0, 90.0)]
+    assert markdowns(lookahead=30)[-1] == (20, 0.0, 100.0)
+
+    # Tenant tiers and new batches are picked up without waiting for the day to roll over
+    res = client.put("/settings", json={"key": "markdown_tiers", "value": "[[3, 40], [1, 70]]"}, headers=headers)
+    assert res.status_code == 200
+    db_session.add(core.ProductBatch(id="MD_B9", account_id=aid, product_id="MD_P1", batch_code="P9",
+                                     expiry_date=today, quantity=2, cost_price=60.0))
+    db_session.commit()
+    assert markdowns() == [(-1, 0.0, 100.0), (0, 70.0, 30.0), (1, 70.0, 30.0), (2, 40.0, 60.0)]
+
+    # Edits that keep the batch count, total quantity and price sum are picked up too
+    db_session.get(core.ProductBatch, "MD_B3").expiry_date = today + timedelta(days=3)
+    db_session.get(core.ProductBatch, "MD_B1").quantity = 3
+    db_session.get(core.ProductBatch, "MD_B2").quantity = 7
+    db_session.commit()
+    assert markdowns() == [(-1, 0.0, 100.0), (0, 70.0, 30.0), (1, 70.0, 30.0), (2, 40.0, 60.0), (3, 40.0, 60.0)]
+    qty = {m["batch_id"]: m["quantity"] for m in client.get("/modules/batches/markdowns", headers=headers).json()}
+    assert (qty["MD_B1"], qty["MD_B2"]) == (3, 7)
+    assert client.get("/modules/batches/markdowns", params={"lookahead": 31}, headers=headers).status_code == 422
+
+def test_freshflow_expiry_calendar_and_alerts(client, db_session):
+    from datetime import date, timedelta
+    from backend.engines import expiry
+    headers = get_auth_headers(client)
+    aid = "9676260340"
+    today = date.today()
+    pid = client.post("/products", json={"name": "Khoa", "price": 80.0, "cost_price": 50.0, "stock_quantity": 0},
+                      headers=headers).json()["id"]
+
+    for code, days in [("K1", 1), ("K2", 6), ("K3", 45)]:
+        res = client.post("/modules/batches", json={"product_id": pid, "batch_code": code, "quantity": 4, "cost_price": 50.0,
+                                                    "expiry_date": str(today + timedelta(days=days))}, headers=headers)
+        assert res.status_code == 200
+
+    def mine(items):
+        return [(i.get("batch_code"), i["tier"]) for i in items if i["product_id"] == pid]
+
+    cal = client.get("/modules/batches/expiry-calendar", headers=headers).json()
+    assert mine(cal["items"]) == [("K1", "2D"), ("K2", "7D")]
+    assert [t["tier"] for t in cal["tiers"]] == ["EXPIRED", "TODAY", "2D", "7D", "30D"]
+    assert client.get("/modules/batches/expiry-calendar?tier=SOON", headers=headers).status_code == 400
+    assert str(expiry.job_runs.last_run(db_session, aid, expiry.JOB)) == cal["as_of"] # bookkeeping stays out of settings
+
+    alerts = [a for a in client.get("/modules/batches/expiry-alerts", headers=headers).json() if a["product_id"] == pid]
+    assert sorted(a["tier"] for a in alerts) == ["2D", "7D"]
+
+    # Day rollovers: K1 crosses into TODAY, then K2 into 2D; re-sweeping the same day raises nothing
+    expiry.sweep(db_session, aid, today + timedelta(days=1))
+    expiry.sweep(db_session, aid, today + timedelta(days=1))
+    assert expiry.sweep(db_session, aid, today + timedelta(days=4))["alerts"] >= 1
+    alerts = [a for a in client.get("/modules/batches/expiry-alerts", headers=headers).json() if a["product_id"] == pid]
+    assert sorted(a["tier"] for a in alerts) == ["2D", "2D", "7D", "EXPIRED", "TODAY"]
+
+    res = client.post("/modules/batches/expiry-alerts/ack", json={"alert_ids": [a["id"] for a in alerts]}, headers=headers)
+    assert res.json() == {"acknowledged": 5}
+    assert not [a for a in client.get("/modules/batches/expiry-alerts", headers=headers).json() if a["product_id"] == pid]
+
+def test_goods_receipt_bulk(client):
+    headers = get_auth_headers(client)
+    supplier_id = client.post("/modules/suppliers", json={"name": "Dairy Co"}, headers=headers).json()["id"]
+    po_id = client.post("/modules/purchase-orders", json={"supplier_id": supplier_id, "expected_date": "2027-05-01"},
+                        headers=headers).json()["id"]
+    pids = [client.post("/products", json={"name": n, "price": 30.0, "cost_price": 20.0, "stock_quantity": 5},
+                        headers=headers).json()["id"] for n in ("Curd", "Butter")]
+
+    line = lambda pid, code, qty: {"product_id": pid, "batch_code": code, "expiry_date": "2027-06-01", "quantity": qty, "cost_price": 20.0}
+    # Unknown products reject the whole receipt
+    res = client.post(f"/modules/purchase-orders/{po_id}/receive", json={"lines": [line(pids[0], "C1", 10), line("NOPE", "X", 1)]},
+                      headers=headers)
+    assert res.status_code == 400
+    assert client.get(f"/products/{pids[0]}", headers=headers).json()["stock_quantity"] == 5
+
+    res = client.post(f"/modules/purchase-orders/{po_id}/receive", json={
+        "lines": [line(pids[0], "C1", 10), line(pids[0], "C2", 15), line(pids[1], "B1", 7)],
+        "received_date": "2027-05-03", "quality_rating": 4.5
+    }, headers=headers)
+    assert res.status_code == 200
+    body = res.json()
+    assert (body["batches"], body["units"], body["products"]) == (3, 32, 2)
+    assert body["purchase_order"]["status"] == "RECEIVED" and body["purchase_order"]["received_date"] == "2027-05-03"
+    assert [client.get(f"/products/{p}", headers=headers).json()["stock_quantity"] for p in pids] == [30, 12]
+    assert len([b for b in client.get("/modules/batches", headers=headers).json() if b["product_id"] in pids]) == 3
+
+    assert client.post(f"/modules/purchase-orders/{po_id}/receive", json={"lines": [line(pids[1], "B2", 1)]},
+                       headers=headers).status_code == 400
+    assert client.post("/modules/purchase-orders/NOPE/receive", json={"lines": [line(pids[1], "B2", 1)]},
+                       headers=headers).status_code == 404
+
+def test_vendortrust_scorecards(client):
+    headers = get_auth_headers(client)
+    supplier_id = client.post("/modules/suppliers", json={"name": "Slow Farms"}, headers=headers).json()["id"]
+    pid = client.post("/products", json={"name": "Spinach", "price": 20.0, "cost_price": 12.0}, headers=headers).json()["id"]
+    line = {"product_id": pid, "batch_code": "S", "expiry_date": "2027-08-01", "quantity": 3, "cost_price": 12.0}
+
+    po = client.post("/modules/purchase-orders", json={"supplier_id": supplier_id, "expected_date": "2027-07-01"}, headers=headers).json()
+    assert po["risk_warning"] is None
+    client.post(f"/modules/purchase-orders/{po['id']}/receive", json={"lines": [line], "received_date": "2027-07-01", "quality_rating": 5}, headers=headers)
+    po = client.post("/modules/purchase-orders", json={"supplier_id": supplier_id, "expected_date": "2027-07-05"}, headers=headers).json()
+    client.post(f"/modules/purchase-orders/{po['id']}/receive", json={"lines": [line], "received_date": "2027-07-15", "quality_rating": 2}, headers=headers)
+
+    cards = {c["supplier_id"]: c for c in client.get("/modules/suppliers/scorecards", headers=headers).json()}
+    card = cards[supplier_id]
+    assert (card["po_count"], card["on_time_rate"], card["mean_delay_days"]) == (2, 50.0, 5.0)
+    assert abs(card["quality_score"] - 4.1) < 1e-9
+    assert card["risk"] == "High" and card["last_received_date"] == "2027-07-15"
+
+    po = client.post("/modules/purchase-orders", json={"supplier_id": supplier_id, "expected_date": "2027-08-01"}, headers=headers).json()
+    assert po["risk_warning"].startswith("High risk supplier: on-time rate 50%")
+
+def test_replenishment_plan_and_drafts(client, db_session):
+    from datetime import datetime, timedelta
+    from backend.models import core
+    from backend.engines import velocity
+    headers = get_auth_headers(client)
+    aid = "9676260340"
+    supplier_id = client.post("/modules/suppliers", json={"name": "Grain Hub"}, headers=headers).json()["id"]
+    pid = client.post("/products", json={"name": "Atta 5kg", "price": 250.0, "cost_price": 200.0, "pack_size": 12},
+                      headers=headers).json()["id"]
+    po = client.post("/modules/purchase-orders", json={"supplier_id": supplier_id, "order_date": "2027-01-01",
+                                                       "expected_date": "2027-01-04"}, headers=headers).json()
+    client.post(f"/modules/purchase-orders/{po['id']}/receive", json={"received_date": "2027-01-05", "lines": [
+        {"product_id": pid, "batch_code": "A1", "expiry_date": "2027-12-01", "quantity": 10, "cost_price": 200.0}
+    ]}, headers=headers)
+
+    # Never received through a PO: one by category specialty, one by its default supplier
+    veg_id = client.post("/modules/suppliers", json={"name": "Veg Mart", "category_specialty": "Vegetables"}, headers=headers).json()["id"]
+    onion = client.post("/products", json={"name": "Onion 1kg", "category": "vegetables", "price": 40.0, "cost_price": 30.0},
+                        headers=headers).json()["id"]
+    besan = client.post("/products", json={"name": "Besan 1kg", "price": 90.0, "cost_price": 70.0, "supplier_id": veg_id},
+                        headers=headers).json()["id"]
+
+    # 5 units a day over the whole history window
+    now = datetime.utcnow()
+    for k in range(1, 29):
+        db_session.add(core.Transaction(id=f"RP_T{k}", account_id=aid, total_amount=1250.0, total_profit=250.0, timestamp=now - timedelta(days=k)))
+        for j, (product_id, name) in enumerate([(pid, "Atta 5kg"), (onion, "Onion 1kg"), (besan, "Besan 1kg")]):
+            db_session.add(core.TransactionItem(id=f"RP_I{k}_{j}", transaction_id=f"RP_T{k}", product_id=product_id, product_name=name,
+                                                quantity=5, price_at_sale=250.0, cost_at_sale=200.0))
+    db_session.commit()
+    velocity.invalidate(aid) # backdated rows written outside the API
+
+    # Lead 4 days: reorder point 20, order up to 5 x (4 + 7) = 55; position 10 -> 45, rounded to packs of 12
+    plan = client.get("/modules/replenishment/suggestions", params={"supplier_id": supplier_id}, headers=headers).json()
+    assert [(s["product_id"], s["lead_days"], s["reorder_point"], s["order_qty"]) for s in plan] == [(pid, 4.0, 20.0, 48)]
+    veg = client.get("/modules/replenishment/suggestions", params={"supplier_id": veg_id}, headers=headers).json()
+    assert sorted(s["product_id"] for s in veg) == sorted([onion, besan])
+
+    run = client.post("/modules/replenishment/run", headers=headers).json()
+    assert run["suggestions"] >= 1 and len(run["draft_orders"]) >= 1
+    drafts = [d for d in client.get("/modules/replenishment/drafts", headers=headers).json()
+              if d["purchase_order"]["supplier_id"] == supplier_id]
+    assert len(drafts) == 1 and drafts[0]["lines"] == [{"product_id": pid, "product_name": "Atta 5kg", "quantity": 48, "unit_cost": 200.0}]
+    draft_id = drafts[0]["purchase_order"]["id"]
+    assert client.post(f"/modules/purchase-orders/{draft_id}/receive", json={"lines": []}, headers=headers).status_code == 400
+
+    # Placing the draft puts its units on order, so the product is no longer due
+    res = client.post(f"/modules/purchase-orders/{draft_id}/place", headers=headers)
+    assert res.status_code == 200 and res.json()["status"] == "PENDING"
+    assert client.get("/modules/replenishment/suggestions", params={"supplier_id": supplier_id}, headers=headers).json() == []
+    assert client.post(f"/modules/purchase-orders/{draft_id}/place", headers=headers).status_code == 400
+
+def test_stockswap_marketplace_matching(client, db_session):
+    from datetime import datetime
+    from backend.models import core
+    from backend.engines import stockswap
+    headers = get_auth_headers(client)
+    aid = "9676260340"
+    stockswap.reset()
+    db_session.add(core.Account(id="SW_ACC", company_name="Neighbour Mart", status="ACTIVE"))
+    now = datetime.utcnow()
+    db_session.add_all([
+        # Hyderabad (~5 km away) and Vijayawada (~250 km away)
+        core.B2BDeal(id="SW_NEAR", account_id="SW_ACC", store_name="Neighbour Mart", product_name="tomato 1kg", quantity=40,
+                     price_per_unit=20.0, kind="OFFER", category="Vegetables", latitude=17.43, longitude=78.44, status="OPEN", updated_at=now),
+        core.B2BDeal(id="SW_EXACT", account_id="SW_ACC", store_name="Neighbour Mart", product_name="Tomatoes", quantity=10,
+                     price_per_unit=22.0, kind="OFFER", latitude=17.36, longitude=78.52, status="OPEN", updated_at=now),
+        core.B2BDeal(id="SW_FAR", account_id="SW_ACC", store_name="Neighbour Mart", product_name="Tomatoes", quantity=90,
+                     price_per_unit=15.0, kind="OFFER", latitude=16.51, longitude=80.65, status="OPEN", updated_at=now),
+        # A weak name match right next door
+        core.B2BDeal(id="SW_WEAK", account_id="SW_ACC", store_name="Neighbour Mart", product_name="Tomato Ketchup 500g", quantity=12,
+                     price_per_unit=90.0, kind="OFFER", latitude=17.386, longitude=78.487, status="OPEN", updated_at=now),
+        core.B2BDeal(id="SW_WANT", account_id="SW_ACC", store_name="Neighbour Mart", product_name="Tomatoes", quantity=5,
+                     price_per_unit=25.0, kind="REQUEST", latitude=17.40, longitude=78.48, status="OPEN", updated_at=now),
+    ])
+    db_session.add(core.Setting(account_id=aid, key="store_location", value="17.385,78.4867"))
+    db_session.commit()
+
+    # Own listings never show up, even for an exact name match
+    own = client.post("/modules/b2b-deals", json={"store_name": "Demo", "product_name": "Tomatoes",
+                      "quantity": 3, "price_per_unit": 30.0}, headers=headers).json()
+    assert (own["kind"], own["status"], own["latitude"]) == ("OFFER", "OPEN", 17.385)
+    assert client.post("/modules/b2b-deals", json={"store_name": "Demo", "product_name": "x", "quantity": 1,
+                                                   "price_per_unit": 1.0, "kind": "SWAP"}, headers=headers).status_code == 400
+
+    hits = client.get("/modules/stockswap/search", params={"q": "Tomatoes"}, headers=headers).json()
+    # Better name matches first, nearest first within a similarity band; the far one is outside 50 km
+    assert [h["deal_id"] for h in hits] == ["SW_EXACT", "SW_NEAR", "SW_WEAK"]
+    assert hits[0]["similarity"] == 1.0 and hits[2]["similarity"] >= stockswap.MIN_SIMILARITY
+    assert hits[2]["distance_km"] < hits[0]["distance_km"] < hits[1]["distance_km"] < 10
+    wide = client.get("/modules/stockswap/search", params={"q": "tomato", "radius_km": 500, "category": "vegetables"}, headers=headers).json()
+    assert [h["deal_id"] for h in wide] == ["SW_NEAR"]
+    wanted = client.get("/modules/stockswap/search", params={"q": "tomato", "kind": "REQUEST"}, headers=headers).json()
+    assert [h["deal_id"] for h in wanted] == ["SW_WANT"]
+    assert client.get("/modules/stockswap/search", params={"q": "tomato", "kind": "SWAP"}, headers=headers).status_code == 400
+
+    # Closing a listing drops it from the index on the next query
+    assert client.post("/modules/b2b-deals/SW_NEAR/close", headers=headers).status_code == 404 # not ours
+    db_session.get(core.B2BDeal, "SW_EXACT").status = "CLOSED"
+    db_session.get(core.B2BDeal, "SW_EXACT").updated_at = datetime.utcnow()
+    db_session.commit()
+    closed = client.post(f"/modules/b2b-deals/{own['id']}/close", headers=headers).json()
+    assert closed["status"] == "CLOSED"
+
+    pid = client.post("/products", json={"name": "Tomatoes", "price": 30.0, "cost_price": 20.0, "stock_quantity": 2},
+                      headers=headers).json()["id"]
+    matches = {m["product_id"]: m for m in client.get("/modules/stockswap/matches", headers=headers).json()}
+    assert [o["deal_id"] for o in matches[pid]["offers"]] == ["SW_NEAR", "SW_WEAK"]
+    assert matches[pid]["stock_quantity"] == 2
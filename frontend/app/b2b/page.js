@@ -6,6 +6,9 @@ import styles from "./b2b.module.css";
 export default function B2BPage() {
     const [activeTab, setActiveTab] = useState("feed");
     const [deals, setDeals] = useState([]);
+    const [matches, setMatches] = useState([]);
+    const [results, setResults] = useState(null);
+    const [query, setQuery] = useState("");
     const [loading, setLoading] = useState(true);
 
     // Deal Form
@@ -17,8 +20,13 @@ export default function B2BPage() {
         if (!token) { window.location.href = "/login"; return; }
 
         try {
-            const res = await fetch("/api/modules/b2b-deals", { headers: { "Authorization": `Bearer ${token}` } });
-            if (res.ok) setDeals(await res.json());
+            const headers = { "Authorization": `Bearer ${token}` };
+            const [dealsRes, matchesRes] = await Promise.all([
+                fetch("/api/modules/b2b-deals", { headers }),
+                fetch("/api/modules/stockswap/matches", { headers })
+            ]);
+            if (dealsRes.ok) setDeals(await dealsRes.json());
+            if (matchesRes.ok) setMatches(await matchesRes.json());
         } catch (err) {
             console.error(err);
         } finally {
@@ -30,6 +38,44 @@ export default function B2BPage() {
         fetchDeals();
     }, []);
 
+    const handleSearch = async (e) => {
+        e.preventDefault();
+        if (!query.trim()) { setResults(null); return; }
+        const token = localStorage.getItem("token");
+        const res = await fetch(`/api/modules/stockswap/search?q=${encodeURIComponent(query)}`, {
+            headers: { "Authorization": `Bearer ${token}` }
+        });
+        if (res.ok) setResults(await res.json());
+    };
+
+    const handleClose = async (id) => {
+        const token = localStorage.getItem("token");
+        const res = await fetch(`/api/modules/b2b-deals/${id}/close`, {
+            method: "POST",
+            headers: { "Authorization": `Bearer ${token}` }
+        });
+        if (res.ok) fetchDeals();
+    };
+
+    const renderListing = (d) => (
+        <div key={d.deal_id} className={styles.dealCard}>
+            <div>
+                <h4 className="font-bold text-lg">{d.product_name}</h4>
+                <div className="text-secondary text-sm">
+                    Seller: {d.store_name}{d.distance_km != null ? ` · ${d.distance_km.toFixed(1)} km` : ""}
+                </div>
+            </div>
+            <div className="font-bold">{d.quantity} Units</div>
+            <div className={styles.dealPrice}>₹{d.price_per_unit}/unit</div>
+            <button
+                className="btn-secondary"
+                onClick={() => alert(`Connecting you to ${d.acc_phone}...`)}
+            >
+                📞 Contact Seller
+            </button>
+        </div>
+    );
+
     const handlePostDeal = async (e) => {
         e.preventDefault();
         const token = localStorage.getItem("token");
@@ -41,7 +87,7 @@ export default function B2BPage() {
         });
 
         if (res.ok) {
-            alert("Deal Broadcasted to 50 retailers!");
+            alert("Deal listed on the StockSwap marketplace!");
             setDealForm({ product_name: "", quantity: 1, price_per_unit: 0.0, acc_phone: "", store_name: "My Store (You)" });
             fetchDeals();
             setActiveTab("feed");
@@ -67,23 +113,51 @@ export default function B2BPage() {
                     {/* FEED */}
                     {activeTab === "feed" && (
                         <div className={styles.dealsGrid}>
-                            <h3 className="section-title">Live Deals from Nearby Stores</h3>
-                            {deals.length === 0 ? (
+                            <form onSubmit={handleSearch} className="flex gap-2 mb-4">
+                                <input
+                                    className="input-field"
+                                    placeholder="Search nearby stores, e.g. tomatoes"
+                                    value={query}
+                                    onChange={(e) => setQuery(e.target.value)}
+                                />
+                                <button type="submit" className="btn-primary">🔍 Search</button>
+                            </form>
+
+                            {results !== null ? (
+                                <>
+                                    <h3 className="section-title">Offers for "{query}"</h3>
+                                    {results.length === 0 ? (
+                                        <div className="alert alert-info">No nearby store is offering this right now.</div>
+                                    ) : results.map(renderListing)}
+                                </>
+                            ) : (
+                                <>
+                                    <h3 className="section-title">Offers for Your Low-Stock Items</h3>
+                                    {matches.length === 0 ? (
+                                        <div className="alert alert-info">No nearby offers match your low-stock items.</div>
+                                    ) : matches.map(m => (
+                                        <div key={m.product_id}>
+                                            <div className="text-secondary text-sm">{m.product_name} · {m.stock_quantity} left</div>
+                                            {m.offers.map(renderListing)}
+                                        </div>
+                                    ))}
+                                </>
+                            )}
+
+                            <h3 className="section-title">My Listings</h3>
+                            {deals.filter(d => d.status !== "CLOSED").length === 0 ? (
                                 <div className="alert alert-info">No active deals. Be the first to post!</div>
                             ) : (
-                                deals.map(d => (
+                                deals.filter(d => d.status !== "CLOSED").map(d => (
                                     <div key={d.id} className={styles.dealCard}>
                                         <div>
                                             <h4 className="font-bold text-lg">{d.product_name}</h4>
-                                            <div className="text-secondary text-sm">Seller: {d.store_name}</div>
+                                            <div className="text-secondary text-sm">{d.kind === "REQUEST" ? "Wanted" : "Offered"}</div>
                                         </div>
                                         <div className="font-bold">{d.quantity} Units</div>
                                         <div className={styles.dealPrice}>₹{d.price_per_unit}/unit</div>
-                                        <button
-                                            className="btn-secondary"
-                                            onClick={() => alert(`Connecting you to ${d.acc_phone}...`)}
-                                        >
-                                            📞 Contact Seller
+                                        <button className="btn-secondary" onClick={() => handleClose(d.id)}>
+                                            ✅ Close Listing
                                         </button>
                                     </div>
                                 ))
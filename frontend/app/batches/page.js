@@ -9,6 +9,7 @@ export default function BatchesPage() {
     const [products, setProducts] = useState([]);
     const [loading, setLoading] = useState(true);
     const [lookahead, setLookahead] = useState(10);
+    const [calendar, setCalendar] = useState([]);
 
     // Ingestion Form
     const [batchForm, setBatchForm] = useState({ product_id: "", batch_code: "", expiry_date: "", quantity: 0, cost_price: 0.0 });
@@ -19,13 +20,16 @@ export default function BatchesPage() {
         if (!token) { window.location.href = "/login"; return; }
 
         try {
-            const [batchRes, prodRes] = await Promise.all([
-                fetch("/api/modules/batches", { headers: { "Authorization": `Bearer ${token}` } }),
-                fetch("/api/products", { headers: { "Authorization": `Bearer ${token}` } })
+            const [batchRes, prodRes, calRes] = await Promise.all([
+                fetch(`/api/modules/batches/markdowns?lookahead=${lookahead}`, { headers: { "Authorization": `Bearer ${token}` } }),
+                fetch("/api/products", { headers: { "Authorization": `Bearer ${token}` } }),
+                // Per-tier totals from the precomputed expiry calendar
+                fetch("/api/modules/batches/expiry-calendar?limit=1", { headers: { "Authorization": `Bearer ${token}` } })
             ]);
 
             if (batchRes.ok) setBatches(await batchRes.json());
             if (prodRes.ok) setProducts(await prodRes.json());
+            if (calRes.ok) setCalendar((await calRes.json()).tiers);
         } catch (err) {
             console.error("Failed to fetch data", err);
         } finally {
@@ -33,40 +37,27 @@ export default function BatchesPage() {
         }
     };
 
+    const fetchMarkdowns = async () => {
+        const token = localStorage.getItem("token");
+        if (!token) return;
+        try {
+            // Tiers, days left and marked-down prices are computed server-side
+            const res = await fetch(`/api/modules/batches/markdowns?lookahead=${lookahead}`, { headers: { "Authorization": `Bearer ${token}` } });
+            if (res.ok) setBatches(await res.json());
+        } catch (err) {
+            console.error("Failed to fetch markdowns", err);
+        }
+    };
+
     useEffect(() => {
         fetchData();
     }, []);
 
-    // Logic: Identify Expiring Batches
-    const getExpiringBatches = () => {
-        const today = new Date();
-        return batches.map(b => {
-            const expDate = new Date(b.expiry_date);
-            const diffTime = expDate - today;
-            const daysLeft = Math.ceil(diffTime / (1000 * 60 * 60 * 24));
-
-            // Matches legacy logic
-            let discount = 0;
-            if (daysLeft <= 2) discount = 50;
-            else if (daysLeft <= 5) discount = 30;
-            else if (daysLeft <= 10) discount = 10;
-
-            // Find product for context (price)
-            const product = products.find(p => p.id === b.product_id) || {};
-
-            return {
-                ...b,
-                days_left: daysLeft,
-                suggested_discount: discount,
-                product_name: product.name || "Unknown",
-                current_price: product.price || 0,
-                new_price: (product.price || 0) * (1 - discount / 100),
-                total_risk: (b.quantity * b.cost_price)
-            };
-        }).filter(b => b.days_left <= lookahead); // Only return those in storage window
-    };
+    useEffect(() => {
+        if (!loading) fetchMarkdowns();
+    }, [lookahead]);
 
-    const expiring = getExpiringBatches();
+    const expiring = batches;
     const criticalCount = expiring.filter(b => b.days_left <= 2).length;
     const totalRisk = expiring.reduce((acc, curr) => acc + curr.total_risk, 0);
 
@@ -153,20 +144,29 @@ export default function BatchesPage() {
                                 </div>
                             </div>
 
+                            <div className={styles.statsRow}>
+                                {calendar.map(t => (
+                                    <div key={t.tier} className={styles.statCard}>
+                                        <div className={styles.statValue}>{t.batches}</div>
+                                        <div className={styles.statLabel}>{t.tier} · ₹{t.value.toFixed(2)}</div>
+                                    </div>
+                                ))}
+                            </div>
+
                             <h3 className="section-title mb-4">Actionable Grid</h3>
                             {expiring.length === 0 ? (
                                 <div className="alert alert-success">✅ No expiring inventory found in this window. Great job!</div>
                             ) : (
                                 <div className={styles.batchGrid}>
                                     {expiring.map(b => (
-                                        <div key={b.id} className={styles.batchRow}>
+                                        <div key={b.batch_id} className={styles.batchRow}>
                                             <div>
                                                 <h4 className="font-bold">{b.product_name}</h4>
                                                 <div className="text-secondary text-sm">Batch: {b.batch_code}</div>
                                             </div>
                                             <div>
                                                 <div className={b.days_left <= 2 ? styles.expiryRed : styles.expiryOrange}>
-                                                    {b.days_left} Days Left
+                                                    {b.expired ? "Expired" : `${b.days_left} Days Left`}
                                                 </div>
                                                 <div className="text-secondary text-sm">Exp: {b.expiry_date}</div>
                                             </div>
@@ -34,26 +34,17 @@ export default function StaffPage() {
 
     // Fetch shifts for a specific date (when roster analysis is run)
     const fetchShifts = async (dateStr) => {
-        // Since backend doesn't have "get all shifts for date" endpoint easily exposed in my previous step (I made get_shifts by staff_id), 
-        // I need to fetch all shifts logic. 
-        // WAIT. My `modules.py` router has `read_shifts` taking `staff_id`.
-        // Legacy `database.py` had `get_shifts(date)`.
-        // I MISSED adding a generic "get shifts by date" endpoint in `modules.py`.
-        // WORKAROUND: For now, I will add the logic to fetch ALL shifts for a date if I can, or I'll quickly patch the backend.
-        // Actually, to stick to the plan without context switching, I will assume I can fetch all shifts or just skip the "currently assigned" visualization perfection 
-        // OR simply add a query param to my backend. 
-        // Let's implement robustly: I will fetch all staff's shifts in loop OR (better) I'll assume I can just list all shifts at `/api/modules/shifts?date=X` if I had time.
-        // Given constraints: I will implement the UI assuming no pre-assigned shifts for now, OR I'll add the endpoint.
-        // Adding the endpoint is safer.
-        // Let's act like I'm doing the backend patch in the next step if verification fails.
-        // User said "works exactly like legacy". Legacy shows "Currently Assigned". 
-        // I will add a TODO note to patch backend. For now, I'll simulate it or try to fetch.
-
-        // Actually, I can fetch all staff, then for each staff fetch their shifts. Brute force but works for small N.
         const token = localStorage.getItem("token");
-        let allShifts = [];
-        // Optimally, I should have an endpoint. I will patch backend in next step.
-        // For this file creation, I will leave fetchShifts placeholder.
+        try {
+            const res = await fetch(`/api/modules/shifts?start=${dateStr}&end=${dateStr}`, { headers: { "Authorization": `Bearer ${token}` } });
+            if (res.ok) {
+                const data = await res.json();
+                setShifts(data);
+                return data;
+            }
+        } catch (err) {
+            console.error("Failed to fetch shifts", err);
+        }
         return [];
     };
 
@@ -80,11 +71,11 @@ export default function StaffPage() {
 
         base = Math.max(1, base); // Min 1
 
-        // Fetch current shifts for this date (Simulated/Placeholder)
-        // const currentShifts = await fetchShifts(rosterForm.date);
-        // For this iteration, assuming 0 assigned.
+        // Fetch current shifts for this date
+        const currentShifts = await fetchShifts(rosterForm.date);
+        const assigned = currentShifts.filter((sh) => sh.slot === rosterForm.slot);
 
-        setPrediction({ needed: base, current: 0 });
+        setPrediction({ needed: base, current: assigned.length });
     };
 
     const handleAutoAssign = async () => {
@@ -94,26 +85,28 @@ export default function StaffPage() {
 
         const token = localStorage.getItem("token");
 
-        // Pick available staff (simple logic: take first N)
-        const available = staffList.slice(0, needed);
+        // Pick available staff (simple logic: first N not already on shift that day)
+        const onShift = new Set(shifts.map((sh) => sh.staff_id));
+        const available = staffList.filter((s) => !onShift.has(s.id)).slice(0, needed);
 
         if (available.length < needed) {
             alert(`Not enough staff! Need ${needed}, have ${available.length}`);
             return;
         }
 
-        // Post assignments
-        for (const s of available) {
-            await fetch("/api/modules/shifts", {
-                method: "POST",
-                headers: { "Content-Type": "application/json", "Authorization": `Bearer ${token}` },
-                body: JSON.stringify({
-                    staff_id: s.id,
-                    date: rosterForm.date,
-                    slot: rosterForm.slot
-                })
-            });
+        // Post all assignments in one request
+        const res = await fetch("/api/modules/shifts/bulk", {
+            method: "POST",
+            headers: { "Content-Type": "application/json", "Authorization": `Bearer ${token}` },
+            body: JSON.stringify({
+                shifts: available.map((s) => ({ staff_id: s.id, date: rosterForm.date, slot: rosterForm.slot }))
+            })
+        });
+        if (!res.ok) {
+            alert("Failed to assign staff");
+            return;
         }
+        await fetchShifts(rosterForm.date);
 
         alert("Staff Assigned!");
         setPrediction({ ...prediction, current: prediction.current + available.length });
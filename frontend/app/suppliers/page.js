@@ -7,6 +7,7 @@ export default function SuppliersPage() {
     const [activeTab, setActiveTab] = useState("scorecards");
     const [suppliers, setSuppliers] = useState([]);
     const [purchaseOrders, setPurchaseOrders] = useState([]);
+    const [scorecards, setScorecards] = useState([]);
     const [loading, setLoading] = useState(true);
 
     // Form States
@@ -21,13 +22,15 @@ export default function SuppliersPage() {
         if (!token) { window.location.href = "/login"; return; }
 
         try {
-            const [suppRes, poRes] = await Promise.all([
+            const [suppRes, poRes, cardRes] = await Promise.all([
                 fetch("/api/modules/suppliers", { headers: { "Authorization": `Bearer ${token}` } }),
-                fetch("/api/modules/purchase-orders", { headers: { "Authorization": `Bearer ${token}` } })
+                fetch("/api/modules/purchase-orders", { headers: { "Authorization": `Bearer ${token}` } }),
+                fetch("/api/modules/suppliers/scorecards", { headers: { "Authorization": `Bearer ${token}` } })
             ]);
 
             if (suppRes.ok) setSuppliers(await suppRes.json());
             if (poRes.ok) setPurchaseOrders(await poRes.json());
+            if (cardRes.ok) setScorecards(await cardRes.json());
         } catch (err) {
             console.error("Failed to fetch data", err);
         } finally {
@@ -39,27 +42,11 @@ export default function SuppliersPage() {
         fetchData();
     }, []);
 
-    // Risk Calculation Logic (Client-side simulation since backend doesn't return computed risk yet)
+    // Scorecards are maintained server-side as POs are received
     const calculateRisk = (supplierId) => {
-        const theirPos = purchaseOrders.filter(po => po.supplier_id === supplierId && po.status === 'RECEIVED');
-        if (theirPos.length === 0) return { onTime: 100, quality: 5.0, risk: "Low" }; // Default/New
-
-        let onTimeCount = 0;
-        let totalQuality = 0;
-
-        theirPos.forEach(po => {
-            if (new Date(po.received_date) <= new Date(po.expected_date)) onTimeCount++;
-            totalQuality += po.quality_rating || 0;
-        });
-
-        const onTimeRate = (onTimeCount / theirPos.length) * 100;
-        const avgQuality = totalQuality / theirPos.length;
-
-        let risk = "Low";
-        if (onTimeRate < 70 || avgQuality < 3.0) risk = "High";
-        else if (onTimeRate < 90 || avgQuality < 4.0) risk = "Medium";
-
-        return { onTime: onTimeRate, quality: avgQuality, risk };
+        const card = scorecards.find(c => c.supplier_id === supplierId);
+        if (!card || card.po_count === 0) return { onTime: 100, quality: 5.0, risk: "Low" }; // Default/New
+        return { onTime: card.on_time_rate ?? 100, quality: card.quality_score ?? 5.0, risk: card.risk };
     };
 
     // Handlers
@@ -90,7 +77,8 @@ export default function SuppliersPage() {
             body: JSON.stringify(poForm)
         });
         if (res.ok) {
-            alert("PO Created!");
+            const po = await res.json();
+            alert(po.risk_warning ? `PO Created!\n⚠️ ${po.risk_warning}` : "PO Created!");
             setPoForm({ supplier_id: "", expected_date: "", notes: "" });
             fetchData();
         } else {
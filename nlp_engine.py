@@ -1,39 +1,121 @@
 import re
 import difflib
-import database as db
+import heapq
+from functools import lru_cache
+
+# Trigram index over product names.
+# Candidates sharing the most character trigrams with the spoken name are shortlisted
+# through an inverted index, and only those are scored with difflib, so matching cost
+# depends on the query and its postings rather than on the catalog size.
+
+MATCH_CUTOFF = 0.4
+MAX_CANDIDATES = 25
+
+def _normalize(name):
+    return " ".join(re.sub(r'[^a-z0-9]+', ' ', str(name).lower()).split())
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class ProductMatcher:
+    """
+    Fuzzy product-name matcher backed by a character-trigram inverted index.
+    products_list: list of dicts with at least 'id' and 'name'.
+    """
+
+    def __init__(self, products_list, max_candidates=MAX_CANDIDATES, cache_size=4096):
+        self.products = [p for p in products_list if p.get('name')]
+        self.names = [_normalize(p['name']) for p in self.products]
+        self.sizes = []
+        self.postings = {}
+        for idx, name in enumerate(self.names):
+            grams = _trigrams(name)
+            self.sizes.append(len(grams))
+            for g in grams:
+                self.postings.setdefault(g, []).append(idx)
+        self.max_candidates = max_candidates
+        self.match = lru_cache(maxsize=cache_size)(self._match)
+
+    def candidates(self, query):
+        grams = _trigrams(query)
+        shared = {}
+        for g in grams:
+            for idx in self.postings.get(g, ()):
+                shared[idx] = shared.get(idx, 0) + 1
+        # Dice coefficient on trigram sets
+        return heapq.nlargest(self.max_candidates, shared, key=lambda i: 2.0 * shared[i] / (len(grams) + self.sizes[i]))
+
+    def _match(self, spoken_name):
+        """Returns (product_dict, confidence) or (None, 0.0)."""
+        query = _normalize(spoken_name)
+        if not query:
+            return None, 0.0
+        best, best_ratio = None, 0.0
+        for idx in self.candidates(query):
+            ratio = difflib.SequenceMatcher(None, query, self.names[idx]).ratio()
+            if ratio > best_ratio:
+                best, best_ratio = idx, ratio
+        if best is None or best_ratio < MATCH_CUTOFF:
+            return None, 0.0
+        return self.products[best], best_ratio
 
 def find_closest_product(spoken_name, products_list):
     """
-    Finds the closest match for spoken_name in products_list using difflib.
-    products_list should be a list of dicts: [{'id': 1, 'name': 'Maggi'}, ...]
+    Finds the closest match for spoken_name in products_list.
+    products_list can be a list of dicts: [{'id': 1, 'name': 'Maggi'}, ...] or a prebuilt ProductMatcher.
     Returns (product_dict, confidence_score)
     """
     if not products_list:
         return None, 0.0
-        
-    names = [p['name'] for p in products_list]
-    # Get close matches
-    matches = difflib.get_close_matches(spoken_name, names, n=1, cutoff=0.4)
-    
-    if matches:
-        best_match_name = matches[0]
-        # Find the product object
-        for p in products_list:
-            if p['name'] == best_match_name:
-                # Calculate simple ratio for confidence
-                ratio = difflib.SequenceMatcher(None, spoken_name.lower(), best_match_name.lower()).ratio()
-                return p, ratio
-    return None, 0.0
-
-def parse_voice_command(text):
+    matcher = products_list if isinstance(products_list, ProductMatcher) else ProductMatcher(products_list)
+    return matcher.match(spoken_name)
+
+# Per-tenant matcher cache: account_id -> (catalog version, ProductMatcher)
+_matchers = {}
+
+def get_product_matcher(version=None):
     """
-    Parses a voice command string.
-    Expected patterns:
-    - "Add 50 Maggi"
-    - "Set stock of Coke to 20"
-    - "Sold 5 Lays"
-    
-    Returns dict: {'action': 'ADD'|'SET'|'REMOVE'|'UNKNOWN', 'qty': int, 'product_id': int, 'product_name': str, 'original_text': str}
+    Cached matcher for the current tenant's catalog.
+    The catalog is only read when the tenant has no cached matcher or `version` (the
+    caller's catalog version counter) differs from the cached one, so repeated
+    utterances cost a dict lookup. Catalog writers without a version counter call
+    invalidate_product_matcher instead.
+    """
+    import database as db
+    aid = db.get_current_account_id()
+    cached = _matchers.get(aid)
+    if cached and (version is None or cached[0] == version):
+        return cached[1]
+    products_df = db.fetch_all_products()
+    if products_df.empty:
+        _matchers.pop(aid, None)
+        return None
+    matcher = ProductMatcher(products_df[['id', 'name']].to_dict('records'))
+    _matchers[aid] = (version, matcher)
+    return matcher
+
+def invalidate_product_matcher(account_id=None):
+    if account_id is None:
+        _matchers.clear()
+    else:
+        _matchers.pop(account_id, None)
+
+# Precompiled once: intent patterns keep the original substring semantics
+# ("added" still reads as ADD), checked in priority order ADD > SET > REMOVE.
+_NUMBER_RE = re.compile(r'\d+')
+_INTENT_PATTERNS = (
+    ('ADD', re.compile('add|plus|restock|buy|bought|in')),
+    ('SET', re.compile('set|update|count|change|is|equals|make')),
+    ('REMOVE', re.compile('remove|sell|sold|sale|minus|deduct|out')),
+)
+# Action keywords stripped from the product phrase (naive)
+_COMMAND_WORDS = frozenset(['add', 'plus', 'restock', 'buy', 'bought', 'set', 'update', 'count', 'change', 'make', 'remove', 'sell', 'sold', 'sale', 'minus', 'deduct', 'stock', 'of', 'to', 'units', 'pieces', 'boxes', 'packets'])
+
+def parse_command_text(text):
+    """
+    Extracts action, quantity and the spoken product phrase without touching the catalog.
+    Returns (result dict as parse_voice_command, product_query or None if parsing failed).
     """
     text = text.strip()
     result = {
@@ -48,73 +130,77 @@ def parse_voice_command(text):
     
     if not text:
         result['status_msg'] = "Empty command."
-        return result
+        return result, None
 
     # 1. Extract Quantity (Find first number)
-    # Using regex to find digits
-    numbers = re.findall(r'\d+', text)
-    if numbers:
-        result['qty'] = int(numbers[0])
+    number = _NUMBER_RE.search(text)
+    if number:
+        result['qty'] = int(number.group())
     else:
         # Fallback: simple text-to-number mapping could go here (one, two, ten)
         # For MVP, assume voice typing creates digits (which modern OS usually does: "five" -> "5")
         result['status_msg'] = "Could not find a quantity number."
-        return result
+        return result, None
 
     # 2. Identify Intent
     lower_text = text.lower()
-    if any(x in lower_text for x in ['add', 'plus', 'restock', 'buy', 'bought', 'in']):
-        result['action'] = 'ADD'
-    elif any(x in lower_text for x in ['set', 'update', 'count', 'change', 'is', 'equals', 'make']):
-        result['action'] = 'SET'
-    elif any(x in lower_text for x in ['remove', 'sell', 'sold', 'sale', 'minus', 'deduct', 'out']):
-        result['action'] = 'REMOVE'
-    else:
-        pass
+    for action, pattern in _INTENT_PATTERNS:
+        if pattern.search(lower_text):
+            result['action'] = action
+            break
 
     if result['action'] == 'UNKNOWN':
         result['status_msg'] = "Could not understand action (Add/Set/Sold)."
-        return result
+        return result, None
 
     # 3. Extract Product Name
-    clean_text = lower_text
-    # Remove digits
-    clean_text = re.sub(r'\d+', '', clean_text)
-    
-    # Remove action keywords (naive)
-    keywords = ['add', 'plus', 'restock', 'buy', 'bought', 'set', 'update', 'count', 'change', 'make', 'remove', 'sell', 'sold', 'sale', 'minus', 'deduct', 'stock', 'of', 'to', 'units', 'pieces', 'boxes', 'packets']
-    
-    words = clean_text.split()
-    product_query_words = [w for w in words if w not in keywords]
-    product_query = " ".join(product_query_words)
+    words = _NUMBER_RE.sub('', lower_text).split()
+    product_query = " ".join(w for w in words if w not in _COMMAND_WORDS)
     
     if len(product_query) < 2:
          result['status_msg'] = "Could not identify product name."
-         return result
-         
-    # 4. Fuzzy Match Product
-    all_products_df = db.fetch_all_products()
-    if all_products_df.empty:
-        result['status_msg'] = "Database is empty."
-        return result
-        
-    products_list = all_products_df.to_dict('records')
-    matched_product, conf = find_closest_product(product_query, products_list)
-    
-    if matched_product and conf > 0.4:
+         return result, None
+    return result, product_query
+
+def apply_match(result, product_query, matched_product, conf):
+    """Fills the product fields of a parsed result from a matcher hit."""
+    if matched_product and conf > MATCH_CUTOFF:
         result['product_id'] = matched_product['id']
         result['product_name'] = matched_product['name']
         result['confidence'] = conf
         result['status_msg'] = "Success"
     else:
         result['status_msg'] = f"Product '{product_query}' not found."
-        
     return result
 
+def parse_voice_command(text, catalog_version=None):
+    """
+    Parses a voice command string. `catalog_version` is passed to get_product_matcher.
+    Expected patterns:
+    - "Add 50 Maggi"
+    - "Set stock of Coke to 20"
+    - "Sold 5 Lays"
+    
+    Returns dict: {'action': 'ADD'|'SET'|'REMOVE'|'UNKNOWN', 'qty': int, 'product_id': int, 'product_name': str, 'original_text': str}
+    """
+    result, product_query = parse_command_text(text)
+    if product_query is None:
+        return result
+         
+    # 4. Fuzzy Match Product
+    matcher = get_product_matcher(catalog_version)
+    if matcher is None:
+        result['status_msg'] = "Database is empty."
+        return result
+        
+    matched_product, conf = matcher.match(product_query)
+    return apply_match(result, product_query, matched_product, conf)
+
 def execute_parsed_command(parsed_result):
     """
     Executes the command against the DB.
     """
+    import database as db
     if parsed_result['status_msg'] != "Success":
         return False, parsed_result['status_msg']
         
@@ -1,4 +1,10 @@
 import json
+import math
+import random
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 
 # The "Brain" of ShelfSense
 # Contains molecular rules and psychological associations.
@@ -53,35 +59,173 @@ PRODUCT_SCIENCE_DB = {
     'Milk': ['breakfast_complement']
 }
 
-def get_tags(product_name):
-    # Fuzzy match or direct lookup. 
-    # For prototype, we check if key is IN the product name
-    tags = []
-    for key, val in PRODUCT_SCIENCE_DB.items():
-        if key.lower() in product_name.lower():
-            tags.extend(val)
-    return list(set(tags))
+class TagMatcher:
+    """
+    Compiled multi-pattern matcher (Aho-Corasick) over the science-tag keys.
+    A product name is scanned once, whatever the dictionary size, and results
+    are memoized per distinct name.
+    """
+
+    def __init__(self, science_db, cache_size=4096):
+        self.goto = [{}]   # state -> {char: state}
+        self.fail = [0]
+        self.out = [()]    # state -> tags emitted when the state is reached
+        for key, tags in science_db.items():
+            self._insert(key.lower(), tags)
+        self._link()
+        self.tags_for = lru_cache(maxsize=cache_size)(self._match)
+
+    def _insert(self, word, tags):
+        state = 0
+        for ch in word:
+            nxt = self.goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[state][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append(())
+            state = nxt
+        self.out[state] = self.out[state] + tuple(tags)
+
+    def _link(self):
+        # BFS: a state's failure link is the longest proper suffix that is also a trie path
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0) if state else 0
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
 
-def analyze_grid(grid):
+    def _match(self, product_name):
+        found = set()
+        state = 0
+        for ch in product_name.lower():
+            while state and ch not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(ch, 0)
+            found.update(self.out[state])
+        return frozenset(found)
+
+
+class RuleIndex:
+    """
+    KNOWLEDGE_BASE compiled into an interned index: every tag gets a bit, and each
+    rule tag holds a bitmask of the neighbour tags it conflicts with or boosts.
+    A product's tags become one int mask, so checking a pair is a few ANDs.
+    Conflict rules are `hard`: the optimizer treats them as constraints.
+    Effects for a pair of product names are memoized, so a planogram costs one
+    dict lookup per adjacency once its distinct pairs have been seen.
+    """
+
+    def __init__(self, knowledge_base, cache_size=16384):
+        self.tag_ids = {}
+        self.rules = [] # (rule tag bit, conflict mask, boost mask, score, msg)
+        for tag, rule in knowledge_base.items():
+            conflicts = self.mask_of(rule.get('conflicts_with', []))
+            boosts = self.mask_of(rule.get('boosts', []))
+            self.rules.append((self.mask_of([tag]), conflicts, boosts, rule['score'], rule['msg']))
+        self.pair_effects = lru_cache(maxsize=cache_size)(self._pair_effects)
+
+    def mask_of(self, tags):
+        mask = 0
+        for tag in tags:
+            bit = self.tag_ids.get(tag)
+            if bit is None:
+                bit = self.tag_ids[tag] = len(self.tag_ids)
+            mask |= 1 << bit
+        return mask
+
+    def _known_mask(self, tags):
+        return sum(1 << self.tag_ids[t] for t in tags if t in self.tag_ids)
+
+    def _directed(self, mask_a, mask_b, name_a, name_b):
+        hits = []
+        for bit, conflicts, boosts, score, msg in self.rules:
+            if not mask_a & bit:
+                continue
+            for target, hard in ((conflicts, True), (boosts, False)):
+                # One hit per matched neighbour tag, as each tag is a separate risk/benefit
+                for _ in range(bin(target & mask_b).count("1")):
+                    hits.append((score, f"{msg} ({name_a} ↔ {name_b})", hard))
+        return hits
+
+    def _pair_effects(self, name_a, name_b, tags_a, tags_b):
+        """Returns (score_delta, logs, has_conflict) for two adjacent products, checking rules both ways."""
+        mask_a, mask_b = self._known_mask(tags_a), self._known_mask(tags_b)
+        hits = self._directed(mask_a, mask_b, name_a, name_b)
+        if name_a != name_b:
+            hits += self._directed(mask_b, mask_a, name_b, name_a)
+        return sum(h[0] for h in hits), tuple(h[1] for h in hits), any(h[2] for h in hits)
+
+
+class CatalogTagMatcher:
+    """
+    Tags taken from the product catalog (Product.science_tags) by exact name, falling
+    back to keyword matching against PRODUCT_SCIENCE_DB for untagged products.
+    """
+
+    def __init__(self, tags_by_name, fallback=None):
+        self.tags_by_name = {name: frozenset(tags) for name, tags in tags_by_name.items()}
+        self.fallback = fallback or _matcher
+
+    def tags_for(self, product_name):
+        tags = self.tags_by_name.get(product_name)
+        return tags if tags is not None else self.fallback.tags_for(product_name)
+
+
+def parse_science_tags(value):
+    """Parses a science_tags column value: "['a', 'b']", '["a"]' or "a, b"."""
+    if not value:
+        return []
+    cleaned = value.strip().strip("[]")
+    return [t.strip().strip("'\"") for t in cleaned.split(",") if t.strip().strip("'\"")]
+
+
+_matcher = TagMatcher(PRODUCT_SCIENCE_DB)
+_rules = RuleIndex(KNOWLEDGE_BASE)
+
+# Compiled per-catalog engines, keyed by the caller's version token (e.g. tenant + tag version)
+_engines = {}
+MAX_ENGINES = 64
+
+def get_engine(catalog=None):
+    """
+    Returns (matcher, rules). `catalog` is None for the built-in constants, or a tuple
+    (version, tags_by_name, knowledge_base) that is compiled once per version.
+    """
+    if catalog is None:
+        return _matcher, _rules
+    version, tags_by_name, knowledge_base = catalog
+    engine = _engines.get(version)
+    if engine is None:
+        engine = (CatalogTagMatcher(tags_by_name), RuleIndex(knowledge_base))
+        if len(_engines) >= MAX_ENGINES:
+            _engines.pop(next(iter(_engines)))
+        _engines[version] = engine
+    return engine
+
+def get_tags(product_name, matcher=None):
+    # Every key contained in the product name (case-insensitive) contributes its tags.
+    return list((matcher or _matcher).tags_for(product_name))
+
+def analyze_grid(grid, matcher=None, rules=None):
     """
     Analyzes a 2D grid (list of lists) of product names.
     Returns: score (0-100), logs (list of strings with HTML formatting)
+    Each distinct pair of adjacent products is scored once, with rules checked in both directions.
     """
+    matcher = matcher or _matcher
+    rules = rules or _rules
     rows = len(grid)
-    cols = len(grid[0])
+    cols = len(grid[0]) if rows else 0
     
     score = 100 # Start perfect
     logs = []
-    
-    # Helper to get neighbors
-    def get_neighbors(r, c):
-        n = []
-        if r > 0: n.append(grid[r-1][c]) # Up
-        if r < rows - 1: n.append(grid[r+1][c]) # Down
-        if c > 0: n.append(grid[r][c-1]) # Left
-        if c < cols - 1: n.append(grid[r][c+1]) # Right
-        return [x for x in n if x] # Filter empty
-        
     processed_pairs = set()
 
     for r in range(rows):
@@ -89,37 +233,197 @@ def analyze_grid(grid):
             current_item = grid[r][c]
             if not current_item: continue
             
-            my_tags = get_tags(current_item)
-            neighbors = get_neighbors(r, c)
-            
-            for neighbor in neighbors:
-                # Avoid checking A-B and B-A twice
-                pair_key = tuple(sorted([current_item, neighbor]))
+            # Right and down neighbours cover every adjacency exactly once
+            for nr, nc in ((r, c + 1), (r + 1, c)):
+                if nr >= rows or nc >= cols: continue
+                neighbor = grid[nr][nc]
+                if not neighbor: continue
+                
+                pair_key = (current_item, neighbor) if current_item <= neighbor else (neighbor, current_item)
                 if pair_key in processed_pairs:
                     continue
                 processed_pairs.add(pair_key)
                 
-                neighbor_tags = get_tags(neighbor)
-                
-                # Check Rules
-                for tag in my_tags:
-                    rules = KNOWLEDGE_BASE.get(tag)
-                    if not rules: continue
-                    
-                    # 1. Check Conflicts
-                    if 'conflicts_with' in rules:
-                        for bad_tag in rules['conflicts_with']:
-                            if bad_tag in neighbor_tags:
-                                score += rules['score'] # Negative
-                                logs.append(f"{rules['msg']} ({current_item} ↔ {neighbor})")
-                                
-                    # 2. Check Boosts
-                    if 'boosts' in rules:
-                        for good_tag in rules['boosts']:
-                            if good_tag in neighbor_tags:
-                                score += rules['score'] # Positive
-                                logs.append(f"{rules['msg']} ({current_item} ↔ {neighbor})")
+                delta, pair_logs, _ = rules.pair_effects(
+                    pair_key[0], pair_key[1],
+                    matcher.tags_for(pair_key[0]), matcher.tags_for(pair_key[1])
+                )
+                score += delta
+                logs.extend(pair_logs)
 
     # Clamp score
     score = max(0, min(100, score))
     return score, logs
+
+
+def find_conflicts(grid, matcher=None, rules=None):
+    """
+    Every adjacency that breaks a conflict rule, by position:
+    [((r1, c1), (r2, c2), name1, name2), ...]
+    """
+    matcher = matcher or _matcher
+    rules = rules or _rules
+    rows = len(grid)
+    cols = len(grid[0]) if rows else 0
+    found = []
+    for r in range(rows):
+        for c in range(cols):
+            a = grid[r][c]
+            if not a: continue
+            for nr, nc in ((r, c + 1), (r + 1, c)):
+                if nr >= rows or nc >= cols: continue
+                b = grid[nr][nc]
+                if not b: continue
+                x, y = (a, b) if a <= b else (b, a)
+                if rules.pair_effects(x, y, matcher.tags_for(x), matcher.tags_for(y))[2]:
+                    found.append(((r, c), (nr, nc), a, b))
+    return found
+
+def score_grid(grid, catalog=None):
+    """analyze_grid plus positional conflicts, as a plain dict (process-pool friendly)."""
+    matcher, rules = get_engine(catalog)
+    score, logs = analyze_grid(grid, matcher, rules)
+    return {'score': score, 'logs': logs, 'conflicts': find_conflicts(grid, matcher, rules)}
+
+def score_grids(grids, catalog=None):
+    return [score_grid(g, catalog) for g in grids]
+
+
+# --- Planogram Optimizer ---
+# Simulated annealing over cell swaps. The objective is the sum of pair scores over
+# every adjacency, with conflict rules (e.g. ethylene) as hard constraints carried
+# as a large penalty. A swap only changes the <= 8 adjacencies around the two cells,
+# so each move is scored in O(1) from a precomputed product x product weight table.
+
+HARD_PENALTY = 1000
+
+def _weight_table(names, matcher, rules):
+    """names[0] is the empty slot. Returns (symmetric weight table indexed by name id, conflicting id pairs)."""
+    n = len(names)
+    table = [[0] * n for _ in range(n)]
+    hard = set()
+    for i in range(1, n):
+        for j in range(i, n):
+            a, b = (names[i], names[j]) if names[i] <= names[j] else (names[j], names[i])
+            delta, _, conflict = rules.pair_effects(a, b, matcher.tags_for(a), matcher.tags_for(b))
+            if conflict:
+                delta -= HARD_PENALTY
+                hard.update(((i, j), (j, i)))
+            table[i][j] = table[j][i] = delta
+    return table, hard
+
+def _grid_neighbors(rows, cols):
+    nbrs = []
+    for r in range(rows):
+        for c in range(cols):
+            cell = []
+            if r > 0: cell.append((r - 1) * cols + c)
+            if r < rows - 1: cell.append((r + 1) * cols + c)
+            if c > 0: cell.append(r * cols + c - 1)
+            if c < cols - 1: cell.append(r * cols + c + 1)
+            nbrs.append(cell)
+    return nbrs
+
+def _objective(layout, nbrs, table):
+    return sum(table[layout[p]][layout[q]] for p in range(len(layout)) for q in nbrs[p] if q > p)
+
+def _anneal(args):
+    """One annealing run. Top-level so it can be shipped to worker processes."""
+    layout, rows, cols, table, time_budget, seed, shuffle = args
+    rng = random.Random(seed)
+    layout = list(layout)
+    if shuffle:
+        rng.shuffle(layout)
+    nbrs = _grid_neighbors(rows, cols)
+    size = len(layout)
+
+    current = _objective(layout, nbrs, table)
+    best, best_layout = current, list(layout)
+    t_start, t_end = 50.0, 0.5
+    deadline = time.perf_counter() + time_budget
+    started = time.perf_counter()
+    temp = t_start
+    iterations = 0
+
+    while True:
+        if iterations % 512 == 0:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            progress = (now - started) / time_budget
+            temp = t_start * (t_end / t_start) ** progress
+
+        iterations += 1
+        p = rng.randrange(size)
+        q = rng.randrange(size)
+        a, b = layout[p], layout[q]
+        if a == b:
+            continue
+
+        # O(1) delta: only adjacencies touching p or q change (the p-q edge itself is symmetric)
+        row_a, row_b = table[a], table[b]
+        delta = 0
+        for n in nbrs[p]:
+            if n != q:
+                m = layout[n]
+                delta += row_b[m] - row_a[m]
+        for n in nbrs[q]:
+            if n != p:
+                m = layout[n]
+                delta += row_a[m] - row_b[m]
+
+        if delta >= 0 or rng.random() < math.exp(delta / temp):
+            layout[p], layout[q] = b, a
+            current += delta
+            if current > best:
+                best, best_layout = current, list(layout)
+
+    return best, best_layout, iterations
+
+def optimize_layout(products, rows, cols, time_budget=2.0, restarts=1, workers=None, seed=0,
+                    matcher=None, rules=None):
+    """
+    Searches shelf arrangements of `products` (list of names, repeats allowed for extra
+    facings) on a rows x cols bay. Unused slots are left empty (None).
+    `restarts` independent runs share the time budget; with `workers` > 1 they run in a
+    process pool, in ceil(restarts / workers) waves that split the budget between them.
+    The first run starts from the given order, so the result is never worse than it.
+    Returns dict: grid, score, logs (as analyze_grid), objective,
+    conflicts (hard constraint violations left, 0 when feasible), iterations.
+    """
+    matcher = matcher or _matcher
+    rules = rules or _rules
+    if len(products) > rows * cols:
+        raise ValueError(f"{len(products)} products do not fit a {rows}x{cols} bay")
+
+    names = [None] + sorted(set(products))
+    ids = {name: i for i, name in enumerate(names)}
+    layout = [ids[p] for p in products] + [0] * (rows * cols - len(products))
+    table, hard = _weight_table(names, matcher, rules)
+
+    restarts = max(1, restarts)
+    parallel = min(workers or 1, restarts)
+    waves = math.ceil(restarts / parallel)
+    jobs = [(layout, rows, cols, table, time_budget / waves, seed + i, i > 0) for i in range(restarts)]
+    if parallel > 1:
+        with ProcessPoolExecutor(max_workers=parallel) as pool:
+            runs = list(pool.map(_anneal, jobs))
+    else:
+        runs = [_anneal(job) for job in jobs]
+
+    best, best_layout, _ = max(runs, key=lambda run: run[0])
+    grid = [[names[best_layout[r * cols + c]] for c in range(cols)] for r in range(rows)]
+    nbrs = _grid_neighbors(rows, cols)
+    conflicts = sum(
+        1 for p in range(len(best_layout)) for q in nbrs[p]
+        if q > p and (best_layout[p], best_layout[q]) in hard
+    )
+    score, logs = analyze_grid(grid, matcher, rules)
+    return {
+        'grid': grid,
+        'score': score,
+        'logs': logs,
+        'objective': best + conflicts * HARD_PENALTY,
+        'conflicts': conflicts,
+        'iterations': sum(run[2] for run in runs),
+    }